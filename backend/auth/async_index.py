@@ -0,0 +1,203 @@
+"""
+Асинхронный вариант API аутентификации на asyncpg с тем же контрактом handler(event, context)
+
+Вход, выход и /me выполняются корутинами (bcrypt — в пуле потоков хешера);
+регистрация и 2FA обслуживаются синхронным index.handler.
+
+Локальный долгоживущий сервер:
+    python async_index.py --port 8002
+"""
+import asyncio
+import datetime
+import time
+from typing import Optional
+import index
+from async_runtime import AsyncRouter, get_async_pool, serve_main, verify_signed_token_async
+from db_pool import get_pool
+from passwords import get_password_hasher, PasswordServiceBusy
+from rate_limit import RATE_LIMIT_ENABLED, get_login_rate_limiter
+from routing import Request, HttpError, json_response, error_response
+from session_cache import get_session_cache
+from session_reaper import maybe_reap_in_background
+from signed_tokens import get_token_signer, is_signed_token, signed_mode_enabled
+
+SESSION_SQL = """
+    SELECT u.id, u.email, u.full_name, u.two_factor_enabled, u.created_at,
+           EXTRACT(EPOCH FROM (s.expires_at - NOW()))::float8 AS expires_in
+    FROM users u
+    JOIN user_sessions s ON u.id = s.user_id
+    WHERE s.session_token = $1 AND s.expires_at > NOW()
+"""
+
+router = AsyncRouter(index.handler, errors={PasswordServiceBusy: (503, {'Retry-After': '1'})})
+
+def handler(event: dict, context) -> dict:
+    """
+    Асинхронная точка входа API аутентификации
+
+    Эндпоинты те же, что у index.handler; корутинами обслуживаются:
+    - POST /login
+    - POST /logout
+    - GET /me
+    """
+    return router.handler(event, context)
+
+async def run_blocking(fn, *args):
+    """Блокирующий вызов (bcrypt, хранилище ограничителя попыток) в пуле потоков, не останавливая цикл"""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+async def get_user_from_session(session_token: str, pool) -> Optional[dict]:
+    """Получение пользователя по токену сессии через кеш сессий"""
+    cache = get_session_cache()
+    if is_signed_token(session_token):
+        claims = await verify_signed_token_async(session_token, pool)
+        if not claims:
+            return None
+        user = cache.get(session_token)
+        if user:
+            return user
+        row = await pool.fetchrow(
+            "SELECT id, email, full_name, two_factor_enabled, created_at FROM users WHERE id = $1",
+            claims['uid']
+        )
+        if row is None:
+            return None
+        user = dict(row)
+        cache.set(session_token, user, claims['exp'] - time.time())
+        return user
+
+    user = cache.get(session_token)
+    if user:
+        return user
+    row = await pool.fetchrow(SESSION_SQL, session_token)
+    if row is None:
+        return None
+    user = dict(row)
+    expires_in = user.pop('expires_in')
+    cache.set(session_token, user, expires_in)
+    return user
+
+async def insert_session(conn, user_id: int, ttl: datetime.timedelta) -> str:
+    """Строка в user_sessions с новым случайным токеном"""
+    session_token = index.generate_session_token()
+    await conn.execute(
+        "INSERT INTO user_sessions (user_id, session_token, expires_at) VALUES ($1, $2, $3)",
+        user_id, session_token, datetime.datetime.now() + ttl
+    )
+    return session_token
+
+async def create_session(conn, user: dict) -> str:
+    """Новая сессия: подписанный токен без записи в базу или строка в user_sessions"""
+    if signed_mode_enabled():
+        return get_token_signer().issue(user, int(index.SESSION_TTL.total_seconds()))
+    return await insert_session(conn, user['id'], index.SESSION_TTL)
+
+@router.route('POST', 'login')
+async def handle_login(request: Request) -> dict:
+    """Вход пользователя с ограничением попыток"""
+    if not RATE_LIMIT_ENABLED:
+        return await login(request)
+    limiter = get_login_rate_limiter()
+    key = limiter.login_key(request)
+    rejection = await run_blocking(limiter.admit, request, limiter.by_email, key)
+    if rejection is not None:
+        return rejection
+    response = None
+    try:
+        response = await login(request)
+        return response
+    finally:
+        await run_blocking(limiter.settle, response, limiter.by_email, key)
+
+async def login(request: Request) -> dict:
+    """Вход пользователя"""
+    data = request.json_body()
+
+    email = data.get('email')
+    password = data.get('password')
+
+    if not email or not password:
+        return error_response(400, 'Email and password are required')
+
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            "SELECT id, email, password_hash, full_name, two_factor_enabled, two_factor_secret FROM users WHERE email = $1",
+            email
+        )
+        if row is None or not await run_blocking(index.verify_password, password, row['password_hash']):
+            return error_response(401, 'Invalid credentials')
+        user = dict(row)
+
+        hasher = get_password_hasher()
+        if hasher.needs_rehash(user['password_hash']):
+            await conn.execute(
+                "UPDATE users SET password_hash = $1, updated_at = NOW() WHERE id = $2",
+                await run_blocking(hasher.hash, password), user['id']
+            )
+
+        if user['two_factor_enabled']:
+            temp_token = await insert_session(conn, user['id'], datetime.timedelta(minutes=5))
+            index.remember_pending_2fa(temp_token, user)
+            maybe_reap_in_background(get_pool())
+            return json_response(200, {
+                'requires_2fa': True,
+                'temp_token': temp_token,
+                'message': 'Please provide 2FA code'
+            })
+
+        session_token = await create_session(conn, user)
+        maybe_reap_in_background(get_pool())
+
+    return json_response(200, {
+        'session_token': session_token,
+        'user': {
+            'id': user['id'],
+            'email': user['email'],
+            'full_name': user['full_name']
+        }
+    })
+
+@router.route('POST', 'logout')
+async def handle_logout(request: Request) -> dict:
+    """Выход пользователя"""
+    session_token = request.header('X-Session-Token')
+
+    if not session_token:
+        return error_response(400, 'Session token required')
+
+    pool = await get_async_pool()
+    if is_signed_token(session_token):
+        signer = get_token_signer()
+        claims = signer.verify(session_token) if signer else None
+        if claims:
+            await pool.execute(
+                """
+                INSERT INTO revoked_session_tokens (jti, expires_at)
+                VALUES ($1, to_timestamp($2))
+                ON CONFLICT (jti) DO NOTHING
+                """,
+                claims['jti'], float(claims['exp'])
+            )
+            signer.revocations.add(claims['jti'], claims['exp'])
+    else:
+        await pool.execute("DELETE FROM user_sessions WHERE session_token = $1", session_token)
+    get_session_cache().invalidate(session_token)
+
+    return json_response(200, {'message': 'Logged out successfully'})
+
+@router.route('GET', 'me')
+async def handle_get_user(request: Request) -> dict:
+    """Получение данных текущего пользователя"""
+    session_token = request.header('X-Session-Token')
+    if not session_token:
+        raise HttpError(401, 'Session token required')
+    user = await get_user_from_session(session_token, await get_async_pool())
+
+    if not user:
+        return error_response(401, 'Invalid session')
+
+    return json_response(200, {'user': user})
+
+if __name__ == '__main__':
+    serve_main(router, __doc__)
@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import base64
+import os
+import threading
+import time
+from http import HTTPStatus
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlsplit
+import asyncpg
+from routing import preflight_response, Request, Router, exception_response
+from signed_tokens import LIVE_REVOCATIONS_SQL, get_token_signer
+
+ASYNC_POOL_MIN_SIZE = int(os.environ.get('ASYNC_DB_POOL_MIN_SIZE', '1'))
+ASYNC_POOL_MAX_SIZE = int(os.environ.get('ASYNC_DB_POOL_MAX_SIZE', '10'))
+MAX_REQUEST_BODY = 10 * 1024 * 1024
+
+_loop = None
+_loop_lock = threading.Lock()
+_pool = None
+_pool_lock = None
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Событийный цикл в фоновом потоке, переживающий тёплые вызовы контейнера"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='async-handler', daemon=True).start()
+                _loop = loop
+    return _loop
+
+def run(coro):
+    """Выполнение корутины в общем цикле из синхронного кода"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+async def get_async_pool() -> asyncpg.Pool:
+    """Пул asyncpg уровня модуля, создаётся при первом обращении"""
+    global _pool, _pool_lock
+    if _pool is None:
+        if _pool_lock is None:
+            # Блокировка создаётся в работающем цикле, а не при импорте модуля
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(os.environ.get('DATABASE_URL'),
+                                                  min_size=ASYNC_POOL_MIN_SIZE, max_size=ASYNC_POOL_MAX_SIZE)
+    return _pool
+
+async def verify_signed_token_async(token: str, pool: asyncpg.Pool) -> Optional[dict]:
+    """Проверка подписанного токена; список отзывов перечитывается через asyncpg"""
+    signer = get_token_signer()
+    if signer is None:
+        return None
+    if signer.revocations.is_stale():
+        signer.revocations.load(await pool.fetch(LIVE_REVOCATIONS_SQL))
+    return signer.verify(token)
+
+class AsyncRouter(Router):
+    """
+    Таблица маршрутов-корутин поверх Router
+
+    Маршруты, которых нет в таблице, передаются синхронному обработчику fallback
+    в пуле потоков, поэтому контракт handler(event, context) сохраняется целиком.
+    Исключения превращаются в ответы по тем же правилам, что и в map_errors.
+    """
+
+    def __init__(self, fallback: Callable[[dict, object], dict], errors: Optional[Dict[type, object]] = None):
+        super().__init__()
+        self.fallback = fallback
+        self.errors = errors or {}
+
+    async def call_fallback(self, event: dict, context) -> dict:
+        """Обработка вызова синхронным обработчиком в пуле потоков"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.fallback, event, context)
+
+    async def dispatch_async(self, event: dict, context) -> dict:
+        """Обработка вызова функции внутри цикла"""
+        method = event.get('httpMethod', 'GET')
+        if method == 'OPTIONS':
+            return preflight_response()
+        params = event.get('queryStringParameters')
+        action = params.get('action', '') if params else ''
+
+        entry, path_params = self._match(method, action)
+        if entry is None:
+            return await self.call_fallback(event, context)
+
+        name, chain = entry
+        request = Request(event, context, method, action)
+        request.path_params = path_params
+        request.route = name
+        started = time.perf_counter()
+        try:
+            return await chain(request)
+        except Exception as e:
+            return exception_response(e, self.errors)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._histograms[name].observe(elapsed_ms)
+
+    def handler(self, event: dict, context) -> dict:
+        """Синхронная точка входа функции"""
+        return run(self.dispatch_async(event, context))
+
+async def _read_event(reader: asyncio.StreamReader) -> Optional[tuple]:
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+        if not line:
+            break
+        key, _, value = line.partition(':')
+        headers[key.strip()] = value.strip()
+    length = int(headers.get('Content-Length') or headers.get('content-length') or 0)
+    if length > MAX_REQUEST_BODY:
+        raise ValueError('Request body too large')
+    body = (await reader.readexactly(length)).decode('utf-8') if length else None
+    url = urlsplit(target)
+    event = {
+        'httpMethod': method,
+        'path': url.path,
+        'queryStringParameters': dict(parse_qsl(url.query)),
+        'headers': headers,
+        'body': body,
+        'isBase64Encoded': False
+    }
+    keep_alive = headers.get('Connection', headers.get('connection', '')).lower() != 'close'
+    return event, keep_alive
+
+def _encode_response(response: dict, keep_alive: bool) -> bytes:
+    body = response.get('body') or ''
+    payload = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode('utf-8')
+    status = response['statusCode']
+    lines = [f'HTTP/1.1 {status} {HTTPStatus(status).phrase}']
+    lines.extend(f'{key}: {value}' for key, value in (response.get('headers') or {}).items())
+    lines.append(f'Content-Length: {len(payload)}')
+    lines.append('Connection: ' + ('keep-alive' if keep_alive else 'close'))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload
+
+async def serve(router: AsyncRouter, host: str, port: int):
+    """Долгоживущий локальный HTTP-сервер: один процесс обслуживает много запросов одновременно"""
+    async def on_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                parsed = await _read_event(reader)
+                if parsed is None:
+                    break
+                event, keep_alive = parsed
+                response = await router.dispatch_async(event, None)
+                writer.write(_encode_response(response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(on_client, host, port)
+    async with server:
+        await server.serve_forever()
+
+def serve_main(router: AsyncRouter, description: str):
+    """Запуск локального сервера из командной строки"""
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    asyncio.run(serve(router, args.host, args.port))
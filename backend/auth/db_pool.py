@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from tracing import cursor_factory, phase
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '5'))
+POOL_HEALTH_CHECK_AFTER = float(os.environ.get('DB_POOL_HEALTH_CHECK_AFTER', '0'))
+POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', '600'))
+
+class PoolExhausted(Exception):
+    """Все соединения пула заняты дольше таймаута ожидания"""
+
+class ConnectionPool:
+    """
+    Пул соединений с PostgreSQL, переживающий тёплые вызовы контейнера
+
+    Перед повторным использованием соединение проверяется: закрытые отбрасываются,
+    а простоявшие дольше health_check_after секунд пингуются через SELECT 1.
+    По умолчанию пингуется каждое повторно выдаваемое соединение: разорванное
+    сервером между вызовами иначе уронило бы первый запрос обработчика с 500.
+    Пинг идёт в autocommit — один round trip без BEGIN и ROLLBACK.
+    Число соединений на контейнер ограничено max_size.
+    """
+
+    def __init__(self, dsn: str, max_size: int = POOL_MAX_SIZE, acquire_timeout: float = POOL_ACQUIRE_TIMEOUT,
+                 health_check_after: float = POOL_HEALTH_CHECK_AFTER, max_idle: float = POOL_MAX_IDLE,
+                 cursor_factory=None):
+        self.dsn = dsn
+        self.cursor_factory = cursor_factory
+        self.max_size = max(1, max_size)
+        self.acquire_timeout = acquire_timeout
+        self.health_check_after = health_check_after
+        self.max_idle = max_idle
+        self._idle = []
+        self._in_use = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._counters = {'hits': 0, 'misses': 0, 'reconnects': 0, 'discarded': 0, 'waits': 0, 'timeouts': 0}
+
+    def _connect(self):
+        import psycopg2
+        return psycopg2.connect(self.dsn, cursor_factory=self.cursor_factory)
+
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        import psycopg2
+        try:
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+            finally:
+                conn.autocommit = False
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Выдача соединения из пула с проверкой здоровья"""
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while not self._idle and self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolExhausted(f'No free database connections (max_size={self.max_size})')
+                self._counters['waits'] += 1
+                self._cond.wait(remaining)
+            entry = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        try:
+            if entry is not None:
+                conn, released_at = entry
+                idle_for = time.monotonic() - released_at
+                if idle_for < self.max_idle and self._is_healthy(conn, idle_for):
+                    self._count('hits')
+                    return conn
+                self._close_quietly(conn)
+                self._count('reconnects')
+            else:
+                self._count('misses')
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, discard: bool = False):
+        """Возврат соединения в пул; сломанные и грязные соединения закрываются"""
+        if not discard and not conn.closed:
+            import psycopg2
+            import psycopg2.extensions
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                discard = True
+        if discard or conn.closed:
+            self._close_quietly(conn)
+            self._count('discarded')
+            conn = None
+        with self._cond:
+            self._in_use -= 1
+            if conn is not None:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        """Закрытие всех простаивающих соединений"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def _count(self, name: str):
+        with self._cond:
+            self._counters[name] += 1
+
+    def stats(self) -> dict:
+        """Счётчики попаданий, промахов и переподключений"""
+        with self._cond:
+            return dict(self._counters, idle=len(self._idle), in_use=self._in_use, max_size=self.max_size)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Пул уровня модуля, создаётся при первом обращении"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(os.environ.get('DATABASE_URL'), cursor_factory=cursor_factory())
+    return _pool
+
+def is_connection_error(error: Exception) -> bool:
+    """Ошибка, после которой соединение нельзя возвращать в пул"""
+    import psycopg2
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+def connection_middleware(request, call_next) -> dict:
+    """Middleware маршрутов: соединение из пула в request.conn на время вызова"""
+    pool = get_pool()
+    with phase('connect'):
+        request.conn = pool.acquire()
+    discard = False
+    try:
+        return call_next(request)
+    except Exception as e:
+        discard = is_connection_error(e)
+        raise
+    finally:
+        pool.release(request.conn, discard=discard)
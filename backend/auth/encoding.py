@@ -0,0 +1,64 @@
+import datetime
+import json
+from decimal import Decimal
+from typing import Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NUMERIC_OID = 1700
+DATE_OID = 1082
+TIME_OID = 1083
+TIMESTAMP_OID = 1114
+TIMESTAMPTZ_OID = 1184
+STRING_OIDS = {NUMERIC_OID, DATE_OID, TIME_OID, TIMESTAMP_OID, TIMESTAMPTZ_OID}
+
+def _default(value):
+    if isinstance(value, (Decimal, datetime.date, datetime.time)):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj) -> str:
+        """Сериализация ответа через orjson"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode('utf-8')
+else:
+    _encoder = json.JSONEncoder(default=_default)
+
+    def dumps(obj) -> str:
+        """Сериализация ответа стандартным json"""
+        return _encoder.encode(obj)
+
+def _converters(description) -> list:
+    return [str if col.type_code in STRING_OIDS else None for col in description]
+
+def rows_to_dicts(cursor, rows: list) -> list:
+    """
+    Строки обычного курсора в словари с JSON-готовыми значениями
+
+    Имена колонок и преобразования numeric/date/timestamp в строку вычисляются
+    один раз по cursor.description, а не для каждого значения через default.
+    """
+    if not rows:
+        return []
+    description = cursor.description
+    names = [col.name for col in description]
+    converters = _converters(description)
+    if not any(converters):
+        return [dict(zip(names, row)) for row in rows]
+    plan = list(zip(names, converters))
+    return [
+        {name: (conv(value) if conv is not None and value is not None else value)
+         for (name, conv), value in zip(plan, row)}
+        for row in rows
+    ]
+
+def row_to_dict(cursor, row) -> Optional[dict]:
+    """Одна строка курсора в словарь; None остаётся None"""
+    if row is None:
+        return None
+    return rows_to_dicts(cursor, [row])[0]
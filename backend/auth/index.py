@@ -1,39 +1,124 @@
-import json
-import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import bcrypt
-import secrets
+import startup_profile
+from db_pool import connection_middleware, get_pool
+from encoding import row_to_dict
+from routing import preflight_response, Router, Request, HttpError, map_errors, json_response, error_response
+from session_cache import get_session_cache
+from tracing import traced_phase
+from passwords import get_password_hasher, PasswordServiceBusy
+from session_reaper import maybe_reap_in_background
+from rate_limit import get_login_rate_limiter
+from signed_tokens import get_token_signer, is_signed_token, signed_mode_enabled, verify_signed_token
+from totp import get_totp_verifier
 import datetime
-import pyotp
+import time
 from typing import Optional
 
-def get_db_connection():
-    """Подключение к базе данных"""
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn)
-
 def hash_password(password: str) -> str:
-    """Хеширование пароля"""
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+    """Хеширование пароля в пуле bcrypt"""
+    return get_password_hasher().hash(password)
 
 def verify_password(password: str, password_hash: str) -> bool:
-    """Проверка пароля"""
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    """Проверка пароля в пуле bcrypt"""
+    return get_password_hasher().verify(password, password_hash)
 
 def generate_session_token() -> str:
     """Генерация токена сессии"""
+    import secrets
     return secrets.token_urlsafe(64)
 
 def generate_2fa_secret() -> str:
     """Генерация секрета для 2FA"""
+    import pyotp
     return pyotp.random_base32()
 
-def verify_2fa_token(secret: str, token: str) -> bool:
-    """Проверка 2FA токена"""
-    totp = pyotp.TOTP(secret)
-    return totp.verify(token, valid_window=1)
+def verify_2fa_token(user_id: int, secret: str, token: str) -> bool:
+    """Проверка 2FA токена по предвычисленному окну; повторно использованный код отклоняется"""
+    return get_totp_verifier().verify(user_id, secret, token)
+
+def remember_pending_2fa(temp_token: str, user: dict):
+    """Кеширование пользователя и секрета 2FA на время жизни временного токена"""
+    if user.get('two_factor_secret'):
+        get_totp_verifier().remember_pending(
+            temp_token, {'id': user['id'], 'email': user['email'], 'full_name': user['full_name']},
+            user['two_factor_secret']
+        )
+
+SESSION_TTL = datetime.timedelta(days=30)
+
+def create_session(cur, user: dict) -> str:
+    """Новая сессия: подписанный токен без записи в базу или строка в user_sessions"""
+    if signed_mode_enabled():
+        return get_token_signer().issue(user, int(SESSION_TTL.total_seconds()))
+    session_token = generate_session_token()
+    cur.execute(
+        "INSERT INTO user_sessions (user_id, session_token, expires_at) VALUES (%s, %s, %s)",
+        (user['id'], session_token, datetime.datetime.now() + SESSION_TTL)
+    )
+    return session_token
+
+def get_user_from_signed_token(session_token: str, conn) -> Optional[dict]:
+    """Пользователь подписанного токена: проверка без базы, профиль из кеша или по первичному ключу"""
+    claims = verify_signed_token(session_token, conn)
+    if not claims:
+        return None
+    cache = get_session_cache()
+    user = cache.get(session_token)
+    if user:
+        return user
+    
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT id, email, full_name, two_factor_enabled, created_at FROM users WHERE id = %s",
+            (claims['uid'],)
+        )
+        user = row_to_dict(cur, cur.fetchone())
+    
+    if user:
+        cache.set(session_token, user, claims['exp'] - time.time())
+    return user
+
+@traced_phase('session')
+def get_user_from_session(session_token: str, conn) -> Optional[dict]:
+    """Получение пользователя по токену сессии через кеш сессий"""
+    if is_signed_token(session_token):
+        return get_user_from_signed_token(session_token, conn)
+    cache = get_session_cache()
+    user = cache.get(session_token)
+    if user:
+        return user
+    
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT u.id, u.email, u.full_name, u.two_factor_enabled, u.created_at,
+                   EXTRACT(EPOCH FROM (s.expires_at - NOW())) AS expires_in
+            FROM users u
+            JOIN user_sessions s ON u.id = s.user_id
+            WHERE s.session_token = %s AND s.expires_at > NOW()
+            """,
+            (session_token,)
+        )
+        row = row_to_dict(cur, cur.fetchone())
+    
+    if not row:
+        return None
+    user = row
+    expires_in = float(user.pop('expires_in'))
+    cache.set(session_token, user, expires_in)
+    return user
+
+def require_session_token(request: Request) -> str:
+    """Токен сессии из заголовка; 401 если его нет"""
+    session_token = request.header('X-Session-Token')
+    if not session_token:
+        raise HttpError(401, 'Session token required')
+    return session_token
+
+router = Router(middleware=(
+    map_errors({PasswordServiceBusy: (503, {'Retry-After': '1'})}),
+    get_login_rate_limiter().middleware(),
+    connection_middleware,
+))
 
 def handler(event: dict, context) -> dict:
     """
@@ -46,131 +131,82 @@ def handler(event: dict, context) -> dict:
     - POST /enable-2fa - Включение 2FA для пользователя
     - POST /logout - Выход пользователя
     - GET /me - Получение данных текущего пользователя
-    """
-    
-    method = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
     
-    path = event.get('queryStringParameters', {}).get('action', '') if event.get('queryStringParameters') else ''
-    
-    try:
-        conn = get_db_connection()
-        
-        if method == 'POST' and path == 'register':
-            return handle_register(event, conn)
-        elif method == 'POST' and path == 'login':
-            return handle_login(event, conn)
-        elif method == 'POST' and path == 'verify-2fa':
-            return handle_verify_2fa(event, conn)
-        elif method == 'POST' and path == 'enable-2fa':
-            return handle_enable_2fa(event, conn)
-        elif method == 'POST' and path == 'logout':
-            return handle_logout(event, conn)
-        elif method == 'GET' and path == 'me':
-            return handle_get_user(event, conn)
-        else:
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Endpoint not found'}),
-                'isBase64Encoded': False
-            }
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
-    finally:
-        if 'conn' in locals():
-            conn.close()
+    Preflight OPTIONS отвечает до роутера и соединения с базой; bcrypt, pyotp и
+    psycopg2 загружаются только маршрутами, которым они нужны.
+    """
+    if event.get('httpMethod') == 'OPTIONS':
+        response = preflight_response()
+        startup_profile.first_response('OPTIONS', response)
+        return response
+    response = router.dispatch(event, context)
+    if startup_profile.STARTUP_PROFILE:
+        params = event.get('queryStringParameters') or {}
+        startup_profile.first_response(f"{event.get('httpMethod', 'GET')} {params.get('action', '')}", response)
+    return response
 
-def handle_register(event: dict, conn) -> dict:
+@router.route('POST', 'register')
+def handle_register(request: Request) -> dict:
     """Регистрация нового пользователя"""
-    data = json.loads(event.get('body', '{}'))
+    import psycopg2
+    data = request.json_body()
     
     email = data.get('email')
     password = data.get('password')
     full_name = data.get('full_name')
     
     if not email or not password or not full_name:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Email, password and full_name are required'}),
-            'isBase64Encoded': False
-        }
+        return error_response(400, 'Email, password and full_name are required')
     
     password_hash = hash_password(password)
+    conn = request.conn
     
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        with conn.cursor() as cur:
             cur.execute(
                 "INSERT INTO users (email, password_hash, full_name) VALUES (%s, %s, %s) RETURNING id, email, full_name, created_at",
                 (email, password_hash, full_name)
             )
-            user = cur.fetchone()
+            user = row_to_dict(cur, cur.fetchone())
             conn.commit()
             
-            return {
-                'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'message': 'User registered successfully',
-                    'user': dict(user)
-                }, default=str),
-                'isBase64Encoded': False
-            }
+            return json_response(201, {
+                'message': 'User registered successfully',
+                'user': user
+            })
     except psycopg2.IntegrityError:
         conn.rollback()
-        return {
-            'statusCode': 409,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'User with this email already exists'}),
-            'isBase64Encoded': False
-        }
+        return error_response(409, 'User with this email already exists')
 
-def handle_login(event: dict, conn) -> dict:
+@router.route('POST', 'login')
+def handle_login(request: Request) -> dict:
     """Вход пользователя"""
-    data = json.loads(event.get('body', '{}'))
+    data = request.json_body()
     
     email = data.get('email')
     password = data.get('password')
     
     if not email or not password:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Email and password are required'}),
-            'isBase64Encoded': False
-        }
+        return error_response(400, 'Email and password are required')
     
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+    conn = request.conn
+    with conn.cursor() as cur:
         cur.execute(
-            "SELECT id, email, password_hash, full_name, two_factor_enabled FROM users WHERE email = %s",
+            "SELECT id, email, password_hash, full_name, two_factor_enabled, two_factor_secret FROM users WHERE email = %s",
             (email,)
         )
-        user = cur.fetchone()
+        user = row_to_dict(cur, cur.fetchone())
         
         if not user or not verify_password(password, user['password_hash']):
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid credentials'}),
-                'isBase64Encoded': False
-            }
+            return error_response(401, 'Invalid credentials')
+        
+        hasher = get_password_hasher()
+        if hasher.needs_rehash(user['password_hash']):
+            cur.execute(
+                "UPDATE users SET password_hash = %s, updated_at = NOW() WHERE id = %s",
+                (hasher.hash(password), user['id'])
+            )
+            conn.commit()
         
         if user['two_factor_enabled']:
             temp_token = generate_session_token()
@@ -181,140 +217,109 @@ def handle_login(event: dict, conn) -> dict:
                 (user['id'], temp_token, expires_at)
             )
             conn.commit()
+            remember_pending_2fa(temp_token, user)
+            maybe_reap_in_background(get_pool())
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'requires_2fa': True,
-                    'temp_token': temp_token,
-                    'message': 'Please provide 2FA code'
-                }),
-                'isBase64Encoded': False
-            }
-        
-        session_token = generate_session_token()
-        expires_at = datetime.datetime.now() + datetime.timedelta(days=30)
+            return json_response(200, {
+                'requires_2fa': True,
+                'temp_token': temp_token,
+                'message': 'Please provide 2FA code'
+            })
         
-        cur.execute(
-            "INSERT INTO user_sessions (user_id, session_token, expires_at) VALUES (%s, %s, %s)",
-            (user['id'], session_token, expires_at)
-        )
+        session_token = create_session(cur, user)
         conn.commit()
+        maybe_reap_in_background(get_pool())
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'session_token': session_token,
-                'user': {
-                    'id': user['id'],
-                    'email': user['email'],
-                    'full_name': user['full_name']
-                }
-            })
-        }
+        return json_response(200, {
+            'session_token': session_token,
+            'user': {
+                'id': user['id'],
+                'email': user['email'],
+                'full_name': user['full_name']
+            }
+        })
 
-def handle_verify_2fa(event: dict, conn) -> dict:
+@router.route('POST', 'verify-2fa')
+def handle_verify_2fa(request: Request) -> dict:
     """Подтверждение 2FA кода"""
-    data = json.loads(event.get('body', '{}'))
+    data = request.json_body()
     
     temp_token = data.get('temp_token')
     code = data.get('code')
     
     if not temp_token or not code:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Temp token and 2FA code are required'}),
-            'isBase64Encoded': False
-        }
+        return error_response(400, 'Temp token and 2FA code are required')
     
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            """
-            SELECT u.id, u.email, u.full_name, u.two_factor_secret
-            FROM users u
-            JOIN user_sessions s ON u.id = s.user_id
-            WHERE s.session_token = %s AND s.expires_at > NOW()
-            """,
-            (temp_token,)
-        )
-        user = cur.fetchone()
-        
-        if not user:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid or expired temp token'}),
-                'isBase64Encoded': False
-            }
-        
-        if not verify_2fa_token(user['two_factor_secret'], code):
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid 2FA code'}),
-                'isBase64Encoded': False
-            }
-        
-        cur.execute("DELETE FROM user_sessions WHERE session_token = %s", (temp_token,))
+    conn = request.conn
+    verifier = get_totp_verifier()
+    with conn.cursor() as cur:
+        pending = verifier.pending(temp_token)
+        if pending:
+            user, secret = pending
+        else:
+            cur.execute(
+                """
+                SELECT u.id, u.email, u.full_name, u.two_factor_secret
+                FROM users u
+                JOIN user_sessions s ON u.id = s.user_id
+                WHERE s.session_token = %s AND s.expires_at > NOW()
+                """,
+                (temp_token,)
+            )
+            user = row_to_dict(cur, cur.fetchone())
+            
+            if not user:
+                return error_response(401, 'Invalid or expired temp token')
+            secret = user.pop('two_factor_secret')
         
-        session_token = generate_session_token()
-        expires_at = datetime.datetime.now() + datetime.timedelta(days=30)
+        limiter = get_login_rate_limiter()
+        rejection = limiter.two_factor_attempt(user['id'])
+        if rejection is not None:
+            return rejection
+        try:
+            valid = bool(secret) and verify_2fa_token(user['id'], secret, str(code))
+        except Exception:
+            limiter.two_factor_passed(user['id'])
+            raise
+        if not valid:
+            return error_response(401, 'Invalid 2FA code')
+        limiter.two_factor_passed(user['id'])
         
         cur.execute(
-            "INSERT INTO user_sessions (user_id, session_token, expires_at) VALUES (%s, %s, %s)",
-            (user['id'], session_token, expires_at)
+            "DELETE FROM user_sessions WHERE session_token = %s AND expires_at > NOW()",
+            (temp_token,)
         )
+        verifier.forget_pending(temp_token)
+        if cur.rowcount == 0:
+            conn.rollback()
+            return error_response(401, 'Invalid or expired temp token')
+        get_session_cache().invalidate(temp_token)
+        
+        session_token = create_session(cur, user)
         conn.commit()
+        maybe_reap_in_background(get_pool())
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'session_token': session_token,
-                'user': {
-                    'id': user['id'],
-                    'email': user['email'],
-                    'full_name': user['full_name']
-                }
-            }),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {
+            'session_token': session_token,
+            'user': {
+                'id': user['id'],
+                'email': user['email'],
+                'full_name': user['full_name']
+            }
+        })
 
-def handle_enable_2fa(event: dict, conn) -> dict:
+@router.route('POST', 'enable-2fa')
+def handle_enable_2fa(request: Request) -> dict:
     """Включение 2FA для пользователя"""
-    session_token = event.get('headers', {}).get('X-Session-Token')
+    session_token = require_session_token(request)
+    conn = request.conn
+    user = get_user_from_session(session_token, conn)
     
-    if not session_token:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Session token required'}),
-            'isBase64Encoded': False
-        }
+    if not user:
+        return error_response(401, 'Invalid session')
     
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            """
-            SELECT u.id, u.email
-            FROM users u
-            JOIN user_sessions s ON u.id = s.user_id
-            WHERE s.session_token = %s AND s.expires_at > NOW()
-            """,
-            (session_token,)
-        )
-        user = cur.fetchone()
-        
-        if not user:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid session'}),
-                'isBase64Encoded': False
-            }
-        
+    import pyotp
+    with conn.cursor() as cur:
         secret = generate_2fa_secret()
         totp = pyotp.TOTP(secret)
         qr_uri = totp.provisioning_uri(name=user['email'], issuer_name='CryptoMine')
@@ -324,76 +329,47 @@ def handle_enable_2fa(event: dict, conn) -> dict:
             (secret, user['id'])
         )
         conn.commit()
+        get_session_cache().invalidate_user(user['id'])
+        get_totp_verifier().forget_user(user['id'])
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'secret': secret,
-                'qr_uri': qr_uri,
-                'message': '2FA enabled successfully'
-            }),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {
+            'secret': secret,
+            'qr_uri': qr_uri,
+            'message': '2FA enabled successfully'
+        })
 
-def handle_logout(event: dict, conn) -> dict:
+@router.route('POST', 'logout')
+def handle_logout(request: Request) -> dict:
     """Выход пользователя"""
-    session_token = event.get('headers', {}).get('X-Session-Token')
+    session_token = request.header('X-Session-Token')
     
     if not session_token:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Session token required'}),
-            'isBase64Encoded': False
-        }
+        return error_response(400, 'Session token required')
     
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+    conn = request.conn
+    if is_signed_token(session_token):
+        signer = get_token_signer()
+        if signer:
+            signer.revoke(conn, session_token)
+        get_session_cache().invalidate(session_token)
+        return json_response(200, {'message': 'Logged out successfully'})
+    
+    with conn.cursor() as cur:
         cur.execute("DELETE FROM user_sessions WHERE session_token = %s", (session_token,))
         conn.commit()
+        get_session_cache().invalidate(session_token)
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'message': 'Logged out successfully'}),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {'message': 'Logged out successfully'})
 
-def handle_get_user(event: dict, conn) -> dict:
+@router.route('GET', 'me')
+def handle_get_user(request: Request) -> dict:
     """Получение данных текущего пользователя"""
-    session_token = event.get('headers', {}).get('X-Session-Token')
+    session_token = require_session_token(request)
+    user = get_user_from_session(session_token, request.conn)
     
-    if not session_token:
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Session token required'}),
-            'isBase64Encoded': False
-        }
+    if not user:
+        return error_response(401, 'Invalid session')
     
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            """
-            SELECT u.id, u.email, u.full_name, u.two_factor_enabled, u.created_at
-            FROM users u
-            JOIN user_sessions s ON u.id = s.user_id
-            WHERE s.session_token = %s AND s.expires_at > NOW()
-            """,
-            (session_token,)
-        )
-        user = cur.fetchone()
-        
-        if not user:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid session'}),
-                'isBase64Encoded': False
-            }
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'user': dict(user)}, default=str),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+    return json_response(200, {'user': user})
+
+startup_profile.module_loaded()
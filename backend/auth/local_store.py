@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+LOCAL_STORE_PATH = os.environ.get('LOCAL_STORE_PATH', '')
+
+class LocalStore:
+    """
+    Хранилище ключ-значение с TTL на SQLite
+
+    Файл на общем диске хоста позволяет нескольким контейнерам видеть
+    одни и те же записи и инвалидации. Значение может иметь тег для
+    групповой очистки (например, все сессии одного пользователя).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS kv (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    tag TEXT,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+                """
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_kv_tag ON kv(namespace, tag)')
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """Значение по ключу, если запись не истекла"""
+        row = self._conn().execute(
+            'SELECT value FROM kv WHERE namespace = ? AND key = ? AND expires_at > ?',
+            (namespace, key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def exists(self, namespace: str, key: str) -> bool:
+        """Проверка наличия живой записи"""
+        return self.get(namespace, key) is not None
+
+    def set(self, namespace: str, key: str, value: str, ttl: float, tag: Optional[str] = None):
+        """Запись значения с временем жизни ttl секунд"""
+        self._conn().execute(
+            'INSERT OR REPLACE INTO kv (namespace, key, value, tag, expires_at) VALUES (?, ?, ?, ?, ?)',
+            (namespace, key, value, tag, time.time() + ttl)
+        )
+
+    def update(self, namespace: str, key: str, fn: Callable[[Optional[str]], tuple], ttl: float):
+        """
+        Атомарное чтение-изменение-запись одной записи между контейнерами
+
+        fn получает текущее значение (или None) и возвращает пару
+        (новое значение или None для удаления, результат вызова).
+        """
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM kv WHERE namespace = ? AND key = ? AND expires_at > ?',
+                (namespace, key, time.time())
+            ).fetchone()
+            value, result = fn(row[0] if row else None)
+            if value is None:
+                conn.execute('DELETE FROM kv WHERE namespace = ? AND key = ?', (namespace, key))
+            else:
+                conn.execute(
+                    'INSERT OR REPLACE INTO kv (namespace, key, value, tag, expires_at) VALUES (?, ?, ?, NULL, ?)',
+                    (namespace, key, value, time.time() + ttl)
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def delete(self, namespace: str, key: str):
+        """Удаление записи по ключу"""
+        self._conn().execute('DELETE FROM kv WHERE namespace = ? AND key = ?', (namespace, key))
+
+    def delete_tag(self, namespace: str, tag: str):
+        """Удаление всех записей с тегом"""
+        self._conn().execute('DELETE FROM kv WHERE namespace = ? AND tag = ?', (namespace, tag))
+
+    def purge_expired(self) -> int:
+        """Удаление истёкших записей"""
+        return self._conn().execute('DELETE FROM kv WHERE expires_at <= ?', (time.time(),)).rowcount
+
+_store = None
+
+def get_local_store() -> Optional[LocalStore]:
+    """Общее хранилище, если задан LOCAL_STORE_PATH"""
+    global _store
+    if _store is None and LOCAL_STORE_PATH:
+        _store = LocalStore(LOCAL_STORE_PATH)
+    return _store
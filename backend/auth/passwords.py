@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', str(os.cpu_count() or 2)))
+PASSWORD_QUEUE_LIMIT = int(os.environ.get('PASSWORD_QUEUE_LIMIT', str(PASSWORD_WORKERS * 4)))
+PASSWORD_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_QUEUE_TIMEOUT', '2'))
+
+class PasswordServiceBusy(Exception):
+    """Очередь хеширования переполнена"""
+
+class PasswordHasher:
+    """
+    Хеширование и проверка паролей bcrypt в ограниченном пуле потоков
+
+    bcrypt отпускает GIL, поэтому потоки дают реальный параллелизм. Пул
+    ограничивает число одновременных вычислений bcrypt, но не освобождает
+    поток запроса: hash и verify ждут результата (.result()); асинхронный
+    обработчик вызывает их через run_blocking.
+    Число задач в пуле и в очереди ограничено queue_limit: при переполнении
+    вызывающий ждёт не дольше queue_timeout и получает PasswordServiceBusy.
+    bcrypt загружается при первой задаче, а не при импорте модуля.
+    """
+
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = PASSWORD_WORKERS,
+                 queue_limit: int = PASSWORD_QUEUE_LIMIT, queue_timeout: float = PASSWORD_QUEUE_TIMEOUT):
+        self.rounds = rounds
+        self.workers = max(1, workers)
+        self.queue_limit = max(self.workers, queue_limit)
+        self.queue_timeout = queue_timeout
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(self.queue_limit)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._counters = {'submitted': 0, 'completed': 0, 'rejected': 0, 'max_queue_depth': 0,
+                          'queue_wait_ms_total': 0.0, 'work_ms_total': 0.0}
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._counters['rejected'] += 1
+            raise PasswordServiceBusy('Password hashing queue is full')
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self._pending += 1
+            self._counters['submitted'] += 1
+            depth = self._pending - self._running
+            if depth > self._counters['max_queue_depth']:
+                self._counters['max_queue_depth'] = depth
+        try:
+            return self._executor.submit(self._timed, fn, submitted_at, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def _timed(self, fn, submitted_at: float, *args):
+        started_at = time.perf_counter()
+        with self._lock:
+            self._running += 1
+            self._counters['queue_wait_ms_total'] += (started_at - submitted_at) * 1000
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._counters['completed'] += 1
+                self._counters['work_ms_total'] += (time.perf_counter() - started_at) * 1000
+
+    def hash(self, password: str) -> str:
+        """Хеширование пароля с текущей стоимостью"""
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        """Проверка пароля"""
+        return self._run(_verify, password, password_hash)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Хеш создан с меньшей стоимостью и должен быть пересчитан; более стойкие хеши не понижаются"""
+        return hash_rounds(password_hash) < self.rounds
+
+    def stats(self) -> dict:
+        """Глубина очереди и счётчики задач"""
+        with self._lock:
+            return dict(self._counters, queue_depth=self._pending - self._running, running=self._running,
+                        workers=self.workers, queue_limit=self.queue_limit, rounds=self.rounds)
+
+def _hash(password: str, rounds: int) -> str:
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+def _verify(password: str, password_hash: str) -> bool:
+    import bcrypt
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def hash_rounds(password_hash: str) -> int:
+    """Стоимость из хеша формата $2b$12$..."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+def get_password_hasher() -> PasswordHasher:
+    """Сервис хеширования уровня модуля"""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher()
+    return _hasher
@@ -0,0 +1,213 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from local_store import LocalStore, get_local_store
+from routing import Request, error_response
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+IP_CAPACITY = float(os.environ.get('RATE_LIMIT_IP_CAPACITY', '20'))
+IP_REFILL_PER_MINUTE = float(os.environ.get('RATE_LIMIT_IP_PER_MINUTE', '30'))
+EMAIL_CAPACITY = float(os.environ.get('RATE_LIMIT_EMAIL_CAPACITY', '5'))
+EMAIL_REFILL_PER_MINUTE = float(os.environ.get('RATE_LIMIT_EMAIL_PER_MINUTE', '1'))
+TWO_FACTOR_CAPACITY = float(os.environ.get('RATE_LIMIT_2FA_CAPACITY', '5'))
+TWO_FACTOR_REFILL_PER_MINUTE = float(os.environ.get('RATE_LIMIT_2FA_PER_MINUTE', '2'))
+# Число доверенных прокси перед функцией; 0 — X-Forwarded-For не используется
+TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+STORE_NAMESPACE = 'rate_limit'
+
+class TokenBucketLimiter:
+    """
+    Token bucket на ключ (IP, email, пользователь) в памяти контейнера
+
+    Корзина вмещает capacity попыток и пополняется со скоростью refill_per_second.
+    Ключей не больше max_keys (вытесняются давно не использованные). С общим
+    хранилищем состояние корзин видно всем контейнерам хоста; при ошибке
+    хранилища используется память.
+    """
+
+    def __init__(self, name: str, capacity: float, refill_per_second: float,
+                 max_keys: int = RATE_LIMIT_MAX_KEYS, store: Optional[LocalStore] = None):
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self.store = store
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'allowed': 0, 'rejected': 0, 'refunded': 0, 'store_errors': 0}
+
+    def _apply(self, state: Optional[tuple], now: float, cost: float, consume: bool) -> tuple:
+        """Новое состояние корзины и время ожидания (0 — попытка разрешена); cost < 0 — возврат"""
+        tokens, updated = state if state is not None else (self.capacity, now)
+        tokens = min(self.capacity, tokens + (now - updated) * self.refill_per_second)
+        if tokens >= cost:
+            wait = 0.0
+            if consume:
+                tokens = min(self.capacity, tokens - cost)
+        else:
+            wait = (cost - tokens) / self.refill_per_second if self.refill_per_second > 0 else math.inf
+        return (tokens, now), wait
+
+    def _run(self, key: str, cost: float, consume: bool) -> float:
+        now = time.time()
+        if self.store is not None:
+            def fn(value):
+                state = tuple(map(float, value.split(','))) if value else None
+                new_state, wait = self._apply(state, now, cost, consume)
+                return f'{new_state[0]:.6f},{new_state[1]:.6f}', wait
+            try:
+                return self.store.update(f'{STORE_NAMESPACE}:{self.name}', key, fn, self._ttl())
+            except sqlite3.Error:
+                self._count('store_errors')
+        with self._lock:
+            state, wait = self._apply(self._buckets.get(key), now, cost, consume)
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def _ttl(self) -> float:
+        return self.capacity / self.refill_per_second if self.refill_per_second > 0 else 86400.0
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def take(self, key: str, cost: float = 1.0) -> float:
+        """Списание попытки; 0 если разрешено, иначе секунды до следующей"""
+        wait = self._run(key, cost, consume=True)
+        self._count('allowed' if wait == 0 else 'rejected')
+        return wait
+
+    def refund(self, key: str, cost: float = 1.0):
+        """Возврат списанной попытки (не выше capacity)"""
+        self._run(key, -cost, consume=True)
+        self._count('refunded')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters, keys=len(self._buckets), capacity=self.capacity,
+                        refill_per_second=self.refill_per_second)
+
+def client_ip(request: Request) -> Optional[str]:
+    """
+    IP клиента из контекста запроса функции; None, если неизвестен
+
+    X-Forwarded-For задаёт клиент, поэтому он учитывается только при
+    RATE_LIMIT_TRUSTED_PROXIES > 0: берётся адрес, добавленный самым дальним
+    доверенным прокси.
+    """
+    if TRUSTED_PROXIES > 0:
+        forwarded = [part.strip() for part in (request.header('X-Forwarded-For') or '').split(',') if part.strip()]
+        if forwarded:
+            return forwarded[-min(TRUSTED_PROXIES, len(forwarded))]
+    identity = (request.event.get('requestContext') or {}).get('identity') or {}
+    return identity.get('sourceIp') or None
+
+def too_many_requests(wait: float) -> dict:
+    """Ответ 429 с Retry-After"""
+    retry_after = str(max(1, math.ceil(wait))) if math.isfinite(wait) else '3600'
+    return error_response(429, 'Too many attempts, please try again later', {'Retry-After': retry_after})
+
+class LoginRateLimiter:
+    """
+    Ограничение попыток входа и подтверждения 2FA
+
+    Каждая попытка списывается с корзины IP. С корзин email (вход) и
+    пользователя (2FA) попытка списывается до проверки и возвращается, если
+    ответ не 401, так что успешные входы их не расходуют, а параллельные
+    попытки не проходят все разом. Если обработчик упал (например, 503 при
+    занятом пуле bcrypt), попытка тоже возвращается. Отказ по IP и email
+    происходит до bcrypt и до обращения к базе; корзина 2FA привязана к
+    пользователю, а не к временному токену, поэтому новые временные токены не
+    дают новых попыток.
+    """
+
+    def __init__(self, store: Optional[LocalStore] = None):
+        self.by_ip = TokenBucketLimiter('ip', IP_CAPACITY, IP_REFILL_PER_MINUTE / 60, store=store)
+        self.by_email = TokenBucketLimiter('email', EMAIL_CAPACITY, EMAIL_REFILL_PER_MINUTE / 60, store=store)
+        self.by_2fa_user = TokenBucketLimiter('2fa', TWO_FACTOR_CAPACITY, TWO_FACTOR_REFILL_PER_MINUTE / 60,
+                                              store=store)
+
+    def admit(self, request: Request, bucket: Optional[TokenBucketLimiter] = None,
+              key: Optional[str] = None) -> Optional[dict]:
+        """Ответ 429, если попытку нужно отклонить, иначе None; попытка списана с корзин IP и ключа"""
+        ip = client_ip(request)
+        wait = self.by_ip.take(ip) if ip else 0.0
+        if wait == 0 and bucket is not None and key:
+            wait = bucket.take(key)
+        return too_many_requests(wait) if wait > 0 else None
+
+    def settle(self, response: Optional[dict], bucket: TokenBucketLimiter, key: Optional[str]):
+        """Возврат попытки в корзину ключа, если ответ не 401; response None — обработчик упал"""
+        if key and (response is None or response['statusCode'] != 401):
+            bucket.refund(key)
+
+    def two_factor_attempt(self, user_id: int) -> Optional[dict]:
+        """Списание попытки 2FA пользователя; ответ 429, если попытки исчерпаны"""
+        if not RATE_LIMIT_ENABLED:
+            return None
+        wait = self.by_2fa_user.take(str(user_id))
+        return too_many_requests(wait) if wait > 0 else None
+
+    def two_factor_passed(self, user_id: int):
+        """Возврат попытки 2FA после верного кода или сбоя проверки"""
+        if RATE_LIMIT_ENABLED:
+            self.by_2fa_user.refund(str(user_id))
+
+    def login_key(self, request: Request) -> Optional[str]:
+        email = request.json_body().get('email')
+        return email.strip().lower() if isinstance(email, str) else None
+
+    def login(self, request: Request, call_next) -> dict:
+        """Middleware маршрута login"""
+        key = self.login_key(request)
+        rejection = self.admit(request, self.by_email, key)
+        if rejection is not None:
+            return rejection
+        response = None
+        try:
+            response = call_next(request)
+            return response
+        finally:
+            self.settle(response, self.by_email, key)
+
+    def verify_2fa(self, request: Request, call_next) -> dict:
+        """Middleware маршрута verify-2fa: корзина IP; корзину пользователя списывает обработчик"""
+        rejection = self.admit(request)
+        if rejection is not None:
+            return rejection
+        return call_next(request)
+
+    def middleware(self) -> Callable:
+        """Middleware роутера: ограничение по имени маршрута, остальные маршруты без изменений"""
+        policies: Dict[str, Callable] = {'POST login': self.login, 'POST verify-2fa': self.verify_2fa}
+
+        def middleware(request: Request, call_next) -> dict:
+            policy = policies.get(request.route) if RATE_LIMIT_ENABLED else None
+            if policy is None:
+                return call_next(request)
+            return policy(request, call_next)
+        return middleware
+
+    def stats(self) -> dict:
+        """Счётчики разрешённых, отклонённых и возвращённых попыток по корзинам"""
+        return {'ip': self.by_ip.stats(), 'email': self.by_email.stats(), '2fa': self.by_2fa_user.stats()}
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_login_rate_limiter() -> LoginRateLimiter:
+    """Ограничитель уровня модуля; с LOCAL_STORE_PATH корзины общие для контейнеров хоста"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = LoginRateLimiter(get_local_store())
+    return _limiter
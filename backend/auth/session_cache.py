@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from local_store import get_local_store
+
+SESSION_CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', '60'))
+SESSION_CACHE_MAX_SIZE = int(os.environ.get('SESSION_CACHE_MAX_SIZE', '10000'))
+SESSION_STORE_RECHECK = float(os.environ.get('SESSION_STORE_RECHECK', '1'))
+STORE_NAMESPACE = 'session'
+
+def token_key(session_token: str) -> str:
+    """Ключ кеша: токен в открытом виде в памяти не хранится"""
+    return hashlib.sha256(session_token.encode('utf-8')).hexdigest()
+
+class SessionCache:
+    """
+    Ограниченный LRU-кеш проверенных сессий с TTL
+
+    Запись живёт не дольше ttl и не дольше expires_at самой сессии.
+    Logout и смена 2FA удаляют запись только в памяти своего контейнера и в
+    общем хранилище. Без общего хранилища (LOCAL_STORE_PATH) остальные
+    контейнеры, в том числе функции mining, принимают отозванный токен, пока
+    не истечёт их запись, — до SESSION_CACHE_TTL секунд; если это окно
+    недопустимо, его сокращают уменьшением TTL. С хранилищем запись из памяти
+    сверяется с ним не чаще раза в recheck секунд, так что logout виден во всех
+    контейнерах хоста не позже чем через recheck, а попадание в память
+    обычно обходится без обращения к SQLite.
+    """
+
+    def __init__(self, max_size: int = SESSION_CACHE_MAX_SIZE, ttl: float = SESSION_CACHE_TTL, store=None,
+                 recheck: float = SESSION_STORE_RECHECK):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self.recheck = recheck
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, session_token: str) -> Optional[dict]:
+        """Пользователь по токену или None при промахе"""
+        key = token_key(session_token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is not None and self.store is not None and now - entry[2] >= self.recheck:
+            if self.store.exists(STORE_NAMESPACE, key):
+                entry = (entry[0], entry[1], now)
+                with self._lock:
+                    if key in self._entries:
+                        self._entries[key] = entry
+            else:
+                with self._lock:
+                    self._drop(key)
+                entry = None
+
+        if entry is None and self.store is not None:
+            raw = self.store.get(STORE_NAMESPACE, key)
+            if raw is not None:
+                payload = json.loads(raw)
+                entry = (payload['user'], payload['valid_until'], now)
+                with self._lock:
+                    self._put(key, entry)
+
+        with self._lock:
+            self._counters['hits' if entry is not None else 'misses'] += 1
+        return dict(entry[0]) if entry is not None else None
+
+    def set(self, session_token: str, user: dict, expires_in: float):
+        """Сохранение пользователя; expires_in — секунды до истечения сессии"""
+        lifetime = min(self.ttl, expires_in)
+        if lifetime <= 0:
+            return
+        key = token_key(session_token)
+        user = {k: (v if v is None or isinstance(v, (int, float, bool, str)) else str(v)) for k, v in user.items()}
+        now = time.time()
+        entry = (user, now + lifetime, now)
+        with self._lock:
+            self._put(key, entry)
+        if self.store is not None:
+            self.store.set(STORE_NAMESPACE, key, json.dumps({'user': user, 'valid_until': entry[1]}),
+                           lifetime, tag=str(user['id']))
+
+    def invalidate(self, session_token: str):
+        """Удаление одной сессии (logout)"""
+        key = token_key(session_token)
+        with self._lock:
+            self._drop(key)
+            self._counters['invalidations'] += 1
+        if self.store is not None:
+            self.store.delete(STORE_NAMESPACE, key)
+
+    def invalidate_user(self, user_id: int):
+        """Удаление всех сессий пользователя (изменение 2FA)"""
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._drop(key)
+            self._counters['invalidations'] += 1
+        if self.store is not None:
+            self.store.delete_tag(STORE_NAMESPACE, str(user_id))
+
+    def stats(self) -> dict:
+        """Счётчики попаданий, промахов и вытеснений"""
+        with self._lock:
+            return dict(self._counters, size=len(self._entries), max_size=self.max_size)
+
+    def _put(self, key: str, entry: tuple):
+        self._drop(key)
+        self._entries[key] = entry
+        self._by_user.setdefault(entry[0]['id'], set()).add(key)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self._counters['evictions'] += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_user.get(entry[0]['id'])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[entry[0]['id']]
+
+_cache = SessionCache(store=get_local_store())
+
+def get_session_cache() -> SessionCache:
+    """Кеш сессий уровня модуля"""
+    return _cache
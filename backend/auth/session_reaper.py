@@ -0,0 +1,273 @@
+"""
+Жизненный цикл user_sessions: пакетное удаление истёкших сессий, партиционирование и метрики
+
+Запуск:
+    python session_reaper.py reap [--batch-size 1000] [--max-batches 100]
+    python session_reaper.py partition          # однократный перевод таблицы на партиции по expires_at
+    python session_reaper.py maintain [--ahead 2]  # создать будущие и удалить истёкшие партиции
+    python session_reaper.py metrics
+
+Партиции создаются и удаляются только из CLI (reap, maintain), например по cron;
+фоновая уборка из обработчиков входа лишь удаляет истёкшие строки.
+"""
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+
+REAP_BATCH_SIZE = int(os.environ.get('SESSION_REAP_BATCH_SIZE', '1000'))
+REAP_MAX_BATCHES = int(os.environ.get('SESSION_REAP_MAX_BATCHES', '20'))
+REAP_INTERVAL = float(os.environ.get('SESSION_REAP_INTERVAL', '300'))
+PARTITION_PREFIX = 'user_sessions_p'
+
+_lock = threading.Lock()
+_last_started = 0.0
+_running = False
+_totals = {'runs': 0, 'rows_reaped': 0, 'partitions_dropped': 0, 'seconds': 0.0, 'last_run': None}
+
+def reap_expired(conn, batch_size: int = REAP_BATCH_SIZE, max_batches: int = REAP_MAX_BATCHES,
+                 maintain_partitions: bool = False) -> dict:
+    """
+    Удаление истёкших сессий пакетами по batch_size строк
+
+    Каждый пакет — отдельная короткая транзакция; строки, занятые другими
+    транзакциями, пропускаются (SKIP LOCKED), поэтому долгих блокировок нет.
+    Заодно удаляются отзывы подписанных токенов, срок которых уже вышел.
+    DDL партиций (DETACH берёт ACCESS EXCLUSIVE на user_sessions) выполняется
+    только с maintain_partitions=True — из CLI/cron, не на пути запроса.
+    """
+    started = time.perf_counter()
+    deleted = 0
+    batches = 0
+    with conn.cursor() as cur:
+        while batches < max_batches:
+            cur.execute(
+                """
+                DELETE FROM user_sessions
+                WHERE id IN (
+                    SELECT id FROM user_sessions
+                    WHERE expires_at < NOW()
+                    ORDER BY expires_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                """,
+                (batch_size,)
+            )
+            conn.commit()
+            batches += 1
+            deleted += cur.rowcount
+            if cur.rowcount < batch_size:
+                break
+        cur.execute("DELETE FROM revoked_session_tokens WHERE expires_at < NOW()")
+        conn.commit()
+
+    dropped = []
+    if maintain_partitions and is_partitioned(conn):
+        ensure_partitions(conn)
+        dropped = drop_expired_partitions(conn)
+    elapsed = time.perf_counter() - started
+    _record(deleted, len(dropped), elapsed)
+    return {
+        'rows_reaped': deleted,
+        'batches': batches,
+        'partitions_dropped': dropped,
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'rows_per_second': round(deleted / elapsed, 1) if elapsed > 0 else None
+    }
+
+def _record(deleted: int, dropped: int, elapsed: float):
+    with _lock:
+        _totals['runs'] += 1
+        _totals['rows_reaped'] += deleted
+        _totals['partitions_dropped'] += dropped
+        _totals['seconds'] += elapsed
+        _totals['last_run'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+def maybe_reap_in_background(pool, interval: float = REAP_INTERVAL):
+    """Фоновое удаление истёкших строк не чаще раза в interval секунд на контейнер; без DDL партиций"""
+    global _last_started, _running
+    now = time.monotonic()
+    with _lock:
+        if _running or now - _last_started < interval:
+            return
+        _running = True
+        _last_started = now
+
+    def run():
+        global _running
+        conn = None
+        discard = False
+        try:
+            conn = pool.acquire()
+            reap_expired(conn)
+        except Exception as e:
+            import psycopg2
+            discard = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            print(json.dumps({'event': 'session_reap_failed', 'error': str(e)}))
+        finally:
+            if conn is not None:
+                pool.release(conn, discard=discard)
+            with _lock:
+                _running = False
+
+    threading.Thread(target=run, name='session-reaper', daemon=True).start()
+
+def is_partitioned(conn) -> bool:
+    """Таблица user_sessions партиционирована по expires_at"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = 'user_sessions'::regclass")
+        row = cur.fetchone()
+    conn.rollback()
+    return bool(row) and row[0] == 'p'
+
+def _month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+def _next_month(day: datetime.date) -> datetime.date:
+    return (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+def ensure_partitions(conn, ahead: int = 2, parent: str = 'user_sessions') -> list:
+    """Месячные партиции с текущего месяца на ahead месяцев вперёд"""
+    created = []
+    start = _month_start(datetime.date.today())
+    with conn.cursor() as cur:
+        for _ in range(ahead + 1):
+            end = _next_month(start)
+            name = f'{PARTITION_PREFIX}{start:%Y%m}'
+            cur.execute("SELECT to_regclass(%s)", (name,))
+            if cur.fetchone()[0] is None:
+                cur.execute(
+                    f"CREATE TABLE {name} PARTITION OF {parent} FOR VALUES FROM (%s) TO (%s)",
+                    (start, end)
+                )
+                created.append(name)
+            start = end
+    if parent == 'user_sessions':
+        conn.commit()
+    return created
+
+def drop_expired_partitions(conn) -> list:
+    """Удаление целиком партиций, все сессии которых уже истекли"""
+    current = f'{PARTITION_PREFIX}{_month_start(datetime.date.today()):%Y%m}'
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'user_sessions'::regclass AND c.relname LIKE %s
+            ORDER BY c.relname
+            """,
+            (PARTITION_PREFIX + '%',)
+        )
+        names = [row[0] for row in cur.fetchall() if row[0] < current]
+        for name in names:
+            cur.execute(f'ALTER TABLE user_sessions DETACH PARTITION {name}')
+            cur.execute(f'DROP TABLE {name}')
+    conn.commit()
+    return names
+
+def convert_to_partitioned(conn, ahead: int = 2) -> dict:
+    """
+    Однократный перевод user_sessions на партиции по месяцам expires_at
+
+    Уникальность session_token у партиционированной таблицы обеспечивается
+    только в паре с ключом партиции, поэтому глобальный UNIQUE заменяется
+    обычным индексом; токены — 64 случайных байта. Переносятся только живые сессии.
+    """
+    if is_partitioned(conn):
+        return {'converted': False, 'reason': 'already partitioned'}
+    with conn.cursor() as cur:
+        cur.execute('LOCK TABLE user_sessions IN ACCESS EXCLUSIVE MODE')
+        cur.execute(
+            """
+            CREATE TABLE user_sessions_partitioned (
+                id INTEGER NOT NULL DEFAULT nextval('user_sessions_id_seq'),
+                user_id INTEGER REFERENCES users(id),
+                session_token VARCHAR(512) NOT NULL,
+                expires_at TIMESTAMP NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, expires_at)
+            ) PARTITION BY RANGE (expires_at)
+            """
+        )
+        cur.execute('CREATE TABLE user_sessions_default PARTITION OF user_sessions_partitioned DEFAULT')
+        created = ensure_partitions(conn, ahead, parent='user_sessions_partitioned')
+        cur.execute(
+            """
+            INSERT INTO user_sessions_partitioned (id, user_id, session_token, expires_at, created_at)
+            SELECT id, user_id, session_token, expires_at, created_at
+            FROM user_sessions
+            WHERE expires_at > NOW()
+            """
+        )
+        moved = cur.rowcount
+        cur.execute('ALTER SEQUENCE user_sessions_id_seq OWNED BY NONE')
+        cur.execute('DROP TABLE user_sessions')
+        cur.execute('ALTER TABLE user_sessions_partitioned RENAME TO user_sessions')
+        cur.execute('ALTER SEQUENCE user_sessions_id_seq OWNED BY user_sessions.id')
+        cur.execute('CREATE INDEX idx_sessions_token ON user_sessions(session_token)')
+        cur.execute('CREATE INDEX idx_sessions_user ON user_sessions(user_id)')
+        cur.execute('CREATE INDEX idx_sessions_expires ON user_sessions(expires_at)')
+    conn.commit()
+    return {'converted': True, 'rows_moved': moved, 'partitions_created': created}
+
+def table_metrics(conn) -> dict:
+    """Размер таблицы с индексами, число строк, доля истёкших и накопленная скорость уборки"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT
+                COALESCE(SUM(pg_total_relation_size(t.relid)), 0),
+                COUNT(*) FILTER (WHERE t.isleaf)
+            FROM pg_partition_tree('user_sessions') t
+            """
+        )
+        total_bytes, partitions = cur.fetchone()
+        cur.execute(
+            """
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE expires_at < NOW())
+            FROM user_sessions
+            """
+        )
+        rows, expired = cur.fetchone()
+    conn.rollback()
+    with _lock:
+        totals = dict(_totals)
+    return {
+        'total_bytes': total_bytes,
+        'partitions': partitions if is_partitioned(conn) else 0,
+        'rows': rows,
+        'expired_rows': expired,
+        'reaper': dict(totals, rows_per_second=round(totals['rows_reaped'] / totals['seconds'], 1)
+                       if totals['seconds'] else None)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['reap', 'partition', 'maintain', 'metrics'])
+    parser.add_argument('--batch-size', type=int, default=REAP_BATCH_SIZE)
+    parser.add_argument('--max-batches', type=int, default=1000)
+    parser.add_argument('--ahead', type=int, default=2)
+    args = parser.parse_args()
+
+    import psycopg2
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        if args.command == 'reap':
+            result = reap_expired(conn, args.batch_size, args.max_batches, maintain_partitions=True)
+        elif args.command == 'partition':
+            result = convert_to_partitioned(conn, args.ahead)
+        elif args.command == 'maintain':
+            result = {'created': ensure_partitions(conn, args.ahead), 'dropped': drop_expired_partitions(conn)}
+        else:
+            result = table_metrics(conn)
+        print(json.dumps(result, default=str))
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
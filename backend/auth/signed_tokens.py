@@ -0,0 +1,175 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+TOKEN_PREFIX = 'st1'
+SESSION_TOKEN_MODE = os.environ.get('SESSION_TOKEN_MODE', 'opaque')
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('REVOCATION_REFRESH_SECONDS', '5'))
+LIVE_REVOCATIONS_SQL = """
+    SELECT jti, EXTRACT(EPOCH FROM expires_at::timestamptz)::float8
+    FROM revoked_session_tokens
+    WHERE expires_at > NOW()
+"""
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def parse_key_ring(spec: str) -> dict:
+    """Ключи из SESSION_SIGNING_KEYS вида 'kid1:secret1,kid2:secret2'; первый — активный"""
+    ring = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        kid, _, secret = item.partition(':')
+        if kid and secret:
+            ring[kid] = secret.encode('utf-8')
+    return ring
+
+class RevocationList:
+    """
+    Отозванные до истечения подписанные токены (logout)
+
+    Источник истины — таблица revoked_session_tokens; в памяти держится
+    множество jti, которое перечитывается не чаще раза в refresh_seconds,
+    так что проверка токена обращается к базе раз в несколько секунд, а не на каждый запрос.
+    """
+
+    def __init__(self, refresh_seconds: float = REVOCATION_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._revoked = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._loaded_at >= self.refresh_seconds
+
+    def is_revoked(self, jti: str, conn=None) -> bool:
+        if conn is not None and self.is_stale():
+            self.refresh(conn)
+        with self._lock:
+            expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def refresh(self, conn):
+        """
+        Перечитывание живых отзывов из базы
+
+        Соединение принадлежит запросу: транзакция закрывается, только если
+        её открыл сам запрос отзывов, а уже начатая транзакция вызывающего
+        кода остаётся нетронутой.
+        """
+        import psycopg2.extensions
+        idle = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        with conn.cursor() as cur:
+            cur.execute(LIVE_REVOCATIONS_SQL)
+            rows = cur.fetchall()
+        if idle:
+            conn.rollback()
+        self.load(rows)
+
+    def load(self, rows):
+        """Замена локального множества строками (jti, expires_at в секундах)"""
+        with self._lock:
+            self._revoked = {jti: expires_at for jti, expires_at in rows}
+            self._loaded_at = time.monotonic()
+
+    def revoke(self, conn, jti: str, expires_at: float):
+        """Отзыв токена: запись в базу и сразу в локальное множество"""
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO revoked_session_tokens (jti, expires_at)
+                VALUES (%s, to_timestamp(%s))
+                ON CONFLICT (jti) DO NOTHING
+                """,
+                (jti, expires_at)
+            )
+        conn.commit()
+        self.add(jti, expires_at)
+
+    def add(self, jti: str, expires_at: float):
+        """Отзыв в локальном множестве, не дожидаясь перечитывания"""
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+class TokenSigner:
+    """Подписанные HMAC-SHA256 токены сессии с кольцом ключей для ротации"""
+
+    def __init__(self, key_ring: dict, revocations: RevocationList):
+        self.key_ring = key_ring
+        self.active_kid = next(iter(key_ring), None)
+        self.revocations = revocations
+
+    def issue(self, user: dict, ttl_seconds: int) -> str:
+        """Выпуск токена с id, email, именем пользователя и сроком действия"""
+        import secrets
+        claims = {
+            'uid': user['id'],
+            'email': user['email'],
+            'name': user['full_name'],
+            'exp': int(time.time()) + ttl_seconds,
+            'jti': secrets.token_urlsafe(16)
+        }
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        signing_input = f'{TOKEN_PREFIX}.{self.active_kid}.{payload}'
+        signature = hmac.new(self.key_ring[self.active_kid], signing_input.encode('ascii'), hashlib.sha256).digest()
+        return f'{signing_input}.{_b64encode(signature)}'
+
+    def verify(self, token: str, conn=None) -> Optional[dict]:
+        """Проверка подписи, срока и отзыва; claims или None"""
+        parts = token.split('.')
+        if len(parts) != 4 or parts[0] != TOKEN_PREFIX:
+            return None
+        _, kid, payload, signature = parts
+        key = self.key_ring.get(kid)
+        if key is None:
+            return None
+        try:
+            expected = hmac.new(key, f'{TOKEN_PREFIX}.{kid}.{payload}'.encode('ascii'), hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                return None
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+        if not isinstance(claims, dict) or claims.get('exp', 0) <= time.time():
+            return None
+        if self.revocations.is_revoked(claims.get('jti'), conn):
+            return None
+        return claims
+
+    def revoke(self, conn, token: str) -> bool:
+        """Отзыв действительного токена при logout"""
+        claims = self.verify(token)
+        if claims is None:
+            return False
+        self.revocations.revoke(conn, claims['jti'], claims['exp'])
+        return True
+
+def is_signed_token(token: str) -> bool:
+    """Токен выпущен в подписанном режиме (по префиксу)"""
+    return token.startswith(TOKEN_PREFIX + '.')
+
+def claims_to_user(claims: dict) -> dict:
+    """Пользователь из claims токена"""
+    return {'id': claims['uid'], 'email': claims['email'], 'full_name': claims['name']}
+
+_signer = TokenSigner(parse_key_ring(os.environ.get('SESSION_SIGNING_KEYS', '')), RevocationList())
+
+def get_token_signer() -> Optional[TokenSigner]:
+    """Подписывающий сервис или None, если ключи не заданы"""
+    return _signer if _signer.active_kid else None
+
+def verify_signed_token(token: str, conn=None) -> Optional[dict]:
+    """Claims подписанного токена или None, если он недействителен или ключи не заданы"""
+    signer = get_token_signer()
+    return signer.verify(token, conn) if signer else None
+
+def signed_mode_enabled() -> bool:
+    """Новые сессии выпускаются подписанными токенами"""
+    return SESSION_TOKEN_MODE == 'signed' and get_token_signer() is not None
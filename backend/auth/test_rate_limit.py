@@ -0,0 +1,52 @@
+"""
+Проверки ограничения попыток входа без базы данных и общего хранилища
+
+Запуск: cd backend/auth && python -m unittest test_rate_limit
+"""
+import json
+import unittest
+from rate_limit import EMAIL_CAPACITY, LoginRateLimiter
+from routing import Request, error_response, json_response
+
+def login_request(email: str) -> Request:
+    event = {'httpMethod': 'POST', 'body': json.dumps({'email': email, 'password': 'WrongPass123!'}),
+             'requestContext': {'identity': {'sourceIp': '203.0.113.7'}}}
+    return Request(event, None, 'POST', 'login')
+
+def respond(status: int):
+    def call_next(request):
+        return error_response(status, 'Invalid credentials') if status >= 400 else json_response(status, {})
+    return call_next
+
+def fail(request):
+    raise RuntimeError('password service busy')
+
+class LoginRateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = LoginRateLimiter()
+
+    def test_repeated_failures_are_rejected(self):
+        for _ in range(int(EMAIL_CAPACITY)):
+            self.assertEqual(self.limiter.login(login_request('a@example.com'), respond(401))['statusCode'], 401)
+        response = self.limiter.login(login_request('a@example.com'), respond(401))
+        self.assertEqual(response['statusCode'], 429)
+        self.assertIn('Retry-After', response['headers'])
+
+    def test_email_is_case_insensitive(self):
+        for _ in range(int(EMAIL_CAPACITY)):
+            self.limiter.login(login_request('B@Example.com'), respond(401))
+        self.assertEqual(self.limiter.login(login_request('b@example.com '), respond(401))['statusCode'], 429)
+
+    def test_successful_logins_do_not_spend_attempts(self):
+        for _ in range(int(EMAIL_CAPACITY) + 1):
+            self.assertEqual(self.limiter.login(login_request('c@example.com'), respond(200))['statusCode'], 200)
+
+    def test_handler_errors_do_not_spend_attempts(self):
+        for _ in range(int(EMAIL_CAPACITY) + 1):
+            with self.assertRaises(RuntimeError):
+                self.limiter.login(login_request('d@example.com'), fail)
+        self.assertEqual(self.limiter.login(login_request('d@example.com'), respond(401))['statusCode'], 401)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+"""
+Проверка кодов 2FA (TOTP, RFC 6238) без pyotp на горячем пути
+
+Коды окна valid_window вокруг текущего шага считаются через hmac стандартной
+библиотеки один раз на (секрет, шаг) и кешируются. Принятый шаг запоминается
+в хранилище использованных кодов, поэтому код нельзя предъявить повторно,
+пока он в окне. Данные ожидающих входов (временный токен → пользователь и
+секрет) кешируются при выдаче временного токена, чтобы подтверждение не
+перечитывало секрет из users.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from local_store import LocalStore, get_local_store
+from session_cache import token_key
+
+TOTP_STEP = 30
+TOTP_DIGITS = 6
+TOTP_VALID_WINDOW = int(os.environ.get('TOTP_VALID_WINDOW', '1'))
+TOTP_CACHE_SIZE = int(os.environ.get('TOTP_CACHE_SIZE', '10000'))
+PENDING_LOGIN_TTL = 300
+STORE_NAMESPACE = 'totp_used'
+
+def decode_secret(secret: str) -> bytes:
+    """Ключ HMAC из base32-секрета (без учёта регистра и дополнения)"""
+    secret = secret.strip().replace(' ', '').upper()
+    return base64.b32decode(secret + '=' * (-len(secret) % 8))
+
+def hotp(key: bytes, counter: int, digits: int = TOTP_DIGITS) -> str:
+    """Код HOTP для счётчика (RFC 4226, HMAC-SHA1)"""
+    digest = hmac.new(key, counter.to_bytes(8, 'big'), hashlib.sha1).digest()
+    offset = digest[-1] & 0x0F
+    value = int.from_bytes(digest[offset:offset + 4], 'big') & 0x7FFFFFFF
+    return str(value % 10 ** digits).zfill(digits)
+
+class UsedCodeStore:
+    """
+    Последний принятый шаг TOTP пользователя с TTL
+
+    Код принимается, только если его шаг больше последнего принятого, поэтому
+    повтор того же или более старого кода окна отклоняется. Запись живёт, пока
+    шаг может оставаться в окне. С общим хранилищем проверка и запись атомарны
+    для всех контейнеров хоста; при ошибке хранилища используется память.
+    """
+
+    def __init__(self, ttl: float, max_size: int = TOTP_CACHE_SIZE, store: Optional[LocalStore] = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.store_errors = 0
+
+    def claim(self, user_id: int, counter: int) -> bool:
+        """Отметка шага как использованного; False, если он уже был использован"""
+        if self.store is not None:
+            def fn(value):
+                if value is not None and int(value) >= counter:
+                    return value, False
+                return str(counter), True
+            try:
+                return self.store.update(STORE_NAMESPACE, str(user_id), fn, self.ttl)
+            except sqlite3.Error:
+                with self._lock:
+                    self.store_errors += 1
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now and entry[0] >= counter:
+                return False
+            self._entries[user_id] = (counter, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return True
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+class TotpVerifier:
+    """
+    Проверка кодов по предвычисленному окну с защитой от повтора
+
+    Кеш (секрет, шаг) → коды окна ограничен max_size записями (LRU); ключи
+    HMAC декодируются из base32 один раз. Ожидающие входы хранятся только в
+    памяти контейнера: при промахе вызывающий читает их из базы.
+    """
+
+    def __init__(self, valid_window: int = TOTP_VALID_WINDOW, step: int = TOTP_STEP,
+                 max_size: int = TOTP_CACHE_SIZE, store: Optional[LocalStore] = None):
+        self.valid_window = max(0, valid_window)
+        self.step = step
+        self.max_size = max_size
+        self.used = UsedCodeStore((2 * self.valid_window + 1) * step, max_size, store)
+        self._windows = OrderedDict()
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'verified': 0, 'invalid': 0, 'replayed': 0, 'window_hits': 0, 'window_misses': 0,
+                          'pending_hits': 0, 'pending_misses': 0}
+
+    def _window(self, secret: str, counter: int) -> tuple:
+        cache_key = (token_key(secret), counter)
+        with self._lock:
+            codes = self._windows.get(cache_key)
+            if codes is not None:
+                self._windows.move_to_end(cache_key)
+                self._counters['window_hits'] += 1
+                return codes
+            self._counters['window_misses'] += 1
+        key = decode_secret(secret)
+        codes = tuple((counter + offset, hotp(key, counter + offset))
+                      for offset in range(-self.valid_window, self.valid_window + 1))
+        with self._lock:
+            self._windows[cache_key] = codes
+            while len(self._windows) > self.max_size:
+                self._windows.popitem(last=False)
+        return codes
+
+    def match(self, secret: str, code: str, now: Optional[float] = None) -> Optional[int]:
+        """Шаг, которому соответствует код в окне, или None; без учёта повторов"""
+        code = str(code).strip().replace(' ', '')
+        if len(code) != TOTP_DIGITS or not code.isdigit():
+            return None
+        try:
+            window = self._window(secret, int((time.time() if now is None else now) // self.step))
+        except (ValueError, TypeError):
+            return None
+        matched = None
+        for counter, expected in window:
+            if hmac.compare_digest(expected, code):
+                matched = counter
+        return matched
+
+    def verify(self, user_id: int, secret: str, code: str, now: Optional[float] = None) -> bool:
+        """Проверка кода и отметка его шага использованным"""
+        counter = self.match(secret, code, now)
+        if counter is None:
+            self._count('invalid')
+            return False
+        if not self.used.claim(user_id, counter):
+            self._count('replayed')
+            return False
+        self._count('verified')
+        return True
+
+    def remember_pending(self, temp_token: str, user: dict, secret: str, ttl: float = PENDING_LOGIN_TTL):
+        """Кеширование пользователя и секрета при выдаче временного токена 2FA"""
+        with self._lock:
+            self._pending[token_key(temp_token)] = (dict(user), secret, time.time() + ttl)
+            while len(self._pending) > self.max_size:
+                self._pending.popitem(last=False)
+
+    def pending(self, temp_token: str) -> Optional[tuple]:
+        """(пользователь, секрет) ожидающего входа или None при промахе"""
+        key = token_key(temp_token)
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is not None and entry[2] <= time.time():
+                del self._pending[key]
+                entry = None
+            self._counters['pending_hits' if entry is not None else 'pending_misses'] += 1
+        return (dict(entry[0]), entry[1]) if entry is not None else None
+
+    def forget_pending(self, temp_token: str):
+        with self._lock:
+            self._pending.pop(token_key(temp_token), None)
+
+    def forget_user(self, user_id: int):
+        """Сброс ожидающих входов пользователя (смена секрета)"""
+        with self._lock:
+            for key in [key for key, entry in self._pending.items() if entry[0]['id'] == user_id]:
+                del self._pending[key]
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> dict:
+        """Счётчики проверок, повторов и попаданий в кеши"""
+        with self._lock:
+            return dict(self._counters, windows=len(self._windows), pending=len(self._pending),
+                        used_codes=self.used.size(), store_errors=self.used.store_errors,
+                        valid_window=self.valid_window)
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+def get_totp_verifier() -> TotpVerifier:
+    """Проверяющий уровня модуля; с LOCAL_STORE_PATH использованные коды общие для контейнеров хоста"""
+    global _verifier
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = TotpVerifier(store=get_local_store())
+    return _verifier
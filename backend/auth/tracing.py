@@ -0,0 +1,200 @@
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+TRACE_QUERIES = os.environ.get('TRACE_QUERIES', '') == '1'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '0'))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1') == '1'
+TRACE_MAX_QUERIES = int(os.environ.get('TRACE_MAX_QUERIES', '50'))
+STATEMENT_LOG_LIMIT = 2000
+EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete')
+
+_current = contextvars.ContextVar('request_trace', default=None)
+_NO_PHASE = nullcontext()
+
+def tracing_active() -> bool:
+    """Трассировка запросов или журнал медленных запросов включены"""
+    return TRACE_QUERIES or SLOW_QUERY_MS > 0
+
+class RequestTrace:
+    """Замеры одного вызова функции: фазы, запросы к базе и их отпечатки"""
+
+    __slots__ = ('request_id', 'route', 'started', 'phases', 'queries', 'query_count', 'query_ms')
+
+    def __init__(self, request_id: str, route: str):
+        self.request_id = request_id
+        self.route = route
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = []
+        self.query_count = 0
+        self.query_ms = 0.0
+
+    def add_phase(self, name: str, ms: float):
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+
+    def record_query(self, fingerprint: str, ms: float, rows: int):
+        self.query_count += 1
+        self.query_ms += ms
+        if len(self.queries) < TRACE_MAX_QUERIES:
+            self.queries.append({'fingerprint': fingerprint, 'ms': round(ms, 3), 'rows': rows})
+
+    def as_dict(self, status: Optional[int]) -> dict:
+        total_ms = (time.perf_counter() - self.started) * 1000
+        accounted = self.phases.get('connect', 0.0) + self.query_ms + self.phases.get('serialize', 0.0)
+        return {
+            'event': 'request_trace',
+            'request_id': self.request_id,
+            'route': self.route,
+            'status': status,
+            'total_ms': round(total_ms, 3),
+            'phases': dict({name: round(ms, 3) for name, ms in self.phases.items()},
+                           queries=round(self.query_ms, 3), other=round(max(0.0, total_ms - accounted), 3)),
+            'query_count': self.query_count,
+            'queries': self.queries
+        }
+
+def begin_request(event: dict, context, route: str) -> RequestTrace:
+    """Начало трассировки вызова; id берётся из X-Request-Id, контекста функции или генерируется"""
+    headers = event.get('headers') or {}
+    request_id = (headers.get('X-Request-Id') or headers.get('x-request-id')
+                  or getattr(context, 'request_id', None) or uuid.uuid4().hex[:16])
+    trace = RequestTrace(str(request_id), route)
+    _current.set(trace)
+    return trace
+
+def end_request(trace: RequestTrace, status: Optional[int]):
+    """Завершение трассировки и вывод разбивки по фазам"""
+    _current.set(None)
+    if TRACE_QUERIES:
+        print(json.dumps(trace.as_dict(status)))
+
+def current_request_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.request_id if trace is not None else None
+
+def phase(name: str):
+    """Замер фазы текущего вызова; без трассировки — пустой контекст"""
+    trace = _current.get()
+    if trace is None:
+        return _NO_PHASE
+    return _measure(trace, name)
+
+@contextmanager
+def _measure(trace: RequestTrace, name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_phase(name, (time.perf_counter() - started) * 1000)
+
+def traced_phase(name: str):
+    """Декоратор: вызов функции замеряется как фаза name"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s")
+_SPACES = re.compile(r'\s+')
+
+@functools.lru_cache(maxsize=512)
+def fingerprint(statement: str) -> str:
+    """Отпечаток запроса: литералы и параметры заменены на ?, пробелы схлопнуты"""
+    normalized = _SPACES.sub(' ', _LITERALS.sub('?', statement)).strip().lower()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+def _statement_text(cursor, query) -> str:
+    if isinstance(query, str):
+        return query
+    if isinstance(query, bytes):
+        return query.decode('utf-8', 'replace')
+    return query.as_string(cursor)
+
+def _explain(cursor, statement: str, params) -> Optional[list]:
+    """План запроса через EXPLAIN без выполнения; ошибка не ломает транзакцию вызова"""
+    if not SLOW_QUERY_EXPLAIN or not statement.lstrip().lower().startswith(EXPLAINABLE):
+        return None
+    import psycopg2
+    import psycopg2.extensions
+    conn = cursor.connection
+    in_transaction = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    explain = psycopg2.extensions.cursor(conn)
+    try:
+        if in_transaction:
+            explain.execute('SAVEPOINT trace_explain')
+        explain.execute('EXPLAIN (FORMAT JSON) ' + statement, params)
+        plan = explain.fetchone()[0]
+        if in_transaction:
+            explain.execute('RELEASE SAVEPOINT trace_explain')
+        return plan
+    except psycopg2.Error as e:
+        if in_transaction:
+            explain.execute('ROLLBACK TO SAVEPOINT trace_explain')
+        return [{'error': str(e).strip()}]
+    finally:
+        explain.close()
+
+def _after_query(cursor, query, params, started: float, explainable: bool = True):
+    ms = (time.perf_counter() - started) * 1000
+    trace = _current.get()
+    slow = SLOW_QUERY_MS > 0 and ms >= SLOW_QUERY_MS
+    if trace is None and not slow:
+        return
+    statement = _statement_text(cursor, query)
+    if trace is not None:
+        trace.record_query(fingerprint(statement), ms, cursor.rowcount)
+    if slow:
+        print(json.dumps({
+            'event': 'slow_query',
+            'request_id': trace.request_id if trace is not None else None,
+            'fingerprint': fingerprint(statement),
+            'duration_ms': round(ms, 3),
+            'rows': cursor.rowcount,
+            'statement': statement[:STATEMENT_LOG_LIMIT],
+            'plan': _explain(cursor, statement, params) if explainable else None
+        }, default=str))
+
+@functools.lru_cache(maxsize=None)
+def tracing_cursor_class():
+    """
+    Класс TracingCursor: курсор, замеряющий каждый execute/executemany/copy_expert
+
+    Создаётся при первом обращении, чтобы импорт модуля не тянул psycopg2.
+    """
+    import psycopg2.extensions
+
+    class TracingCursor(psycopg2.extensions.cursor):
+        def execute(self, query, vars=None):
+            started = time.perf_counter()
+            result = super().execute(query, vars)
+            _after_query(self, query, vars, started)
+            return result
+
+        def executemany(self, query, vars_list):
+            started = time.perf_counter()
+            result = super().executemany(query, vars_list)
+            _after_query(self, query, None, started, explainable=False)
+            return result
+
+        def copy_expert(self, sql, file, size=8192):
+            started = time.perf_counter()
+            result = super().copy_expert(sql, file, size)
+            _after_query(self, sql, None, started, explainable=False)
+            return result
+
+    return TracingCursor
+
+def cursor_factory():
+    """Фабрика курсоров для новых соединений: TracingCursor, только если трассировка включена"""
+    return tracing_cursor_class() if tracing_active() else None
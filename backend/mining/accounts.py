@@ -0,0 +1,141 @@
+"""
+Пакетное создание и изменение майнинг-аккаунтов
+
+Элементы проверяются за один проход; новые аккаунты вставляются одним
+многострочным INSERT, изменения применяются одним UPDATE ... FROM (VALUES ...),
+всё в одной транзакции. Ошибочные элементы отклоняются, остальные записываются.
+"""
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from typing import List, Optional
+from routing import HttpError
+
+ACCOUNTS_BATCH_MAX = int(os.environ.get('ACCOUNTS_BATCH_MAX', '1000'))
+ACCOUNT_NAME_MAX = 255
+MAX_ACCOUNT_ID = 2 ** 31 - 1
+FIELD_LIMITS = {
+    'hashrate': Decimal('1e18'),
+    'power_consumption': Decimal('1e8'),
+}
+ACCOUNT_COLUMNS = 'id, account_name, hashrate, power_consumption, is_active, created_at'
+
+INSERT_SQL = f"""
+    INSERT INTO mining_accounts (user_id, account_name, hashrate, power_consumption, is_active)
+    VALUES %s
+    RETURNING {ACCOUNT_COLUMNS}
+"""
+INSERT_TEMPLATE = '(%s, %s, %s, %s, %s)'
+
+UPDATE_SQL = f"""
+    UPDATE mining_accounts ma SET
+        account_name = COALESCE(v.account_name, ma.account_name),
+        hashrate = COALESCE(v.hashrate, ma.hashrate),
+        power_consumption = COALESCE(v.power_consumption, ma.power_consumption),
+        is_active = COALESCE(v.is_active, ma.is_active)
+    FROM (VALUES %s) AS v(id, account_name, hashrate, power_consumption, is_active, user_id)
+    WHERE ma.id = v.id AND ma.user_id = v.user_id
+    RETURNING {', '.join('ma.' + column for column in ACCOUNT_COLUMNS.split(', '))}
+"""
+UPDATE_TEMPLATE = '(%s::int, %s::varchar, %s::numeric, %s::numeric, %s::boolean, %s::int)'
+
+def _amount(item: dict, field: str) -> Optional[Decimal]:
+    value = item.get(field)
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f'{field} must be numeric')
+    try:
+        result = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f'{field} must be numeric')
+    if not result.is_finite() or result < 0 or result >= FIELD_LIMITS[field]:
+        raise ValueError(f'{field} is out of range')
+    return result
+
+def validate_account(item) -> tuple:
+    """
+    Приведение элемента пакета к (id, account_name, hashrate, power_consumption, is_active)
+
+    Без id элемент создаёт аккаунт и требует account_name; с id — изменяет
+    только переданные поля. ValueError при ошибке.
+    """
+    if not isinstance(item, dict):
+        raise ValueError('Item must be an object')
+    account_id = item.get('id')
+    if account_id is not None and (isinstance(account_id, bool) or not isinstance(account_id, int)):
+        raise ValueError('id must be an integer')
+    if account_id is not None and not 1 <= account_id <= MAX_ACCOUNT_ID:
+        raise ValueError('id is out of range')
+    name = item.get('account_name')
+    if name is not None:
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError('account_name must be a non-empty string')
+        if len(name) > ACCOUNT_NAME_MAX:
+            raise ValueError(f'account_name must be at most {ACCOUNT_NAME_MAX} characters')
+    elif account_id is None:
+        raise ValueError('Account name is required')
+    is_active = item.get('is_active')
+    if is_active is not None and not isinstance(is_active, bool):
+        raise ValueError('is_active must be a boolean')
+    return (account_id, name, _amount(item, 'hashrate'), _amount(item, 'power_consumption'), is_active)
+
+def provision_accounts(conn, user_id: int, items: list, max_items: int = ACCOUNTS_BATCH_MAX) -> dict:
+    """
+    Создание и изменение аккаунтов пакетом; результат по каждому элементу в порядке запроса
+
+    Статусы элементов: created, updated, not_found (чужой или несуществующий id), invalid.
+    """
+    if not isinstance(items, list) or not items:
+        raise HttpError(400, 'accounts must be a non-empty array')
+    if len(items) > max_items:
+        raise HttpError(413, f'Batch exceeds {max_items} accounts')
+
+    from psycopg2.extras import execute_values
+    started = time.perf_counter()
+    results: List[Optional[dict]] = [None] * len(items)
+    creates, updates = [], []
+    seen_ids = set()
+    for index, item in enumerate(items):
+        try:
+            row = validate_account(item)
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'invalid', 'error': str(e)}
+            continue
+        if row[0] is None:
+            creates.append((index, row))
+        elif row[0] in seen_ids:
+            results[index] = {'index': index, 'status': 'invalid', 'error': 'Duplicate id in batch'}
+        else:
+            seen_ids.add(row[0])
+            updates.append((index, row))
+
+    with conn.cursor() as cur:
+        if creates:
+            created = execute_values(
+                cur, INSERT_SQL,
+                [(user_id, name, hashrate or 0, power or 0, True if active is None else active)
+                 for _, (_, name, hashrate, power, active) in creates],
+                template=INSERT_TEMPLATE, page_size=len(creates), fetch=True
+            )
+            # RETURNING многострочного INSERT ... VALUES возвращает строки в порядке VALUES
+            columns = [desc[0] for desc in cur.description]
+            for (index, _), row in zip(creates, created):
+                results[index] = {'index': index, 'status': 'created', 'account': dict(zip(columns, row))}
+        if updates:
+            updated = execute_values(
+                cur, UPDATE_SQL, [row + (user_id,) for _, row in updates],
+                template=UPDATE_TEMPLATE, page_size=len(updates), fetch=True
+            )
+            columns = [desc[0] for desc in cur.description]
+            by_id = {row[0]: dict(zip(columns, row)) for row in updated}
+            for index, row in updates:
+                account = by_id.get(row[0])
+                results[index] = ({'index': index, 'status': 'updated', 'account': account} if account
+                                  else {'index': index, 'status': 'not_found', 'error': 'Account not found'})
+        conn.commit()
+
+    counts = {'created': 0, 'updated': 0, 'not_found': 0, 'invalid': 0}
+    for result in results:
+        counts[result['status']] += 1
+    return dict(counts, results=results, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
@@ -0,0 +1,107 @@
+import datetime
+import os
+from typing import List, Optional
+from archive import stats_relation
+from pagination import InvalidPageRequest
+
+SERIES_METRICS = ('total_hashrate', 'power_used', 'btc_mined', 'profit_usd')
+RESOLUTIONS = ('day', 'week', 'month')
+DEFAULT_MAX_POINTS = int(os.environ.get('SERIES_MAX_POINTS', '365'))
+
+def parse_resolution(value: Optional[str]) -> str:
+    """Разрешение ряда: day, week или month"""
+    resolution = (value or 'day').lower()
+    if resolution not in RESOLUTIONS:
+        raise InvalidPageRequest(f"resolution must be one of: {', '.join(RESOLUTIONS)}")
+    return resolution
+
+def parse_points(value: Optional[str]) -> int:
+    """Предельное число точек ряда"""
+    if not value:
+        return DEFAULT_MAX_POINTS
+    try:
+        points = int(value)
+    except ValueError:
+        raise InvalidPageRequest('points must be an integer')
+    return max(3, min(points, DEFAULT_MAX_POINTS))
+
+def _bucket_query(table: str, owner_column: str, conditions: List[str]) -> str:
+    aggregates = ',\n'.join(
+        f'SUM({m}) AS {m}_sum, AVG({m}) AS {m}_avg, MIN({m}) AS {m}_min, MAX({m}) AS {m}_max'
+        for m in SERIES_METRICS
+    )
+    where = ' AND '.join([f'{owner_column} = %(owner)s'] + conditions)
+    return f"""
+        SELECT date_trunc(%(resolution)s, date)::date AS bucket, COUNT(*) AS samples,
+        {aggregates}
+        FROM {table}
+        WHERE {where}
+        GROUP BY 1
+        ORDER BY 1
+    """
+
+def fetch_series(cur, source: str, owner_id: int, resolution: str,
+                 date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                 max_points: int = DEFAULT_MAX_POINTS) -> List[dict]:
+    """
+    Ряд с агрегатами sum/avg/min/max по корзинам day/week/month
+
+    source='account' читает mining_stats одного аккаунта (вместе с архивом, если
+    диапазон заходит за его границу), source='user' — дневные агрегаты пользователя. Если корзин больше max_points, ряд
+    прореживается LTTB по среднему profit_usd.
+    """
+    table, owner_column = {
+        'account': ('mining_stats', 'mining_account_id'),
+        'user': ('user_stats_daily', 'user_id'),
+    }[source]
+    if source == 'account':
+        table = stats_relation(cur, date_from)
+    conditions = []
+    if date_from:
+        conditions.append('date >= %(date_from)s')
+    if date_to:
+        conditions.append('date <= %(date_to)s')
+
+    cur.execute(
+        _bucket_query(table, owner_column, conditions),
+        {'owner': owner_id, 'resolution': resolution, 'date_from': date_from, 'date_to': date_to}
+    )
+    columns = [d[0] for d in cur.description]
+    rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+    rows = lttb(rows, max_points, lambda r: r['bucket'].toordinal(), lambda r: float(r['profit_usd_avg'] or 0))
+    return [_shape(row) for row in rows]
+
+def _shape(row: dict) -> dict:
+    point = {'bucket': row['bucket'], 'samples': row['samples']}
+    for m in SERIES_METRICS:
+        point[m] = {agg: row[f'{m}_{agg}'] for agg in ('sum', 'avg', 'min', 'max')}
+    return point
+
+def lttb(rows: list, threshold: int, x, y) -> list:
+    """Прореживание Largest-Triangle-Three-Buckets до threshold точек с сохранением краёв"""
+    n = len(rows)
+    if threshold >= n or threshold < 3:
+        return rows
+
+    selected = [rows[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(x(r) for r in rows[avg_start:avg_end]) / max(avg_end - avg_start, 1)
+        avg_y = sum(y(r) for r in rows[avg_start:avg_end]) / max(avg_end - avg_start, 1)
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = x(rows[a]), y(rows[a])
+        best, best_area = range_start, -1.0
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (y(rows[j]) - ay) - (ax - x(rows[j])) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(rows[best])
+        a = best
+
+    selected.append(rows[-1])
+    return selected
@@ -0,0 +1,232 @@
+"""
+Архив mining_stats: перенос старых строк в партиционированную mining_stats_archive
+
+Строки старше горизонта (STATS_ARCHIVE_HORIZON_DAYS) переносятся пакетами по
+дням в годовые партиции архива; граница хранится в mining_stats_archive_state.
+Чтения, диапазон которых заходит за границу, идут через представление
+mining_stats_all (горячая таблица UNION ALL архив), остальные — только по mining_stats.
+
+Запуск:
+    python archive.py run [--horizon-days 365] [--batch-days 7]   # перенос строк старше горизонта
+    python archive.py status
+
+Cron: 30 3 * * * cd backend/mining && python archive.py run
+"""
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+from typing import Optional
+from ingest import STAT_FIELDS
+
+STATS_ARCHIVE_HORIZON_DAYS = int(os.environ.get('STATS_ARCHIVE_HORIZON_DAYS', '365'))
+ARCHIVE_BATCH_DAYS = int(os.environ.get('STATS_ARCHIVE_BATCH_DAYS', '7'))
+WATERMARK_TTL = float(os.environ.get('STATS_ARCHIVE_WATERMARK_TTL', '60'))
+HOT_RELATION = 'mining_stats'
+ALL_RELATION = 'mining_stats_all'
+PARTITION_PREFIX = 'mining_stats_archive_y'
+ARCHIVE_COLUMNS = ('mining_account_id', 'date') + STAT_FIELDS
+
+WATERMARK_SQL = "SELECT archived_before FROM mining_stats_archive_state"
+
+MOVE_SQL = f"""
+    WITH moved AS (
+        DELETE FROM mining_stats
+        WHERE date >= %(start)s AND date < %(end)s
+        RETURNING {', '.join(ARCHIVE_COLUMNS)}
+    )
+    INSERT INTO mining_stats_archive ({', '.join(ARCHIVE_COLUMNS)})
+    SELECT {', '.join(ARCHIVE_COLUMNS)} FROM moved
+    ON CONFLICT (mining_account_id, date) DO UPDATE SET
+        {', '.join(f'{field} = EXCLUDED.{field}' for field in STAT_FIELDS)}
+"""
+
+_lock = threading.Lock()
+_watermark = (None, 0.0)
+
+def relation_for(watermark: Optional[datetime.date], date_from: Optional[datetime.date]) -> str:
+    """Таблица или представление для чтения с нижней границей date_from"""
+    if watermark is None or (date_from is not None and date_from >= watermark):
+        return HOT_RELATION
+    return ALL_RELATION
+
+def _cached_watermark():
+    with _lock:
+        value, fetched_at = _watermark
+    return value, time.monotonic() - fetched_at < WATERMARK_TTL
+
+def _store_watermark(value: Optional[datetime.date]):
+    global _watermark
+    with _lock:
+        _watermark = (value, time.monotonic())
+
+def get_watermark(cur) -> Optional[datetime.date]:
+    """Граница архива с кешем на WATERMARK_TTL секунд; до первого переноса None"""
+    value, fresh = _cached_watermark()
+    if fresh:
+        return value
+    cur.execute(WATERMARK_SQL)
+    row = cur.fetchone()
+    value = row[0] if row else None
+    _store_watermark(value)
+    return value
+
+async def get_watermark_async(pool) -> Optional[datetime.date]:
+    """get_watermark для пула или соединения asyncpg"""
+    value, fresh = _cached_watermark()
+    if fresh:
+        return value
+    value = await pool.fetchval(WATERMARK_SQL)
+    _store_watermark(value)
+    return value
+
+def stats_relation(cur, date_from: Optional[datetime.date] = None) -> str:
+    """mining_stats, если диапазон не заходит за границу архива, иначе mining_stats_all"""
+    return relation_for(get_watermark(cur), date_from)
+
+def fetch_newest_first(cur, query: str, args, limit: int, date_from: Optional[datetime.date] = None) -> list:
+    """
+    Страница статистики по убыванию даты; query содержит {relation}, первая колонка — date, LIMIT limit + 1
+
+    Если диапазон заходит за границу архива, сначала читается только горячая
+    таблица: полная страница, целиком не старше границы, совпадает с ответом
+    представления (в архиве только даты до границы), и UNION ALL не нужен.
+    Иначе запрос повторяется по mining_stats_all.
+    """
+    watermark = get_watermark(cur)
+    relation = relation_for(watermark, date_from)
+    if relation != HOT_RELATION:
+        cur.execute(query.format(relation=HOT_RELATION), args)
+        rows = cur.fetchall()
+        if len(rows) > limit and rows[-1][0] >= watermark:
+            return rows
+    cur.execute(query.format(relation=relation), args)
+    return cur.fetchall()
+
+async def fetch_newest_first_async(conn, query: str, args, limit: int,
+                                   date_from: Optional[datetime.date] = None) -> list:
+    """fetch_newest_first для asyncpg"""
+    watermark = await get_watermark_async(conn)
+    relation = relation_for(watermark, date_from)
+    if relation != HOT_RELATION:
+        rows = await conn.fetch(query.format(relation=HOT_RELATION), *args)
+        if len(rows) > limit and rows[-1][0] >= watermark:
+            return rows
+    return await conn.fetch(query.format(relation=relation), *args)
+
+def ensure_partitions(cur, first: datetime.date, last: datetime.date) -> list:
+    """Годовые партиции архива, покрывающие даты first..last"""
+    created = []
+    for year in range(first.year, last.year + 1):
+        name = f'{PARTITION_PREFIX}{year}'
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is None:
+            cur.execute(
+                f"CREATE TABLE {name} PARTITION OF mining_stats_archive FOR VALUES FROM (%s) TO (%s) "
+                f"WITH (fillfactor = 100)",
+                (datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1))
+            )
+            created.append(name)
+    return created
+
+def archive_stats(conn, horizon_days: int = STATS_ARCHIVE_HORIZON_DAYS, batch_days: int = ARCHIVE_BATCH_DAYS,
+                  wait: Optional[float] = None) -> dict:
+    """
+    Перенос строк старше horizon_days в архив пакетами по batch_days дней
+
+    Сначала сдвигается граница: с этого момента чтения старых диапазонов идут
+    через представление и видят строку и до, и после переноса. Перед переносом
+    выдерживается WATERMARK_TTL, чтобы устарели закешированные в контейнерах
+    границы. Каждый пакет — отдельная транзакция DELETE ... RETURNING → INSERT.
+    """
+    started = time.perf_counter()
+    cutoff = datetime.date.today() - datetime.timedelta(days=horizon_days)
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE mining_stats_archive_state
+            SET archived_before = %(cutoff)s, updated_at = NOW()
+            WHERE archived_before IS NULL OR archived_before < %(cutoff)s
+            """,
+            {'cutoff': cutoff}
+        )
+        advanced = cur.rowcount > 0
+        cur.execute("SELECT MIN(date) FROM mining_stats WHERE date < %s", (cutoff,))
+        first = cur.fetchone()[0]
+        conn.commit()
+        if first is None:
+            return {'cutoff': str(cutoff), 'rows_moved': 0, 'batches': 0,
+                    'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+        if advanced:
+            time.sleep(WATERMARK_TTL if wait is None else wait)
+
+        created = ensure_partitions(cur, first, cutoff - datetime.timedelta(days=1))
+        conn.commit()
+        moved = 0
+        batches = 0
+        step = datetime.timedelta(days=max(1, batch_days))
+        batch_start = first
+        while batch_start < cutoff:
+            batch_end = min(batch_start + step, cutoff)
+            cur.execute(MOVE_SQL, {'start': batch_start, 'end': batch_end})
+            moved += cur.rowcount
+            conn.commit()
+            batches += 1
+            batch_start = batch_end
+
+    elapsed = time.perf_counter() - started
+    return {
+        'cutoff': str(cutoff),
+        'from': str(first),
+        'rows_moved': moved,
+        'batches': batches,
+        'partitions_created': created,
+        'elapsed_ms': round(elapsed * 1000, 1)
+    }
+
+def archive_status(conn) -> dict:
+    """Граница, число строк и размер горячей таблицы и архива"""
+    with conn.cursor() as cur:
+        cur.execute(WATERMARK_SQL)
+        row = cur.fetchone()
+        cur.execute(
+            """
+            SELECT
+                (SELECT COUNT(*) FROM mining_stats),
+                pg_total_relation_size('mining_stats'),
+                (SELECT COUNT(*) FROM mining_stats_archive),
+                (SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0)
+                 FROM pg_partition_tree('mining_stats_archive'))
+            """
+        )
+        hot_rows, hot_bytes, archive_rows, archive_bytes = cur.fetchone()
+    conn.rollback()
+    return {
+        'archived_before': str(row[0]) if row and row[0] else None,
+        'hot': {'rows': hot_rows, 'total_bytes': hot_bytes},
+        'archive': {'rows': archive_rows, 'total_bytes': archive_bytes}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['run', 'status'])
+    parser.add_argument('--horizon-days', type=int, default=STATS_ARCHIVE_HORIZON_DAYS)
+    parser.add_argument('--batch-days', type=int, default=ARCHIVE_BATCH_DAYS)
+    parser.add_argument('--wait', type=float, help='пауза после сдвига границы; по умолчанию WATERMARK_TTL')
+    args = parser.parse_args()
+
+    import psycopg2
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        if args.command == 'run':
+            result = archive_stats(conn, args.horizon_days, args.batch_days, args.wait)
+        else:
+            result = archive_status(conn)
+        print(json.dumps(result, default=str))
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Асинхронный вариант API майнинга на asyncpg с тем же контрактом handler(event, context)
+
+Горячие маршруты чтения выполняются корутинами, независимые запросы дашборда
+идут параллельно; остальные маршруты обслуживает синхронный index.handler.
+
+Локальный долгоживущий сервер:
+    python async_index.py --port 8001
+"""
+import datetime
+from typing import Optional
+import index
+from archive import fetch_newest_first_async
+from async_runtime import AsyncRouter, get_async_pool, serve_main, verify_signed_token_async
+from dashboard import fetch_dashboard_async
+from instrumentation import QueryTimings
+from pagination import InvalidPageRequest, decode_cursor, parse_limit, parse_date, split_page
+from routing import Request, HttpError, json_response, error_response
+from session_cache import get_session_cache
+from signed_tokens import claims_to_user, is_signed_token
+
+SESSION_SQL = """
+    SELECT u.id, u.email, u.full_name, u.two_factor_enabled, u.created_at,
+           EXTRACT(EPOCH FROM (s.expires_at - NOW()))::float8 AS expires_in
+    FROM users u
+    JOIN user_sessions s ON u.id = s.user_id
+    WHERE s.session_token = $1 AND s.expires_at > NOW()
+"""
+
+router = AsyncRouter(index.handler, errors={InvalidPageRequest: 400})
+
+def handler(event: dict, context) -> dict:
+    """
+    Асинхронная точка входа API майнинга
+
+    Эндпоинты те же, что у index.handler; корутинами обслуживаются:
+    - GET /accounts?limit=&cursor=
+    - GET /stats/:account_id?from=&to=&limit=&cursor=
+    - GET /dashboard
+    """
+    return router.handler(event, context)
+
+async def get_user_from_session(session_token: str, pool) -> Optional[dict]:
+    """Получение пользователя по токену сессии через кеш сессий"""
+    if is_signed_token(session_token):
+        claims = await verify_signed_token_async(session_token, pool)
+        return claims_to_user(claims) if claims else None
+    cache = get_session_cache()
+    user = cache.get(session_token)
+    if user:
+        return user
+
+    row = await pool.fetchrow(SESSION_SQL, session_token)
+    if row is None:
+        return None
+    user = dict(row)
+    expires_in = user.pop('expires_in')
+    cache.set(session_token, user, expires_in)
+    return user
+
+async def authenticate(request: Request):
+    """Пул и пользователь сессии; HttpError 401 без действительной сессии"""
+    session_token = request.header('X-Session-Token')
+    if not session_token:
+        raise HttpError(401, 'Authentication required')
+    pool = await get_async_pool()
+    request.user = await get_user_from_session(session_token, pool)
+    if not request.user:
+        raise HttpError(401, 'Invalid session')
+    return pool
+
+def _cursor_value(parse, value):
+    try:
+        return parse(value)
+    except (TypeError, ValueError):
+        raise InvalidPageRequest('Invalid cursor')
+
+@router.route('GET', 'accounts')
+async def handle_get_accounts(request: Request) -> dict:
+    """Получение списка майнинг-аккаунтов с keyset-пагинацией по (created_at, id)"""
+    pool = await authenticate(request)
+    limit = parse_limit(request.params.get('limit'), default=100)
+    cursor = decode_cursor(request.params.get('cursor'), 2)
+
+    conditions = ['user_id = $1']
+    args = [request.user['id']]
+    if cursor:
+        conditions.append('(created_at, id) < ($2, $3)')
+        args.extend((_cursor_value(datetime.datetime.fromisoformat, cursor[0]), _cursor_value(int, cursor[1])))
+    args.append(limit + 1)
+
+    rows = await pool.fetch(
+        f"""
+        SELECT id, account_name, hashrate, power_consumption, allocated_hashrate, is_active, created_at
+        FROM mining_accounts
+        WHERE {' AND '.join(conditions)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ${len(args)}
+        """,
+        *args
+    )
+    accounts, next_cursor = split_page([dict(row) for row in rows], limit,
+                                       lambda acc: (acc['created_at'], acc['id']))
+
+    return json_response(200, {'accounts': accounts, 'next_cursor': next_cursor})
+
+@router.route('GET', 'stats/<account_id>')
+async def handle_get_stats(request: Request) -> dict:
+    """Получение статистики по аккаунту с фильтром по датам и keyset-пагинацией"""
+    params = request.params
+    if params.get('resolution') or params.get('points'):
+        return await router.call_fallback(request.event, request.context)
+
+    pool = await authenticate(request)
+    account_id = request.path_params['account_id']
+    if not account_id.isdigit():
+        raise HttpError(404, 'Account not found')
+
+    date_from = parse_date(params.get('from'), 'from')
+    date_to = parse_date(params.get('to'), 'to')
+    limit = parse_limit(params.get('limit'))
+    cursor = decode_cursor(params.get('cursor'), 1)
+
+    conditions = ['mining_account_id = $1']
+    args = [int(account_id)]
+    if date_from:
+        args.append(date_from)
+        conditions.append(f'date >= ${len(args)}')
+    if date_to:
+        args.append(date_to)
+        conditions.append(f'date <= ${len(args)}')
+    if cursor:
+        args.append(_cursor_value(datetime.date.fromisoformat, cursor[0]))
+        conditions.append(f'date < ${len(args)}')
+    args.append(limit + 1)
+
+    async with pool.acquire() as conn:
+        owned = await conn.fetchval(
+            "SELECT 1 FROM mining_accounts WHERE id = $1 AND user_id = $2",
+            int(account_id), request.user['id']
+        )
+        if not owned:
+            return error_response(404, 'Account not found')
+
+        rows = await fetch_newest_first_async(
+            conn,
+            f"""
+            SELECT date, total_hashrate, power_used, btc_mined, revenue_usd, electricity_cost, profit_usd
+            FROM {{relation}}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY date DESC
+            LIMIT ${len(args)}
+            """,
+            args, limit, date_from
+        )
+    stats, next_cursor = split_page([dict(row) for row in rows], limit, lambda row: (row['date'],))
+
+    return json_response(200, {'stats': stats, 'next_cursor': next_cursor})
+
+@router.route('GET', 'dashboard')
+async def handle_get_dashboard(request: Request) -> dict:
+    """Дашборд: проверка сессии и части данных запрашиваются параллельно"""
+    params = request.params
+    if params.get('resolution') or params.get('points'):
+        return await router.call_fallback(request.event, request.context)
+
+    session_token = request.header('X-Session-Token')
+    if not session_token:
+        return error_response(401, 'Authentication required')
+    pool = await get_async_pool()
+    timings = QueryTimings()
+    cache = get_session_cache()
+    if is_signed_token(session_token):
+        known_user = await get_user_from_session(session_token, pool)
+        if not known_user:
+            return error_response(401, 'Invalid session')
+    else:
+        known_user = cache.get(session_token)
+
+    result = await fetch_dashboard_async(pool, timings, session_token=session_token,
+                                         user_id=known_user['id'] if known_user else None)
+    if not result:
+        return error_response(401, 'Invalid session')
+
+    if not known_user:
+        cache.set(session_token, result['user'], result['expires_in'])
+
+    return json_response(200, result['payload'], {
+        'Server-Timing': timings.server_timing(),
+        'Timing-Allow-Origin': '*'
+    })
+
+if __name__ == '__main__':
+    serve_main(router, __doc__)
@@ -0,0 +1,161 @@
+from typing import Optional
+from instrumentation import QueryTimings
+
+SESSION_BY_TOKEN = """
+    SELECT u.id, u.email, u.full_name, u.two_factor_enabled, u.created_at,
+           EXTRACT(EPOCH FROM (s.expires_at - NOW())) AS expires_in
+    FROM users u
+    JOIN user_sessions s ON u.id = s.user_id
+    WHERE s.session_token = %(session_token)s AND s.expires_at > NOW()
+"""
+
+SESSION_BY_USER_ID = """
+    SELECT %(user_id)s::int AS id, NULL::text AS email, NULL::text AS full_name,
+           NULL::boolean AS two_factor_enabled, NULL::timestamp AS created_at, NULL::float AS expires_in
+"""
+
+# Сводка — чтение одной строки user_mining_summary по первичному ключу (поддерживается
+# триггером на mining_accounts); без активных аккаунтов формат тот же, что у SUM по пустому набору
+SUMMARY_COLUMNS = """
+    SELECT
+        COALESCE(s.active_accounts, 0) AS total_accounts,
+        CASE WHEN s.active_accounts > 0 THEN s.total_hashrate::text ELSE '0' END AS total_hashrate,
+        CASE WHEN s.active_accounts > 0 THEN s.total_power::text ELSE '0' END AS total_power
+"""
+
+DASHBOARD_SQL = """
+    WITH session_user AS (
+        {session}
+    ),
+    summary AS (
+        {summary}
+        FROM session_user o
+        LEFT JOIN user_mining_summary s ON s.user_id = o.id
+    ),
+    recent_stats AS (
+        SELECT date::text AS date, profit_usd::text AS daily_profit, btc_mined::text AS daily_btc
+        FROM user_stats_daily
+        WHERE user_id = (SELECT id FROM session_user)
+        ORDER BY date DESC
+        LIMIT 7
+    ),
+    subscription AS (
+        SELECT plan_name, price_usd::text AS price_usd, hashrate_allocation::text AS hashrate_allocation,
+               status, expires_at::text AS expires_at
+        FROM subscriptions
+        WHERE user_id = (SELECT id FROM session_user) AND status = 'active'
+        ORDER BY expires_at DESC
+        LIMIT 1
+    )
+    SELECT
+        su.id, su.email, su.full_name, su.two_factor_enabled, su.created_at, su.expires_in,
+        (SELECT row_to_json(summary) FROM summary) AS summary,
+        COALESCE((SELECT json_agg(recent_stats ORDER BY recent_stats.date DESC) FROM recent_stats), '[]'::json) AS recent_stats,
+        (SELECT row_to_json(subscription) FROM subscription) AS subscription
+    FROM session_user su
+"""
+
+USER_COLUMNS = ('id', 'email', 'full_name', 'two_factor_enabled', 'created_at', 'expires_in')
+
+def fetch_dashboard(conn, timings: QueryTimings, session_token: Optional[str] = None,
+                    user_id: Optional[int] = None) -> Optional[dict]:
+    """
+    Весь дашборд одним запросом: проверка сессии, сводка, последние дни и подписка
+
+    Если пользователь уже известен (кеш сессий), передаётся user_id и проверка
+    сессии в запросе пропускается. Возвращает None для недействительной сессии;
+    иначе словарь с ключами user, expires_in и payload.
+    """
+    session = SESSION_BY_USER_ID if user_id is not None else SESSION_BY_TOKEN
+    with conn.cursor() as cur:
+        with timings.measure('dashboard'):
+            cur.execute(DASHBOARD_SQL.format(session=session, summary=SUMMARY_COLUMNS.strip()),
+                        {'session_token': session_token, 'user_id': user_id})
+            row = cur.fetchone()
+
+    if row is None:
+        return None
+    user = dict(zip(USER_COLUMNS, row[:len(USER_COLUMNS)]))
+    summary, recent_stats, subscription = row[len(USER_COLUMNS):]
+    return {
+        'user': user,
+        'expires_in': user.pop('expires_in'),
+        'payload': {
+            'summary': summary or {},
+            'recent_stats': recent_stats,
+            'subscription': subscription
+        }
+    }
+
+ASYNC_SESSION_SQL = """
+    SELECT u.id, u.email, u.full_name, u.two_factor_enabled, u.created_at,
+           EXTRACT(EPOCH FROM (s.expires_at - NOW()))::float8 AS expires_in
+    FROM users u
+    JOIN user_sessions s ON u.id = s.user_id
+    WHERE s.session_token = $1 AND s.expires_at > NOW()
+"""
+
+OWNER_BY_TOKEN = "(SELECT user_id FROM user_sessions WHERE session_token = $1 AND expires_at > NOW())"
+OWNER_BY_USER_ID = "$1::int"
+
+ASYNC_SUMMARY_SQL = SUMMARY_COLUMNS + """
+    FROM (SELECT {owner} AS id) o
+    LEFT JOIN user_mining_summary s ON s.user_id = o.id
+"""
+
+ASYNC_RECENT_STATS_SQL = """
+    SELECT date::text AS date, profit_usd::text AS daily_profit, btc_mined::text AS daily_btc
+    FROM user_stats_daily
+    WHERE user_id = {owner}
+    ORDER BY date DESC
+    LIMIT 7
+"""
+
+ASYNC_SUBSCRIPTION_SQL = """
+    SELECT plan_name, price_usd::text AS price_usd, hashrate_allocation::text AS hashrate_allocation,
+           status, expires_at::text AS expires_at
+    FROM subscriptions
+    WHERE user_id = {owner} AND status = 'active'
+    ORDER BY expires_at DESC
+    LIMIT 1
+"""
+
+async def _timed(timings: QueryTimings, name: str, query):
+    with timings.measure(name):
+        return await query
+
+async def fetch_dashboard_async(pool, timings: QueryTimings, session_token: Optional[str] = None,
+                                user_id: Optional[int] = None) -> Optional[dict]:
+    """
+    Дашборд через asyncpg: независимые части запрашиваются параллельно на разных соединениях
+
+    Владелец в каждом запросе задаётся подзапросом по токену, поэтому проверка
+    сессии идёт одновременно с остальными, а не перед ними. Результат тот же, что у fetch_dashboard.
+    """
+    import asyncio
+    owner = OWNER_BY_USER_ID if user_id is not None else OWNER_BY_TOKEN
+    arg = user_id if user_id is not None else session_token
+    queries = [
+        _timed(timings, 'summary', pool.fetchrow(ASYNC_SUMMARY_SQL.format(owner=owner), arg)),
+        _timed(timings, 'recent_stats', pool.fetch(ASYNC_RECENT_STATS_SQL.format(owner=owner), arg)),
+        _timed(timings, 'subscription', pool.fetchrow(ASYNC_SUBSCRIPTION_SQL.format(owner=owner), arg)),
+    ]
+    if user_id is None:
+        queries.append(_timed(timings, 'session', pool.fetchrow(ASYNC_SESSION_SQL, session_token)))
+    summary, recent_stats, subscription, *session = await asyncio.gather(*queries)
+
+    if user_id is None:
+        if session[0] is None:
+            return None
+        user = dict(session[0])
+    else:
+        user = dict(zip(USER_COLUMNS, (user_id, None, None, None, None, None)))
+    return {
+        'user': user,
+        'expires_in': user.pop('expires_in'),
+        'payload': {
+            'summary': dict(summary),
+            'recent_stats': [dict(row) for row in recent_stats],
+            'subscription': dict(subscription) if subscription else None
+        }
+    }
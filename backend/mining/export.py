@@ -0,0 +1,173 @@
+"""
+Выгрузка истории mining_stats в CSV или JSON-lines через серверный курсор
+
+Строки читаются блоками по chunk_size, поэтому память не зависит от объёма
+истории; формат совместим с пакетной загрузкой stats/ingest.
+
+Запуск: python export.py --user-id N [--accounts 1,2] [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+                         [--format csv|jsonl] [--gzip] [--output FILE]
+"""
+import argparse
+import csv
+import datetime
+import io
+import os
+import sys
+import zlib
+from typing import Iterator, List, Optional
+from archive import stats_relation
+from encoding import dumps
+from ingest import STAT_FIELDS
+from pagination import InvalidPageRequest
+
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '2000'))
+EXPORT_MAX_BODY_BYTES = int(os.environ.get('EXPORT_MAX_BODY_BYTES', str(5 * 1024 * 1024)))
+EXPORT_MAX_ACCOUNTS = 500
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_COLUMNS = ('mining_account_id', 'date') + STAT_FIELDS + ('account_name',)
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+
+class ExportTooLarge(Exception):
+    """Выгрузка не помещается в ответ функции"""
+
+def parse_format(value: Optional[str]) -> str:
+    """Формат выгрузки: csv или jsonl"""
+    fmt = (value or 'csv').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise InvalidPageRequest(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    return fmt
+
+def parse_account_ids(value: Optional[str]) -> Optional[List[int]]:
+    """Список аккаунтов через запятую; None — все аккаунты пользователя"""
+    if not value:
+        return None
+    try:
+        ids = sorted({int(part) for part in value.split(',') if part.strip()})
+    except ValueError:
+        raise InvalidPageRequest('accounts must be a comma-separated list of ids')
+    if not ids or len(ids) > EXPORT_MAX_ACCOUNTS:
+        raise InvalidPageRequest(f'accounts must list 1..{EXPORT_MAX_ACCOUNTS} ids')
+    return ids
+
+def iter_rows(conn, user_id: int, account_ids: Optional[List[int]] = None,
+              date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+              chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    """
+    Блоки строк всех выбранных аккаунтов за один проход серверного курсора
+
+    Порядок (mining_account_id, date) совпадает с индексом idx_mining_stats_account_date.
+    Диапазон, заходящий за границу архива, читается через mining_stats_all.
+    """
+    conditions = ['ma.user_id = %(user_id)s']
+    if account_ids:
+        conditions.append('ma.id = ANY(%(account_ids)s)')
+    if date_from:
+        conditions.append('ms.date >= %(date_from)s')
+    if date_to:
+        conditions.append('ms.date <= %(date_to)s')
+    columns = ', '.join(f'ms.{field}' for field in STAT_FIELDS)
+    with conn.cursor() as cur:
+        relation = stats_relation(cur, date_from)
+    with conn.cursor(name='mining_stats_export') as cur:
+        cur.itersize = chunk_size
+        cur.execute(
+            f"""
+            SELECT ms.mining_account_id, ms.date, {columns}, ma.account_name
+            FROM {relation} ms
+            JOIN mining_accounts ma ON ma.id = ms.mining_account_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY ms.mining_account_id, ms.date
+            """,
+            {'user_id': user_id, 'account_ids': account_ids, 'date_from': date_from, 'date_to': date_to}
+        )
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    conn.rollback()
+
+def _csv_value(value):
+    return '' if value is None else value
+
+def iter_text(chunks: Iterator[list], fmt: str) -> Iterator[str]:
+    """Блоки строк в текст CSV (с заголовком) или JSON-lines"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in chunks:
+            writer.writerows([_csv_value(v) for v in row] for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+        return
+    for rows in chunks:
+        yield ''.join(dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n' for row in rows)
+
+def iter_bytes(texts: Iterator[str], compress: bool) -> Iterator[bytes]:
+    """Текст в UTF-8, при compress — потоковое сжатие gzip"""
+    if not compress:
+        for text in texts:
+            yield text.encode('utf-8')
+        return
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for text in texts:
+        data = compressor.compress(text.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_body(conn, user_id: int, fmt: str, compress: bool, account_ids: Optional[List[int]] = None,
+                date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                max_bytes: int = EXPORT_MAX_BODY_BYTES) -> tuple:
+    """
+    Тело ответа функции и число строк
+
+    Ответ облачной функции передаётся целиком, поэтому блоки собираются в буфер
+    с пределом max_bytes; с gzip в буфере лежат уже сжатые данные.
+    """
+    counter = [0]
+
+    def counted(chunks):
+        for rows in chunks:
+            counter[0] += len(rows)
+            yield rows
+
+    body = bytearray()
+    rows = iter_rows(conn, user_id, account_ids, date_from, date_to)
+    for data in iter_bytes(iter_text(counted(rows), fmt), compress):
+        body += data
+        if len(body) > max_bytes:
+            rows.close()
+            raise ExportTooLarge(f'Export exceeds {max_bytes} bytes; narrow the date range or use gzip=1')
+    return bytes(body), counter[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--accounts', type=parse_account_ids)
+    parser.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat)
+    parser.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat)
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument('--output', help='файл; по умолчанию stdout')
+    args = parser.parse_args()
+
+    import psycopg2
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        chunks = iter_rows(conn, args.user_id, args.accounts, args.date_from, args.date_to, args.chunk_size)
+        for data in iter_bytes(iter_text(chunks, args.format), args.gzip):
+            out.write(data)
+    finally:
+        if args.output:
+            out.close()
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,251 +1,358 @@
-import json
-import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import startup_profile
+import base64
 import datetime
-from decimal import Decimal
-
-def get_db_connection():
-    """Подключение к базе данных"""
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn)
+from db_pool import connection_middleware
+from encoding import row_to_dict, rows_to_dicts
+from routing import preflight_response, Router, Request, HttpError, map_errors, json_response, error_response
+from session_cache import get_session_cache
+from tracing import traced_phase
+from ingest import ingest_stats, detect_format
+from pagination import InvalidPageRequest, decode_cursor, parse_limit, parse_date, split_page
+from aggregation import fetch_series, parse_resolution, parse_points
+from archive import fetch_newest_first
+from dashboard import fetch_dashboard
+from projection import load_accounts, parse_amount, parse_values, project
+from export import ExportTooLarge, CONTENT_TYPES, export_body, parse_account_ids, parse_format
+from accounts import provision_accounts
+from orders import create_order, list_orders, order_summary, parse_statuses
+from instrumentation import QueryTimings
+from signed_tokens import claims_to_user, is_signed_token, verify_signed_token
 
+@traced_phase('session')
 def get_user_from_session(session_token: str, conn):
-    """Получение пользователя по токену сессии"""
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+    """Получение пользователя по токену сессии: подписанный проверяется без базы, остальные через кеш сессий"""
+    if is_signed_token(session_token):
+        claims = verify_signed_token(session_token, conn)
+        return claims_to_user(claims) if claims else None
+    cache = get_session_cache()
+    user = cache.get(session_token)
+    if user:
+        return user
+    
+    with conn.cursor() as cur:
         cur.execute(
             """
-            SELECT u.id, u.email, u.full_name
+            SELECT u.id, u.email, u.full_name, u.two_factor_enabled, u.created_at,
+                   EXTRACT(EPOCH FROM (s.expires_at - NOW())) AS expires_in
             FROM users u
             JOIN user_sessions s ON u.id = s.user_id
             WHERE s.session_token = %s AND s.expires_at > NOW()
             """,
             (session_token,)
         )
-        return cur.fetchone()
+        row = row_to_dict(cur, cur.fetchone())
+    
+    if not row:
+        return None
+    user = row
+    expires_in = float(user.pop('expires_in'))
+    cache.set(session_token, user, expires_in)
+    return user
+
+def require_session_token(request: Request, call_next) -> dict:
+    """Middleware: токен сессии обязателен"""
+    if not request.header('X-Session-Token'):
+        return error_response(401, 'Authentication required')
+    return call_next(request)
+
+def authenticated(request: Request, call_next) -> dict:
+    """Middleware: пользователь сессии в request.user"""
+    request.user = get_user_from_session(request.header('X-Session-Token'), request.conn)
+    if not request.user:
+        return error_response(401, 'Invalid session')
+    return call_next(request)
+
+router = Router(middleware=(
+    map_errors({InvalidPageRequest: 400, ExportTooLarge: 413}),
+    require_session_token,
+    connection_middleware,
+))
+AUTHENTICATED = (authenticated,)
+# Как и до роутера: без действующей сессии неизвестный action получает 401, а не 404
+router.not_found(AUTHENTICATED)
 
 def handler(event: dict, context) -> dict:
     """
     API для управления майнинг-аккаунтами и статистикой
     
     Эндпоинты:
-    - GET /accounts - Получение списка майнинг-аккаунтов пользователя
+    - GET /accounts?limit=&cursor= - Постраничный список майнинг-аккаунтов пользователя
     - POST /accounts - Создание нового майнинг-аккаунта
-    - GET /stats/:account_id - Получение статистики по аккаунту
-    - GET /dashboard - Получение данных дашборда
-    """
+    - POST /accounts/batch - Пакетное создание и изменение аккаунтов ({"accounts": [...]}), результат по каждому
+    - GET /stats/:account_id?from=&to=&limit=&cursor= - Постраничная статистика по аккаунту
+    - GET /stats/:account_id?resolution=day|week|month&points=N - Агрегированный ряд для графиков
+    - POST /stats/ingest - Пакетная загрузка статистики (JSON-lines или CSV)
+    - GET /dashboard[?resolution=&from=&to=&points=] - Получение данных дашборда, с рядом для графиков
+    - GET /orders?status=open|pending,...&limit=&cursor= - Постраничный список заказов оборудования
+    - POST /orders - Создание заказа оборудования
+    - GET /orders/summary - Итоги заказов по статусам и оборудованию
+    - GET /export?format=csv|jsonl&accounts=&from=&to=&gzip=1 - Выгрузка всей истории статистики
+    - GET /projection?price=&difficulty=&electricity_rate=&difficulty_growth=&capex= - Прогноз прибыли по сетке сценариев
     
-    method = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    Preflight OPTIONS отвечает до роутера и соединения с базой.
+    """
+    if event.get('httpMethod') == 'OPTIONS':
+        response = preflight_response()
+        startup_profile.first_response('OPTIONS', response)
+        return response
+    response = router.dispatch(event, context)
+    if startup_profile.STARTUP_PROFILE:
+        params = event.get('queryStringParameters') or {}
+        startup_profile.first_response(f"{event.get('httpMethod', 'GET')} {params.get('action', '')}", response)
+    return response
+
+@router.route('GET', 'accounts', AUTHENTICATED)
+def handle_get_accounts(request: Request) -> dict:
+    """Получение списка майнинг-аккаунтов с keyset-пагинацией по (created_at, id)"""
+    limit = parse_limit(request.params.get('limit'), default=100)
+    cursor = decode_cursor(request.params.get('cursor'), 2)
     
-    path = event.get('queryStringParameters', {}).get('action', '') if event.get('queryStringParameters') else ''
+    conditions = ['user_id = %s']
+    args = [request.user['id']]
+    if cursor:
+        conditions.append('(created_at, id) < (%s::timestamp, %s)')
+        args.extend(cursor)
+    args.append(limit + 1)
     
-    try:
-        conn = get_db_connection()
-        
-        session_token = event.get('headers', {}).get('X-Session-Token')
-        if not session_token:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Authentication required'}),
-                'isBase64Encoded': False
-            }
-        
-        user = get_user_from_session(session_token, conn)
-        if not user:
-            return {
-                'statusCode': 401,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Invalid session'}),
-                'isBase64Encoded': False
-            }
-        
-        if method == 'GET' and path == 'accounts':
-            return handle_get_accounts(user, conn)
-        elif method == 'POST' and path == 'accounts':
-            return handle_create_account(user, event, conn)
-        elif method == 'GET' and path.startswith('stats/'):
-            account_id = path.split('/')[-1]
-            return handle_get_stats(user, account_id, conn)
-        elif method == 'GET' and path == 'dashboard':
-            return handle_get_dashboard(user, conn)
-        else:
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Endpoint not found'}),
-                'isBase64Encoded': False
-            }
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
-    finally:
-        if 'conn' in locals():
-            conn.close()
-
-def handle_get_accounts(user: dict, conn) -> dict:
-    """Получение списка майнинг-аккаунтов"""
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+    with request.conn.cursor() as cur:
         cur.execute(
-            """
-            SELECT id, account_name, hashrate, power_consumption, is_active, created_at
+            f"""
+            SELECT id, account_name, hashrate, power_consumption, allocated_hashrate, is_active, created_at
             FROM mining_accounts
-            WHERE user_id = %s
-            ORDER BY created_at DESC
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
             """,
-            (user['id'],)
+            args
         )
-        accounts = cur.fetchall()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'accounts': [dict(acc) for acc in accounts]}, default=str),
-            'isBase64Encoded': False
-        }
-
-def handle_create_account(user: dict, event: dict, conn) -> dict:
+        accounts, next_cursor = split_page(
+            rows_to_dicts(cur, cur.fetchall()), limit, lambda acc: (acc['created_at'], acc['id'])
+        )
+    
+    return json_response(200, {'accounts': accounts, 'next_cursor': next_cursor})
+
+@router.route('POST', 'accounts', AUTHENTICATED)
+def handle_create_account(request: Request) -> dict:
     """Создание нового майнинг-аккаунта"""
-    data = json.loads(event.get('body', '{}'))
+    data = request.json_body()
     
     account_name = data.get('account_name')
     hashrate = data.get('hashrate', 0)
     power_consumption = data.get('power_consumption', 0)
     
     if not account_name:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Account name is required'}),
-            'isBase64Encoded': False
-        }
-    
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        return error_response(400, 'Account name is required')
+    
+    conn = request.conn
+    with conn.cursor() as cur:
         cur.execute(
             """
             INSERT INTO mining_accounts (user_id, account_name, hashrate, power_consumption)
             VALUES (%s, %s, %s, %s)
             RETURNING id, account_name, hashrate, power_consumption, is_active, created_at
             """,
-            (user['id'], account_name, hashrate, power_consumption)
+            (request.user['id'], account_name, hashrate, power_consumption)
         )
-        account = cur.fetchone()
+        account = row_to_dict(cur, cur.fetchone())
         conn.commit()
-        
-        return {
-            'statusCode': 201,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'account': dict(account)}, default=str),
-            'isBase64Encoded': False
-        }
-
-def handle_get_stats(user: dict, account_id: str, conn) -> dict:
-    """Получение статистики по аккаунту"""
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+    
+    return json_response(201, {'account': account})
+
+@router.route('POST', 'accounts/batch', AUTHENTICATED)
+def handle_batch_accounts(request: Request) -> dict:
+    """Пакетное создание (без id) и изменение (с id) майнинг-аккаунтов в одной транзакции"""
+    items = request.json_body().get('accounts')
+    
+    report = provision_accounts(request.conn, request.user['id'], items)
+    return json_response(200, report)
+
+@router.route('GET', 'stats/<account_id>', AUTHENTICATED)
+def handle_get_stats(request: Request) -> dict:
+    """Получение статистики по аккаунту с фильтром по датам и keyset-пагинацией"""
+    account_id = request.path_params['account_id']
+    if not account_id.isdigit():
+        raise HttpError(404, 'Account not found')
+    
+    params = request.params
+    date_from = parse_date(params.get('from'), 'from')
+    date_to = parse_date(params.get('to'), 'to')
+    limit = parse_limit(params.get('limit'))
+    cursor = decode_cursor(params.get('cursor'), 1)
+    
+    conditions = ['mining_account_id = %s']
+    args = [account_id]
+    if date_from:
+        conditions.append('date >= %s')
+        args.append(date_from)
+    if date_to:
+        conditions.append('date <= %s')
+        args.append(date_to)
+    if cursor:
+        conditions.append('date < %s::date')
+        args.append(cursor[0])
+    args.append(limit + 1)
+    
+    with request.conn.cursor() as cur:
         cur.execute(
             """
             SELECT ma.id
             FROM mining_accounts ma
             WHERE ma.id = %s AND ma.user_id = %s
             """,
-            (account_id, user['id'])
+            (account_id, request.user['id'])
         )
         
         if not cur.fetchone():
-            return {
-                'statusCode': 404,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Account not found'}),
-                'isBase64Encoded': False
-            }
+            return error_response(404, 'Account not found')
         
-        cur.execute(
-            """
+        if params.get('resolution') or params.get('points'):
+            resolution = parse_resolution(params.get('resolution'))
+            series = fetch_series(cur, 'account', int(account_id), resolution, date_from, date_to,
+                                  parse_points(params.get('points')))
+            return json_response(200, {'resolution': resolution, 'series': series})
+        
+        rows = fetch_newest_first(
+            cur,
+            f"""
             SELECT date, total_hashrate, power_used, btc_mined, revenue_usd, electricity_cost, profit_usd
-            FROM mining_stats
-            WHERE mining_account_id = %s
+            FROM {{relation}}
+            WHERE {' AND '.join(conditions)}
             ORDER BY date DESC
-            LIMIT 30
-            """,
-            (account_id,)
-        )
-        stats = cur.fetchall()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'stats': [dict(s) for s in stats]}, default=str),
-            'isBase64Encoded': False
-        }
-
-def handle_get_dashboard(user: dict, conn) -> dict:
-    """Получение данных для дашборда"""
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            """
-            SELECT 
-                COUNT(*) as total_accounts,
-                COALESCE(SUM(hashrate), 0) as total_hashrate,
-                COALESCE(SUM(power_consumption), 0) as total_power
-            FROM mining_accounts
-            WHERE user_id = %s AND is_active = TRUE
+            LIMIT %s
             """,
-            (user['id'],)
+            args, limit, date_from
         )
-        summary = cur.fetchone()
-        
-        cur.execute(
-            """
-            SELECT 
-                ms.date,
-                COALESCE(SUM(ms.profit_usd), 0) as daily_profit,
-                COALESCE(SUM(ms.btc_mined), 0) as daily_btc
-            FROM mining_stats ms
-            JOIN mining_accounts ma ON ms.mining_account_id = ma.id
-            WHERE ma.user_id = %s
-            GROUP BY ms.date
-            ORDER BY ms.date DESC
-            LIMIT 7
-            """,
-            (user['id'],)
-        )
-        recent_stats = cur.fetchall()
-        
-        cur.execute(
-            """
-            SELECT plan_name, price_usd, hashrate_allocation, status, expires_at
-            FROM subscriptions
-            WHERE user_id = %s AND status = 'active'
-            ORDER BY expires_at DESC
-            LIMIT 1
-            """,
-            (user['id'],)
-        )
-        subscription = cur.fetchone()
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'summary': dict(summary) if summary else {},
-                'recent_stats': [dict(s) for s in recent_stats],
-                'subscription': dict(subscription) if subscription else None
-            }, default=str),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        stats, next_cursor = split_page(rows_to_dicts(cur, rows), limit, lambda row: (row['date'],))
+    
+    return json_response(200, {'stats': stats, 'next_cursor': next_cursor})
+
+@router.route('POST', 'stats/ingest', AUTHENTICATED)
+def handle_ingest_stats(request: Request) -> dict:
+    """Пакетная загрузка статистики через COPY"""
+    body = request.body
+    
+    if not body.strip():
+        return error_response(400, 'Request body is empty')
+    
+    report = ingest_stats(request.conn, request.user['id'], body, detect_format(request.event))
+    return json_response(200, report)
+
+@router.route('GET', 'dashboard')
+def handle_get_dashboard(request: Request) -> dict:
+    """Получение данных для дашборда одним обращением к базе вместе с проверкой сессии"""
+    session_token = request.header('X-Session-Token')
+    params = request.params
+    timings = QueryTimings()
+    cache = get_session_cache()
+    if is_signed_token(session_token):
+        known_user = get_user_from_session(session_token, request.conn)
+        if not known_user:
+            return error_response(401, 'Invalid session')
+    else:
+        known_user = cache.get(session_token)
+    
+    result = fetch_dashboard(request.conn, timings, session_token=session_token,
+                             user_id=known_user['id'] if known_user else None)
+    if not result:
+        return error_response(401, 'Invalid session')
+    
+    user = known_user or result['user']
+    if not known_user:
+        cache.set(session_token, user, float(result['expires_in']))
+    payload = result['payload']
+    
+    if params.get('resolution') or params.get('points'):
+        payload['resolution'] = parse_resolution(params.get('resolution'))
+        with request.conn.cursor() as cur, timings.measure('series'):
+            payload['series'] = fetch_series(
+                cur, 'user', user['id'], payload['resolution'],
+                parse_date(params.get('from'), 'from'), parse_date(params.get('to'), 'to'),
+                parse_points(params.get('points'))
+            )
+    
+    return json_response(200, payload, {
+        'Server-Timing': timings.server_timing(),
+        'Timing-Allow-Origin': '*'
+    })
+
+@router.route('GET', 'projection', AUTHENTICATED)
+def handle_get_projection(request: Request) -> dict:
+    """Прогноз добычи, прибыли и окупаемости на 30/90/365 дней по сетке сценариев"""
+    params = request.params
+    prices = parse_values(params.get('price'), 'price')
+    if not prices:
+        return error_response(400, 'price is required')
+    difficulties = parse_values(params.get('difficulty'), 'difficulty', minimum=1)
+    rates = parse_values(params.get('electricity_rate'), 'electricity_rate')
+    growths = parse_values(params.get('difficulty_growth'), 'difficulty_growth', default=[0.0], minimum=-0.5)
+    current_difficulty = parse_amount(params.get('current_difficulty'), 'current_difficulty')
+    capex = parse_amount(params.get('capex'), 'capex')
+    
+    with request.conn.cursor() as cur:
+        accounts = load_accounts(cur, request.user['id'])
+    
+    result = project(accounts, prices, difficulties, rates, growths, current_difficulty, capex)
+    return json_response(200, result)
+
+@router.route('GET', 'orders', AUTHENTICATED)
+def handle_get_orders(request: Request) -> dict:
+    """Получение заказов оборудования с фильтром по статусу и keyset-пагинацией по (created_at, id)"""
+    params = request.params
+    limit = parse_limit(params.get('limit'))
+    cursor = decode_cursor(params.get('cursor'), 2)
+    statuses = parse_statuses(params.get('status'))
+    
+    with request.conn.cursor() as cur:
+        orders, next_cursor = list_orders(cur, request.user['id'], limit, cursor, statuses)
+    
+    return json_response(200, {'orders': orders, 'next_cursor': next_cursor})
+
+@router.route('POST', 'orders', AUTHENTICATED)
+def handle_create_order(request: Request) -> dict:
+    """Создание заказа оборудования"""
+    data = request.json_body()
+    
+    conn = request.conn
+    with conn.cursor() as cur:
+        try:
+            order = create_order(cur, request.user['id'], data)
+        except ValueError as e:
+            return error_response(400, str(e))
+        conn.commit()
+    
+    return json_response(201, {'order': order})
+
+@router.route('GET', 'orders/summary', AUTHENTICATED)
+def handle_get_order_summary(request: Request) -> dict:
+    """Итоги заказов пользователя по статусам, по оборудованию и в целом одним запросом"""
+    with request.conn.cursor() as cur:
+        summary = order_summary(cur, request.user['id'])
+    
+    return json_response(200, summary)
+
+@router.route('GET', 'export', AUTHENTICATED)
+def handle_export(request: Request) -> dict:
+    """Выгрузка истории статистики по аккаунтам пользователя в CSV или JSON-lines"""
+    params = request.params
+    fmt = parse_format(params.get('format'))
+    compress = params.get('gzip') in ('1', 'true')
+    account_ids = parse_account_ids(params.get('accounts'))
+    date_from = parse_date(params.get('from'), 'from')
+    date_to = parse_date(params.get('to'), 'to')
+    
+    body, rows = export_body(request.conn, request.user['id'], fmt, compress, account_ids, date_from, date_to)
+    filename = f"mining-stats-{datetime.date.today().isoformat()}.{fmt}{'.gz' if compress else ''}"
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/gzip' if compress else CONTENT_TYPES[fmt],
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'Content-Disposition, X-Export-Rows',
+            'X-Export-Rows': str(rows)
+        },
+        'body': base64.b64encode(body).decode('ascii') if compress else body.decode('utf-8'),
+        'isBase64Encoded': compress
+    }
+
+startup_profile.module_loaded()
@@ -0,0 +1,230 @@
+import csv
+import datetime
+import io
+import json
+import time
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import Iterator, List, Optional
+from rollups import refresh_rollups
+
+STAT_FIELDS = ('total_hashrate', 'power_used', 'btc_mined', 'revenue_usd', 'electricity_cost', 'profit_usd')
+COPY_COLUMNS = ('line_no', 'mining_account_id', 'date') + STAT_FIELDS
+MAX_REPORTED_ERRORS = 20
+FIELD_LIMITS = {
+    'total_hashrate': Decimal('1e18'),
+    'power_used': Decimal('1e8'),
+    'btc_mined': Decimal('1e10'),
+    'revenue_usd': Decimal('1e10'),
+    'electricity_cost': Decimal('1e10'),
+    'profit_usd': Decimal('1e10'),
+}
+FIELD_SCALES = {
+    'total_hashrate': Decimal('0.01'),
+    'power_used': Decimal('0.01'),
+    'btc_mined': Decimal('0.00000001'),
+    'revenue_usd': Decimal('0.01'),
+    'electricity_cost': Decimal('0.01'),
+    'profit_usd': Decimal('0.01'),
+}
+MAX_ACCOUNT_ID = 2 ** 31 - 1
+
+STAGING_TABLE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS mining_stats_staging (
+        line_no INTEGER NOT NULL,
+        mining_account_id INTEGER NOT NULL,
+        date DATE NOT NULL,
+        total_hashrate DECIMAL(20, 2),
+        power_used DECIMAL(10, 2),
+        btc_mined DECIMAL(18, 8),
+        revenue_usd DECIMAL(12, 2),
+        electricity_cost DECIMAL(12, 2),
+        profit_usd DECIMAL(12, 2)
+    ) ON COMMIT DELETE ROWS
+"""
+
+MERGE_SQL = """
+    INSERT INTO mining_stats (
+        mining_account_id, date, total_hashrate, power_used,
+        btc_mined, revenue_usd, electricity_cost, profit_usd
+    )
+    SELECT DISTINCT ON (s.mining_account_id, s.date)
+        s.mining_account_id, s.date, s.total_hashrate, s.power_used,
+        s.btc_mined, s.revenue_usd, s.electricity_cost, s.profit_usd
+    FROM mining_stats_staging s
+    JOIN mining_accounts ma ON ma.id = s.mining_account_id
+    WHERE ma.user_id = %s
+    ORDER BY s.mining_account_id, s.date, s.line_no DESC
+    ON CONFLICT (mining_account_id, date) DO UPDATE SET
+        total_hashrate = EXCLUDED.total_hashrate,
+        power_used = EXCLUDED.power_used,
+        btc_mined = EXCLUDED.btc_mined,
+        revenue_usd = EXCLUDED.revenue_usd,
+        electricity_cost = EXCLUDED.electricity_cost,
+        profit_usd = EXCLUDED.profit_usd
+    RETURNING mining_account_id, date
+"""
+
+class IngestReport:
+    """Итог загрузки: принятые и отклонённые строки"""
+
+    def __init__(self):
+        self.received = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line_no: int, reason: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_no, 'error': reason})
+
+class _CopyStream(io.TextIOBase):
+    """Файлоподобный поток для COPY, формирующий строки по мере чтения"""
+
+    def __init__(self, lines: Iterator[str]):
+        self._lines = lines
+        self._buffer = ''
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            chunk, self._buffer = self._buffer, ''
+        else:
+            chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+def detect_format(event: dict) -> str:
+    """Формат тела: параметр format или Content-Type"""
+    params = event.get('queryStringParameters') or {}
+    fmt = (params.get('format') or '').lower()
+    if fmt in ('csv', 'jsonl'):
+        return fmt
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    return 'csv' if 'csv' in headers.get('content-type', '') else 'jsonl'
+
+def iter_records(body: str, fmt: str, report: IngestReport) -> Iterator[tuple]:
+    """Разбор JSON-lines или CSV в пары (номер строки, словарь)"""
+    if fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(body))
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_no, line in enumerate(io.StringIO(body), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            report.received += 1
+            report.reject(line_no, 'Invalid JSON')
+            continue
+        if not isinstance(record, dict):
+            report.received += 1
+            report.reject(line_no, 'Row must be an object')
+            continue
+        yield line_no, record
+
+def _decimal(value) -> Optional[Decimal]:
+    if value is None or value == '':
+        return None
+    result = Decimal(str(value))
+    if not result.is_finite():
+        raise InvalidOperation
+    return result
+
+def validate_record(record: dict) -> tuple:
+    """Приведение строки к типам таблицы; ValueError при ошибке"""
+    try:
+        account_id = int(record.get('mining_account_id'))
+    except (TypeError, ValueError):
+        raise ValueError('mining_account_id must be an integer')
+    if not 1 <= account_id <= MAX_ACCOUNT_ID:
+        raise ValueError('mining_account_id is out of range')
+    try:
+        date = datetime.date.fromisoformat(str(record.get('date')))
+    except ValueError:
+        raise ValueError('date must be YYYY-MM-DD')
+    try:
+        values = {field: _decimal(record.get(field)) for field in STAT_FIELDS}
+    except InvalidOperation:
+        raise ValueError('stat values must be numeric')
+    for field, value in values.items():
+        if value is None:
+            continue
+        # Сравнение после округления до масштаба колонки: 99999999.999 в DECIMAL(10, 2) уже переполнение
+        if abs(value) >= FIELD_LIMITS[field]:
+            raise ValueError(f'{field} is out of range')
+        value = values[field] = value.quantize(FIELD_SCALES[field], rounding=ROUND_HALF_UP)
+        if abs(value) >= FIELD_LIMITS[field]:
+            raise ValueError(f'{field} is out of range')
+    if values['profit_usd'] is None and values['revenue_usd'] is not None and values['electricity_cost'] is not None:
+        values['profit_usd'] = values['revenue_usd'] - values['electricity_cost']
+    return (account_id, date) + tuple(values[field] for field in STAT_FIELDS)
+
+def _copy_value(value) -> str:
+    return '\\N' if value is None else str(value)
+
+def _copy_lines(body: str, fmt: str, report: IngestReport) -> Iterator[str]:
+    for line_no, record in iter_records(body, fmt, report):
+        report.received += 1
+        try:
+            row = validate_record(record)
+        except ValueError as e:
+            report.reject(line_no, str(e))
+            continue
+        yield '\t'.join(_copy_value(v) for v in (line_no,) + row) + '\n'
+
+def ingest_stats(conn, user_id: int, body: str, fmt: str) -> dict:
+    """
+    Загрузка статистики через COPY во временную таблицу и слияние в mining_stats
+
+    Ключ UNIQUE(mining_account_id, date) делает повторную загрузку идемпотентной;
+    при дублях внутри одного тела побеждает последняя строка. Строки чужих
+    аккаунтов отклоняются. Агрегаты пересчитываются в той же транзакции.
+    """
+    started = time.perf_counter()
+    report = IngestReport()
+
+    with conn.cursor() as cur:
+        cur.execute(STAGING_TABLE_SQL)
+        cur.copy_expert(
+            f"COPY mining_stats_staging ({', '.join(COPY_COLUMNS)}) FROM STDIN",
+            _CopyStream(_copy_lines(body, fmt, report))
+        )
+        staged = report.received - report.rejected
+
+        cur.execute(
+            """
+            SELECT COUNT(*)
+            FROM mining_stats_staging s
+            LEFT JOIN mining_accounts ma ON ma.id = s.mining_account_id AND ma.user_id = %s
+            WHERE ma.id IS NULL
+            """,
+            (user_id,)
+        )
+        foreign = cur.fetchone()[0]
+        if foreign:
+            report.rejected += foreign
+            if len(report.errors) < MAX_REPORTED_ERRORS:
+                report.errors.append({'line': None, 'error': f'{foreign} rows reference unknown accounts'})
+
+        cur.execute(MERGE_SQL, (user_id,))
+        merged: List[tuple] = cur.fetchall()
+        refresh_rollups(cur, ((user_id, date) for _, date in merged))
+        conn.commit()
+
+    return {
+        'rows_received': report.received,
+        'rows_accepted': staged - foreign,
+        'rows_rejected': report.rejected,
+        'rows_merged': len(merged),
+        'errors': report.errors,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
@@ -0,0 +1,38 @@
+import time
+from contextlib import contextmanager
+
+class QueryTimings:
+    """Замеры запросов одного HTTP-вызова для заголовка Server-Timing"""
+
+    def __init__(self):
+        self.entries = []
+
+    @contextmanager
+    def measure(self, name: str):
+        """Замер одного сетевого обращения к базе"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.entries.append((name, (time.perf_counter() - started) * 1000))
+
+    @property
+    def round_trips(self) -> int:
+        return len(self.entries)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(ms for _, ms in self.entries)
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing: каждый запрос и число обращений к базе"""
+        parts = [f'{name};dur={ms:.2f}' for name, ms in self.entries]
+        parts.append(f'db;dur={self.total_ms:.2f};desc="round_trips={self.round_trips}"')
+        return ', '.join(parts)
+
+    def as_dict(self) -> dict:
+        return {
+            'round_trips': self.round_trips,
+            'total_ms': round(self.total_ms, 2),
+            'queries': [{'name': name, 'ms': round(ms, 2)} for name, ms in self.entries]
+        }
@@ -0,0 +1,134 @@
+"""
+Заказы оборудования: создание, постраничный список и сводка
+
+Список читается по индексу idx_orders_user_created (или частичному
+idx_orders_user_open для открытых заказов) с keyset-пагинацией по (created_at, id);
+сводка по статусам и оборудованию считается одним запросом с GROUPING SETS.
+"""
+from decimal import Decimal, InvalidOperation
+from typing import List, Optional
+from encoding import row_to_dict, rows_to_dicts
+from pagination import InvalidPageRequest, split_page
+
+ORDER_STATUSES = ('pending', 'confirmed', 'shipped', 'delivered', 'cancelled')
+OPEN_STATUSES = ('pending', 'confirmed', 'shipped')
+MAX_QUANTITY = 100000
+MAX_PRICE_USD = Decimal('1e10')
+EQUIPMENT_NAME_MAX = 255
+ORDER_COLUMNS = 'id, equipment_name, quantity, price_usd, status, created_at'
+
+SUMMARY_SQL = """
+    SELECT
+        GROUPING(status, equipment_name) AS grouping_set,
+        status,
+        equipment_name,
+        COUNT(*) AS orders,
+        COALESCE(SUM(quantity), 0) AS quantity,
+        COALESCE(SUM(quantity * price_usd), 0) AS total_usd
+    FROM equipment_orders
+    WHERE user_id = %s
+    GROUP BY GROUPING SETS ((status), (equipment_name), ())
+"""
+BY_STATUS, TOTAL = 1, 3
+
+def parse_statuses(value: Optional[str]) -> Optional[List[str]]:
+    """Фильтр статусов через запятую; open — все открытые статусы"""
+    if not value:
+        return None
+    statuses = set()
+    for part in value.split(','):
+        part = part.strip().lower()
+        if part == 'open':
+            statuses.update(OPEN_STATUSES)
+        elif part in ORDER_STATUSES:
+            statuses.add(part)
+        else:
+            raise InvalidPageRequest(f"status must be one of: open, {', '.join(ORDER_STATUSES)}")
+    return [status for status in ORDER_STATUSES if status in statuses]
+
+def validate_order(data: dict) -> tuple:
+    """Приведение тела заказа к (equipment_name, quantity, price_usd); ValueError при ошибке"""
+    name = data.get('equipment_name')
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError('Equipment name is required')
+    if len(name) > EQUIPMENT_NAME_MAX:
+        raise ValueError(f'equipment_name must be at most {EQUIPMENT_NAME_MAX} characters')
+    quantity = data.get('quantity')
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or not 1 <= quantity <= MAX_QUANTITY:
+        raise ValueError(f'quantity must be an integer in 1..{MAX_QUANTITY}')
+    price = data.get('price_usd')
+    try:
+        price = Decimal(str(price)) if price is not None and not isinstance(price, bool) else None
+    except InvalidOperation:
+        price = None
+    if price is None or not price.is_finite() or price < 0 or price >= MAX_PRICE_USD:
+        raise ValueError('price_usd must be a non-negative number')
+    return name.strip(), quantity, price
+
+def create_order(cur, user_id: int, data: dict) -> dict:
+    """Создание заказа в статусе pending"""
+    name, quantity, price = validate_order(data)
+    cur.execute(
+        f"""
+        INSERT INTO equipment_orders (user_id, equipment_name, quantity, price_usd)
+        VALUES (%s, %s, %s, %s)
+        RETURNING {ORDER_COLUMNS}
+        """,
+        (user_id, name, quantity, price)
+    )
+    return row_to_dict(cur, cur.fetchone())
+
+def list_orders(cur, user_id: int, limit: int, cursor: Optional[list] = None,
+                statuses: Optional[List[str]] = None) -> tuple:
+    """
+    Страница заказов, новые первыми: (заказы, курсор следующей страницы или None)
+
+    Фильтр ровно по открытым статусам совпадает с условием частичного индекса.
+    """
+    conditions = ['user_id = %s']
+    args = [user_id]
+    if statuses:
+        conditions.append('status = ANY(%s)')
+        args.append(statuses)
+    if cursor:
+        conditions.append('(created_at, id) < (%s::timestamp, %s)')
+        args.extend(cursor)
+    args.append(limit + 1)
+
+    cur.execute(
+        f"""
+        SELECT {ORDER_COLUMNS}
+        FROM equipment_orders
+        WHERE {' AND '.join(conditions)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+        """,
+        args
+    )
+    return split_page(rows_to_dicts(cur, cur.fetchall()), limit, lambda order: (order['created_at'], order['id']))
+
+def _totals(orders: int, quantity: int, total_usd: Decimal) -> dict:
+    return {'orders': orders, 'quantity': int(quantity), 'total_usd': str(total_usd)}
+
+def order_summary(cur, user_id: int) -> dict:
+    """Число заказов, штук и сумма по статусам, по оборудованию и в целом за один проход"""
+    cur.execute(SUMMARY_SQL, (user_id,))
+    by_status, by_equipment = [], []
+    total = open_total = (0, 0, Decimal(0))
+    for grouping_set, status, equipment_name, *values in cur.fetchall():
+        if grouping_set == TOTAL:
+            total = values
+        elif grouping_set == BY_STATUS:
+            by_status.append((status, values))
+            if status in OPEN_STATUSES:
+                open_total = tuple(a + b for a, b in zip(open_total, values))
+        else:
+            by_equipment.append((equipment_name, values))
+    by_status.sort(key=lambda item: -item[1][0])
+    by_equipment.sort(key=lambda item: -item[1][2])
+    return {
+        'by_status': [dict(_totals(*values), status=status) for status, values in by_status],
+        'by_equipment': [dict(_totals(*values), equipment_name=name) for name, values in by_equipment],
+        'open': _totals(*open_total),
+        'total': _totals(*total)
+    }
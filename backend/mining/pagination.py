@@ -0,0 +1,54 @@
+import base64
+import datetime
+import json
+from typing import Optional
+
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 500
+
+class InvalidPageRequest(ValueError):
+    """Некорректные параметры пагинации или фильтра"""
+
+def encode_cursor(*values) -> str:
+    """Непрозрачный курсор из значений ключа последней строки страницы"""
+    raw = json.dumps([v.isoformat() if isinstance(v, (datetime.date, datetime.datetime)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[list]:
+    """Разбор курсора; None для первой страницы"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidPageRequest('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidPageRequest('Invalid cursor')
+    return values
+
+def parse_limit(value: Optional[str], default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE) -> int:
+    """Размер страницы в пределах 1..maximum"""
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidPageRequest('limit must be an integer')
+    return max(1, min(limit, maximum))
+
+def parse_date(value: Optional[str], name: str) -> Optional[datetime.date]:
+    """Дата фильтра в формате YYYY-MM-DD"""
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise InvalidPageRequest(f'{name} must be YYYY-MM-DD')
+
+def split_page(rows: list, limit: int, key) -> tuple:
+    """Отделение лишней строки: (строки страницы, курсор следующей или None)"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
@@ -0,0 +1,187 @@
+import math
+import os
+from typing import List, Optional
+from pagination import InvalidPageRequest
+
+HORIZONS = (30, 90, 365)
+BREAK_EVEN_MAX_DAYS = int(os.environ.get('PROJECTION_BREAK_EVEN_MAX_DAYS', '1825'))
+MAX_SCENARIOS = int(os.environ.get('PROJECTION_MAX_SCENARIOS', '2000'))
+MAX_VALUES_PER_PARAM = 50
+SCENARIO_CHUNK = 256
+LOOKBACK_DAYS = int(os.environ.get('PROJECTION_LOOKBACK_DAYS', '30'))
+BLOCK_REWARD_BTC = float(os.environ.get('PROJECTION_BLOCK_REWARD', '3.125'))
+SECONDS_PER_DAY = 86400
+HASHES_PER_TH = 1e12
+
+ACCOUNTS_SQL = """
+    SELECT ma.id, COALESCE(ma.hashrate, 0), COALESCE(ma.power_consumption, 0),
+           COALESCE(SUM(ms.btc_mined), 0), COALESCE(SUM(ms.total_hashrate), 0),
+           COALESCE(SUM(ms.electricity_cost), 0), COALESCE(SUM(ms.power_used), 0)
+    FROM mining_accounts ma
+    LEFT JOIN mining_stats ms ON ms.mining_account_id = ma.id AND ms.date >= CURRENT_DATE - %(lookback)s
+    WHERE ma.user_id = %(user_id)s AND ma.is_active = TRUE
+    GROUP BY ma.id
+    ORDER BY ma.id
+"""
+
+def parse_values(value: Optional[str], name: str, default: Optional[List[float]] = None,
+                 minimum: float = 0.0) -> Optional[List[float]]:
+    """Одно значение или список через запятую для сетки сценариев"""
+    if value is None or value == '':
+        return default
+    try:
+        values = [float(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise InvalidPageRequest(f'{name} must be a number or a comma-separated list of numbers')
+    if not values or len(values) > MAX_VALUES_PER_PARAM:
+        raise InvalidPageRequest(f'{name} must have 1..{MAX_VALUES_PER_PARAM} values')
+    if not all(math.isfinite(v) for v in values):
+        raise InvalidPageRequest(f'{name} must be finite numbers')
+    if any(v < minimum for v in values):
+        raise InvalidPageRequest(f'{name} must be >= {minimum:g}')
+    return values
+
+def parse_amount(value: Optional[str], name: str) -> Optional[float]:
+    """Необязательное неотрицательное число"""
+    values = parse_values(value, name)
+    if values and len(values) > 1:
+        raise InvalidPageRequest(f'{name} must be a single number')
+    return values[0] if values else None
+
+def btc_per_th_day(difficulty):
+    """Ожидаемая добыча BTC на 1 TH/s за сутки при заданной сложности сети"""
+    return SECONDS_PER_DAY * HASHES_PER_TH * BLOCK_REWARD_BTC / (difficulty * 2 ** 32)
+
+def load_accounts(cur, user_id: int, lookback_days: int = LOOKBACK_DAYS):
+    """Активные аккаунты с суммами статистики за последние lookback_days дней, матрицей (A, 7)"""
+    import numpy as np
+    cur.execute(ACCOUNTS_SQL, {'user_id': user_id, 'lookback': lookback_days})
+    rows = cur.fetchall()
+    return np.array(rows, dtype=np.float64).reshape(len(rows), 7)
+
+def project(accounts, prices: List[float], difficulties: Optional[List[float]], rates: Optional[List[float]],
+            growths: List[float], current_difficulty: Optional[float] = None,
+            capex: Optional[float] = None) -> dict:
+    """
+    Прогноз добычи и прибыли по сетке сценариев цена × сложность × тариф × рост сложности
+
+    Добыча аккаунта на TH/s в сутки берётся из его статистики за последние дни;
+    если задана сложность, она масштабируется моделью BTC/(TH·сутки) = 86400·10¹²·награда/(D·2³²),
+    а фактическая статистика при заданной current_difficulty даёт поправку на удачу пула и комиссии.
+    Рост сложности g в месяц уменьшает добычу дня d в (1+g)^(d/30) раз.
+    Всё считается векторно: суммы по аккаунтам линейны, доля прибыльных аккаунтов
+    находится через сортировку порогов, кумулятивная прибыль — матрицы (сценарии, дни) по блокам.
+    """
+    import numpy as np
+
+    account_ids = accounts[:, 0].astype(np.int64)
+    hashrate = accounts[:, 1]
+    kwh_per_day = accounts[:, 2] * 24 / 1000
+    btc_sum, th_days, cost_sum, kwh_sum = accounts[:, 3], accounts[:, 4], accounts[:, 5], accounts[:, 6]
+
+    has_history = th_days > 0
+    observed = np.divide(btc_sum, th_days, out=np.zeros_like(btc_sum), where=has_history)
+    if difficulties is None:
+        if not has_history.any():
+            raise InvalidPageRequest('difficulty is required when there is no mining history')
+        # Аккаунты без истории получают медианную добычу остальных
+        base_yield = np.where(has_history, observed, np.median(observed[has_history]))
+        difficulty_factor = np.array([1.0])
+        difficulties = [None]
+    else:
+        if current_difficulty:
+            efficiency = observed / btc_per_th_day(current_difficulty)
+            base_yield = np.where(has_history, efficiency, 1.0)
+        else:
+            base_yield = np.ones_like(hashrate)
+        difficulty_factor = btc_per_th_day(np.array(difficulties, dtype=np.float64))
+
+    if rates is None:
+        if kwh_sum.sum() <= 0:
+            raise InvalidPageRequest('electricity_rate is required when there is no mining history')
+        rates = [float(cost_sum.sum() / kwh_sum.sum())]
+
+    grid_size = len(prices) * len(difficulties) * len(rates) * len(growths)
+    if grid_size > MAX_SCENARIOS:
+        raise InvalidPageRequest(f'Too many scenarios: {grid_size} (max {MAX_SCENARIOS})')
+
+    p_idx, d_idx, r_idx, g_idx = (axis.ravel() for axis in np.meshgrid(
+        np.arange(len(prices)), np.arange(len(difficulties)), np.arange(len(rates)), np.arange(len(growths)),
+        indexing='ij'
+    ))
+    price = np.array(prices, dtype=np.float64)[p_idx]
+    factor = difficulty_factor[d_idx]
+    rate = np.array(rates, dtype=np.float64)[r_idx]
+    growth = np.array(growths, dtype=np.float64)[g_idx]
+
+    # Суточные суммы по всем аккаунтам в первый день: (S,)
+    account_btc_day = hashrate * base_yield
+    btc_day0 = account_btc_day.sum() * factor
+    kwh_day = kwh_per_day.sum()
+    cost_day = kwh_day * rate
+
+    # Затухание добычи из-за роста сложности считается блоками сценариев (блок, дни),
+    # чтобы память не росла с размером сетки
+    max_days = max(max(HORIZONS), BREAK_EVEN_MAX_DAYS if capex else 0)
+    days = np.arange(max_days, dtype=np.float64)
+    horizon_idx = np.array(HORIZONS) - 1
+    horizon_decay = np.empty((len(price), len(HORIZONS)))
+    break_even_days = np.full(len(price), -1, dtype=np.int64)
+    for start in range(0, len(price), SCENARIO_CHUNK):
+        chunk = slice(start, start + SCENARIO_CHUNK)
+        cumulative_decay = np.cumsum(np.power(1.0 + growth[chunk, None], -days[None, :] / 30.0), axis=1)
+        horizon_decay[chunk] = cumulative_decay[:, horizon_idx]
+        if capex:
+            cumulative_profit = ((btc_day0[chunk] * price[chunk])[:, None] * cumulative_decay
+                                 - cost_day[chunk, None] * (days + 1)[None, :])
+            reached = cumulative_profit >= capex
+            first = reached.argmax(axis=1) + 1
+            break_even_days[chunk] = np.where(reached.any(axis=1), first, -1)
+
+    btc = btc_day0[:, None] * horizon_decay
+    revenue = btc * price[:, None]
+    cost = cost_day[:, None] * np.array(HORIZONS, dtype=np.float64)[None, :]
+    profit = revenue - cost
+
+    # Цена BTC, при которой прибыль за год (с учётом capex) равна нулю
+    last = len(HORIZONS) - 1
+    break_even_price = np.divide(cost[:, last] + (capex or 0.0), btc[:, last],
+                                 out=np.full(len(price), np.nan), where=btc[:, last] > 0)
+
+    # Прибыльные аккаунты в первый день: btc·price > kwh·rate ⇔ btc/kwh > rate/(price·factor);
+    # аккаунт без потребления прибылен, только если что-то добывает
+    no_power_ratio = np.where(account_btc_day > 0, np.inf, 0.0)
+    ratio = np.divide(account_btc_day, kwh_per_day, out=no_power_ratio, where=kwh_per_day > 0)
+    ratio = np.sort(ratio)
+    threshold = np.divide(rate, price * factor, out=np.full_like(rate, np.inf), where=price * factor > 0)
+    profitable = len(ratio) - np.searchsorted(ratio, threshold, side='right')
+
+    scenarios = []
+    for s in range(len(price)):
+        scenarios.append({
+            'btc_price_usd': prices[p_idx[s]],
+            'difficulty': difficulties[d_idx[s]],
+            'electricity_rate': round(float(rate[s]), 6),
+            'difficulty_growth': growths[g_idx[s]],
+            'horizons': {
+                str(h): {
+                    'btc': round(float(btc[s, i]), 8),
+                    'revenue_usd': round(float(revenue[s, i]), 2),
+                    'electricity_cost': round(float(cost[s, i]), 2),
+                    'profit_usd': round(float(profit[s, i]), 2)
+                }
+                for i, h in enumerate(HORIZONS)
+            },
+            'break_even_price_usd': None if np.isnan(break_even_price[s]) else round(float(break_even_price[s]), 2),
+            'break_even_days': int(break_even_days[s]) if break_even_days[s] > 0 else None,
+            'profitable_accounts': int(profitable[s])
+        })
+
+    return {
+        'accounts': len(account_ids),
+        'accounts_with_history': int(has_history.sum()),
+        'total_hashrate': round(float(hashrate.sum()), 2),
+        'power_kwh_per_day': round(float(kwh_day), 2),
+        'capex_usd': capex,
+        'scenarios': scenarios
+    }
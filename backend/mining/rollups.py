@@ -0,0 +1,173 @@
+"""
+Дневные и недельные агрегаты статистики по пользователю
+
+Запуск бэкфилла: python rollups.py backfill [--user-id N] [--since YYYY-MM-DD] [--batch-weeks 8]
+"""
+import argparse
+import datetime
+import os
+import time
+from typing import Iterable, Optional, Tuple
+
+DAILY_UPSERT_SQL = """
+    INSERT INTO user_stats_daily (
+        user_id, date, accounts_reported, total_hashrate, power_used,
+        btc_mined, revenue_usd, electricity_cost, profit_usd, updated_at
+    )
+    SELECT
+        ma.user_id,
+        ms.date,
+        COUNT(*),
+        COALESCE(SUM(ms.total_hashrate), 0),
+        COALESCE(SUM(ms.power_used), 0),
+        COALESCE(SUM(ms.btc_mined), 0),
+        COALESCE(SUM(ms.revenue_usd), 0),
+        COALESCE(SUM(ms.electricity_cost), 0),
+        COALESCE(SUM(ms.profit_usd), 0),
+        NOW()
+    FROM {stats} ms
+    JOIN mining_accounts ma ON ms.mining_account_id = ma.id
+    WHERE {where}
+    GROUP BY ma.user_id, ms.date
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        accounts_reported = EXCLUDED.accounts_reported,
+        total_hashrate = EXCLUDED.total_hashrate,
+        power_used = EXCLUDED.power_used,
+        btc_mined = EXCLUDED.btc_mined,
+        revenue_usd = EXCLUDED.revenue_usd,
+        electricity_cost = EXCLUDED.electricity_cost,
+        profit_usd = EXCLUDED.profit_usd,
+        updated_at = NOW()
+"""
+
+WEEKLY_UPSERT_SQL = """
+    INSERT INTO user_stats_weekly (
+        user_id, week_start, days_reported, avg_hashrate, power_used,
+        btc_mined, revenue_usd, electricity_cost, profit_usd, updated_at
+    )
+    SELECT
+        d.user_id,
+        date_trunc('week', d.date)::date,
+        COUNT(*),
+        AVG(d.total_hashrate),
+        SUM(d.power_used),
+        SUM(d.btc_mined),
+        SUM(d.revenue_usd),
+        SUM(d.electricity_cost),
+        SUM(d.profit_usd),
+        NOW()
+    FROM user_stats_daily d
+    WHERE {where}
+    GROUP BY d.user_id, date_trunc('week', d.date)
+    ON CONFLICT (user_id, week_start) DO UPDATE SET
+        days_reported = EXCLUDED.days_reported,
+        avg_hashrate = EXCLUDED.avg_hashrate,
+        power_used = EXCLUDED.power_used,
+        btc_mined = EXCLUDED.btc_mined,
+        revenue_usd = EXCLUDED.revenue_usd,
+        electricity_cost = EXCLUDED.electricity_cost,
+        profit_usd = EXCLUDED.profit_usd,
+        updated_at = NOW()
+"""
+
+def refresh_rollups(cur, user_dates: Iterable[Tuple[int, datetime.date]]) -> int:
+    """
+    Пересчёт агрегатов для затронутых пар (user_id, date)
+
+    Вызывается в транзакции записи статистики; пересчитываются только
+    затронутые дни и содержащие их недели, поэтому повторный вызов идемпотентен.
+    Дни старше границы архива считаются вместе с архивом.
+    """
+    pairs = sorted(set(user_dates))
+    if not pairs:
+        return 0
+    from archive import stats_relation
+    user_ids = [p[0] for p in pairs]
+    dates = [p[1] for p in pairs]
+
+    cur.execute(
+        DAILY_UPSERT_SQL.format(stats=stats_relation(cur, min(dates)), where="""
+            (ma.user_id, ms.date) IN (SELECT * FROM unnest(%s::int[], %s::date[]))
+        """),
+        (user_ids, dates)
+    )
+    cur.execute(
+        WEEKLY_UPSERT_SQL.format(where="""
+            (d.user_id, date_trunc('week', d.date)) IN (
+                SELECT DISTINCT t.user_id, date_trunc('week', t.date)
+                FROM unnest(%s::int[], %s::date[]) AS t(user_id, date)
+            )
+        """),
+        (user_ids, dates)
+    )
+    return len(pairs)
+
+def backfill(conn, user_id: Optional[int] = None, since: Optional[datetime.date] = None, batch_weeks: int = 8) -> dict:
+    """
+    Полное построение агрегатов из mining_stats пакетами по batch_weeks недель
+
+    Каждый пакет фиксируется отдельной транзакцией, чтобы не держать длинных блокировок.
+    """
+    from archive import stats_relation
+    started = time.perf_counter()
+    user_filter = 'AND ma.user_id = %(user_id)s' if user_id is not None else ''
+    with conn.cursor() as cur:
+        stats = stats_relation(cur, since)
+        cur.execute(
+            f"""
+            SELECT MIN(ms.date), MAX(ms.date)
+            FROM {stats} ms
+            JOIN mining_accounts ma ON ms.mining_account_id = ma.id
+            WHERE (%(since)s::date IS NULL OR ms.date >= %(since)s) {user_filter}
+            """,
+            {'since': since, 'user_id': user_id}
+        )
+        first, last = cur.fetchone()
+        conn.commit()
+        if first is None:
+            return {'batches': 0, 'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+        batch_start = first - datetime.timedelta(days=first.weekday())
+        step = datetime.timedelta(weeks=max(1, batch_weeks))
+        batches = 0
+        while batch_start <= last:
+            batch_end = batch_start + step
+            params = {'start': batch_start, 'end': batch_end, 'user_id': user_id}
+            cur.execute(
+                DAILY_UPSERT_SQL.format(stats=stats,
+                                        where=f"ms.date >= %(start)s AND ms.date < %(end)s {user_filter}"),
+                params
+            )
+            cur.execute(
+                WEEKLY_UPSERT_SQL.format(where="d.date >= %(start)s AND d.date < %(end)s"
+                                         + (' AND d.user_id = %(user_id)s' if user_id is not None else '')),
+                params
+            )
+            conn.commit()
+            batches += 1
+            batch_start = batch_end
+
+    return {
+        'batches': batches,
+        'from': str(first),
+        'to': str(last),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['backfill'])
+    parser.add_argument('--user-id', type=int)
+    parser.add_argument('--since', type=datetime.date.fromisoformat)
+    parser.add_argument('--batch-weeks', type=int, default=8)
+    args = parser.parse_args()
+
+    import psycopg2
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        print(backfill(conn, user_id=args.user_id, since=args.since, batch_weeks=args.batch_weeks))
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import base64
+import bisect
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from encoding import dumps
+from tracing import begin_request, end_request, phase, tracing_active
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-Session-Token'
+}
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+def preflight_response() -> dict:
+    """Ответ на preflight OPTIONS; новый словарь на каждый вызов"""
+    return {'statusCode': 200, 'headers': dict(PREFLIGHT_HEADERS), 'body': '', 'isBase64Encoded': False}
+
+def json_response(status: int, body, extra_headers: Optional[dict] = None) -> dict:
+    """JSON-ответ; заголовки копируются, чтобы изменения ответа не задевали JSON_HEADERS"""
+    with phase('serialize'):
+        encoded = dumps(body)
+    return {
+        'statusCode': status,
+        'headers': {**JSON_HEADERS, **extra_headers} if extra_headers else dict(JSON_HEADERS),
+        'body': encoded,
+        'isBase64Encoded': False
+    }
+
+def error_response(status: int, message: str, extra_headers: Optional[dict] = None) -> dict:
+    """Ответ с ошибкой в формате {'error': ...}"""
+    return json_response(status, {'error': message}, extra_headers)
+
+class HttpError(Exception):
+    """Ошибка, которая превращается в ответ с указанным статусом"""
+
+    def __init__(self, status: int, message: str, headers: Optional[dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers
+
+class Request:
+    """Разобранный вызов функции: метод, action, параметры, заголовки и тело"""
+
+    __slots__ = ('event', 'context', 'method', 'action', 'params', 'headers', 'path_params',
+                 'route', 'conn', 'user', 'state')
+
+    def __init__(self, event: dict, context, method: str, action: str):
+        self.event = event
+        self.context = context
+        self.method = method
+        self.action = action
+        self.params = event.get('queryStringParameters') or {}
+        self.headers = event.get('headers') or {}
+        self.path_params = {}
+        self.route = None
+        self.conn = None
+        self.user = None
+        self.state = {}
+
+    def header(self, name: str) -> Optional[str]:
+        """Заголовок без учёта регистра"""
+        value = self.headers.get(name)
+        if value is not None:
+            return value
+        lowered = name.lower()
+        for key, value in self.headers.items():
+            if key.lower() == lowered:
+                return value
+        return None
+
+    @property
+    def body(self) -> str:
+        body = self.event.get('body') or ''
+        if self.event.get('isBase64Encoded'):
+            body = base64.b64decode(body).decode('utf-8')
+        return body
+
+    def json_body(self) -> dict:
+        """Тело запроса как JSON-объект; 400 при ошибке разбора"""
+        body = self.body or '{}'
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HttpError(400, 'Request body must be valid JSON')
+        if not isinstance(data, dict):
+            raise HttpError(400, 'Request body must be a JSON object')
+        return data
+
+class LatencyHistogram:
+    """Гистограмма задержек маршрута с фиксированными корзинами в миллисекундах"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Верхняя граница корзины, в которую попадает квантиль q"""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def as_dict(self) -> dict:
+        return {
+            'count': self.total,
+            'avg_ms': round(self.sum_ms / self.total, 2) if self.total else None,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 2),
+            'buckets': dict(zip([f'le_{b}' for b in LATENCY_BUCKETS_MS] + ['inf'], self.counts))
+        }
+
+Middleware = Callable[[Request, Callable[[Request], dict]], dict]
+
+def map_errors(mapping: Dict[type, object]) -> Middleware:
+    """
+    Преобразование исключений в ответы: HttpError, заданные типы и 500 для остальных
+
+    Значение mapping — статус или пара (статус, дополнительные заголовки).
+    """
+    def middleware(request: Request, call_next) -> dict:
+        try:
+            return call_next(request)
+        except Exception as e:
+            return exception_response(e, mapping)
+    return middleware
+
+def exception_response(error: Exception, mapping: Dict[type, object]) -> dict:
+    """Ответ для исключения по правилам map_errors"""
+    if isinstance(error, HttpError):
+        return error_response(error.status, error.message, error.headers)
+    for error_type, status in mapping.items():
+        if isinstance(error, error_type):
+            status, headers = status if isinstance(status, tuple) else (status, None)
+            return error_response(status, str(error), headers)
+    return error_response(500, str(error))
+
+class Router:
+    """
+    Таблица маршрутов по (метод, action), собираемая один раз при импорте
+
+    Шаблоны вида 'stats/<account_id>' кладут параметры в request.path_params.
+    Цепочка middleware для каждого маршрута собирается при регистрации,
+    а задержка каждого маршрута попадает в свою гистограмму. Неизвестный
+    action сразу получает 404, если через not_found не задана цепочка,
+    например с проверкой сессии.
+    """
+
+    def __init__(self, middleware: Tuple[Middleware, ...] = ()):
+        self.middleware = tuple(middleware)
+        self._static: Dict[Tuple[str, str], tuple] = {}
+        self._dynamic: List[tuple] = []
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._not_found: Optional[Callable[[Request], dict]] = None
+        self._lock = threading.Lock()
+
+    def _chain(self, fn: Callable[[Request], dict], middleware: Tuple[Middleware, ...]):
+        chain = fn
+        for mw in reversed(self.middleware + tuple(middleware)):
+            chain = _wrap(mw, chain)
+        return chain
+
+    def route(self, method: str, pattern: str, middleware: Tuple[Middleware, ...] = ()):
+        """Декоратор регистрации обработчика маршрута"""
+        def register(fn: Callable[[Request], dict]):
+            chain = self._chain(fn, middleware)
+            name = f'{method} {pattern}'
+            entry = (name, chain)
+            self._histograms[name] = LatencyHistogram()
+            segments = pattern.split('/')
+            if any(s.startswith('<') for s in segments):
+                self._dynamic.append((method, segments, entry))
+            else:
+                self._static[(method, pattern)] = entry
+            return fn
+        return register
+
+    def not_found(self, middleware: Tuple[Middleware, ...] = ()):
+        """Ответ 404 для неизвестных маршрутов после middleware роутера и middleware"""
+        self._not_found = self._chain(lambda request: error_response(404, 'Endpoint not found'), middleware)
+
+    def _match(self, method: str, action: str):
+        entry = self._static.get((method, action))
+        if entry is not None:
+            return entry, {}
+        parts = action.split('/')
+        for route_method, segments, entry in self._dynamic:
+            if route_method != method or len(segments) != len(parts):
+                continue
+            params = {}
+            for segment, part in zip(segments, parts):
+                if segment.startswith('<'):
+                    if not part:
+                        break
+                    params[segment[1:-1]] = part
+                elif segment != part:
+                    break
+            else:
+                return entry, params
+        return None, None
+
+    def dispatch(self, event: dict, context) -> dict:
+        """Обработка вызова функции"""
+        method = event.get('httpMethod', 'GET')
+        if method == 'OPTIONS':
+            return preflight_response()
+        params = event.get('queryStringParameters')
+        action = params.get('action', '') if params else ''
+
+        entry, path_params = self._match(method, action)
+        if entry is None:
+            if self._not_found is None:
+                return error_response(404, 'Endpoint not found')
+            return self._not_found(Request(event, context, method, action))
+
+        name, chain = entry
+        request = Request(event, context, method, action)
+        request.path_params = path_params
+        request.route = name
+        trace = begin_request(event, context, name) if tracing_active() else None
+        response = None
+        started = time.perf_counter()
+        try:
+            response = chain(request)
+            return response
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._histograms[name].observe(elapsed_ms)
+            if trace is not None:
+                end_request(trace, response['statusCode'] if response else None)
+
+    def stats(self) -> dict:
+        """Гистограммы задержек по маршрутам"""
+        with self._lock:
+            return {name: h.as_dict() for name, h in self._histograms.items() if h.total}
+
+def _wrap(middleware: Middleware, call_next):
+    return lambda request: middleware(request, call_next)
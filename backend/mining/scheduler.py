@@ -0,0 +1,261 @@
+"""
+Плановые задачи подписок: истечение и распределение хешрейта по аккаунтам
+
+Истёкшие подписки переводятся в статус expired пакетами по индексу
+idx_subscriptions_status_expires; allocated_hashrate аккаунтов пересчитывается
+одним UPDATE для всех затронутых пользователей: с истёкшими подписками, с
+подписками, созданными, начавшимися или изменёнными с прошлого запуска
+(отмена, другой hashrate_allocation), с новыми аккаунтами и аккаунтами, у
+которых изменились hashrate или is_active (отметка allocation_changed_at
+ставится триггерами). Удалённые строки и прежний владелец при смене user_id
+так не видны: их подхватывает полный пересчёт раз в
+ALLOCATION_FULL_SYNC_INTERVAL секунд, это и есть окно устаревания для них.
+Стоимость каждого запуска пишется в scheduler_runs.
+
+Запуск:
+    python scheduler.py run [--batch-size 1000] [--loop 300]   # истечение и пересчёт
+    python scheduler.py expire [--batch-size 1000]
+    python scheduler.py sync [--user-id N]                     # полный пересчёт распределения
+    python scheduler.py history [--limit 20]
+
+Cron: */5 * * * * cd backend/mining && python scheduler.py run
+"""
+import argparse
+import json
+import os
+import time
+from typing import Iterable, List, Optional
+import psycopg2
+
+EXPIRE_BATCH_SIZE = int(os.environ.get('SUBSCRIPTION_EXPIRE_BATCH_SIZE', '1000'))
+EXPIRE_MAX_BATCHES = int(os.environ.get('SUBSCRIPTION_EXPIRE_MAX_BATCHES', '100'))
+FULL_SYNC_INTERVAL = int(os.environ.get('ALLOCATION_FULL_SYNC_INTERVAL', '3600'))
+SYNC_JOBS = ('sync_allocations', 'sync_allocations_full')
+
+EXPIRE_SQL = """
+    UPDATE subscriptions
+    SET status = 'expired'
+    WHERE id IN (
+        SELECT id FROM subscriptions
+        WHERE status = 'active' AND expires_at <= NOW()
+        ORDER BY expires_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING user_id
+"""
+
+# Хешрейт активных подписок пользователя делится между его активными аккаунтами
+# пропорционально их hashrate (поровну, если hashrate не задан); записываются
+# только изменившиеся строки
+SYNC_ALLOCATIONS_SQL = """
+    WITH allocation AS (
+        SELECT user_id, SUM(hashrate_allocation) AS total
+        FROM subscriptions
+        WHERE status = 'active' AND starts_at <= NOW() AND expires_at > NOW() {subscription_filter}
+        GROUP BY user_id
+    ),
+    shares AS (
+        SELECT
+            ma.id,
+            CASE
+                WHEN NOT COALESCE(ma.is_active, FALSE) OR a.total IS NULL THEN 0
+                WHEN SUM(ma.hashrate) FILTER (WHERE ma.is_active) OVER w > 0
+                    THEN a.total * COALESCE(ma.hashrate, 0) / SUM(ma.hashrate) FILTER (WHERE ma.is_active) OVER w
+                ELSE a.total / COUNT(*) FILTER (WHERE ma.is_active) OVER w
+            END AS allocated
+        FROM mining_accounts ma
+        LEFT JOIN allocation a ON a.user_id = ma.user_id
+        WHERE ma.user_id IS NOT NULL {account_filter}
+        WINDOW w AS (PARTITION BY ma.user_id)
+    )
+    UPDATE mining_accounts ma
+    SET allocated_hashrate = ROUND(s.allocated, 2)
+    FROM shares s
+    WHERE ma.id = s.id AND ma.allocated_hashrate IS DISTINCT FROM ROUND(s.allocated, 2)
+"""
+
+# Пользователи, у которых с прошлого пересчёта появилась, началась или изменилась подписка
+# или появился либо изменился аккаунт
+CHANGED_USERS_SQL = """
+    SELECT user_id FROM subscriptions
+    WHERE user_id IS NOT NULL
+      AND (created_at > %(since)s OR allocation_changed_at > %(since)s
+           OR (starts_at > %(since)s AND starts_at <= NOW()))
+    UNION
+    SELECT user_id FROM mining_accounts
+    WHERE user_id IS NOT NULL AND (created_at > %(since)s OR allocation_changed_at > %(since)s)
+"""
+
+LAST_SYNC_SQL = """
+    SELECT
+        MAX(started_at),
+        COALESCE(MAX(started_at) FILTER (WHERE job = 'sync_allocations_full')
+                 > LOCALTIMESTAMP - %(interval)s * INTERVAL '1 second', FALSE)
+    FROM scheduler_runs
+    WHERE job = ANY(%(jobs)s)
+"""
+
+RECORD_RUN_SQL = """
+    INSERT INTO scheduler_runs (job, started_at, elapsed_ms, rows_affected, details)
+    VALUES (%(job)s, LOCALTIMESTAMP - %(elapsed_ms)s * INTERVAL '1 millisecond', %(elapsed_ms)s, %(rows)s, %(details)s)
+"""
+
+def expire_subscriptions(conn, batch_size: int = EXPIRE_BATCH_SIZE,
+                         max_batches: int = EXPIRE_MAX_BATCHES) -> dict:
+    """
+    Перевод истёкших активных подписок в expired пакетами по batch_size строк
+
+    Каждый пакет — отдельная транзакция со SKIP LOCKED, как уборка сессий.
+    Возвращает число строк и пользователей, у которых изменился набор подписок.
+    """
+    started = time.perf_counter()
+    expired = 0
+    batches = 0
+    user_ids = set()
+    with conn.cursor() as cur:
+        while batches < max_batches:
+            cur.execute(EXPIRE_SQL, (batch_size,))
+            rows = cur.fetchall()
+            conn.commit()
+            batches += 1
+            expired += len(rows)
+            user_ids.update(row[0] for row in rows if row[0] is not None)
+            if len(rows) < batch_size:
+                break
+    return {
+        'expired': expired,
+        'batches': batches,
+        'user_ids': sorted(user_ids),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def sync_allocations(conn, user_ids: Optional[List[int]] = None) -> dict:
+    """
+    Пересчёт allocated_hashrate одним запросом для user_ids или всех пользователей
+
+    Колонка не входит в триггер сводки user_mining_summary, поэтому
+    пересчёт не трогает сводку.
+    """
+    started = time.perf_counter()
+    if user_ids is not None and not user_ids:
+        return {'accounts_updated': 0, 'users': 0, 'elapsed_ms': 0.0}
+    scoped = user_ids is not None
+    sql = SYNC_ALLOCATIONS_SQL.format(
+        subscription_filter='AND user_id = ANY(%(user_ids)s)' if scoped else '',
+        account_filter='AND ma.user_id = ANY(%(user_ids)s)' if scoped else ''
+    )
+    with conn.cursor() as cur:
+        cur.execute(sql, {'user_ids': list(user_ids or [])})
+        updated = cur.rowcount
+    conn.commit()
+    return {
+        'accounts_updated': updated,
+        'users': len(user_ids) if scoped else None,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def sync_changed(conn, since, user_ids: Iterable[int] = ()) -> dict:
+    """Пересчёт распределения для user_ids и пользователей, изменившихся после since"""
+    with conn.cursor() as cur:
+        cur.execute(CHANGED_USERS_SQL, {'since': since})
+        changed = {row[0] for row in cur.fetchall()}
+    result = sync_allocations(conn, sorted(changed | set(user_ids)))
+    return dict(result, changed_users=len(changed))
+
+def record_run(conn, job: str, elapsed_ms: float, rows: int, details: dict):
+    """Запись стоимости запуска в scheduler_runs и в лог"""
+    print(json.dumps({'event': 'scheduler_run', 'job': job, 'elapsed_ms': elapsed_ms,
+                      'rows_affected': rows, 'details': details}, default=str))
+    with conn.cursor() as cur:
+        cur.execute(RECORD_RUN_SQL, {'job': job, 'elapsed_ms': elapsed_ms, 'rows': rows,
+                                     'details': json.dumps(details, default=str)})
+    conn.commit()
+
+def _timed_job(conn, job: str, fn, rows_key: str, *args) -> dict:
+    started = time.perf_counter()
+    result = fn(conn, *args)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    details = {key: value for key, value in result.items() if key != 'user_ids'}
+    record_run(conn, job, elapsed_ms, result[rows_key], details)
+    return result
+
+def run_once(conn, batch_size: int = EXPIRE_BATCH_SIZE, full_sync_interval: int = FULL_SYNC_INTERVAL) -> dict:
+    """
+    Истечение подписок и пересчёт распределения
+
+    Пересчитываются пользователи с истёкшими подписками и изменившиеся с начала
+    прошлого пересчёта; если полного пересчёта не было full_sync_interval секунд
+    (или пересчётов не было вовсе), выполняется полный.
+    """
+    expired = _timed_job(conn, 'expire_subscriptions', expire_subscriptions, 'expired', batch_size)
+    with conn.cursor() as cur:
+        cur.execute(LAST_SYNC_SQL, {'interval': full_sync_interval, 'jobs': list(SYNC_JOBS)})
+        since, full_fresh = cur.fetchone()
+    conn.rollback()
+    if since is None or not full_fresh:
+        synced = _timed_job(conn, 'sync_allocations_full', sync_allocations, 'accounts_updated', None)
+    else:
+        synced = _timed_job(conn, 'sync_allocations', sync_changed, 'accounts_updated', since, expired['user_ids'])
+    return {'expire': dict(expired, user_ids=len(expired['user_ids'])), 'sync': synced}
+
+def run_history(conn, limit: int = 20) -> dict:
+    """Последние запуски и средняя стоимость по задачам за сутки"""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT job, started_at::text, elapsed_ms::float8, rows_affected
+            FROM scheduler_runs
+            ORDER BY started_at DESC
+            LIMIT %s
+            """,
+            (limit,)
+        )
+        recent = [dict(zip(('job', 'started_at', 'elapsed_ms', 'rows_affected'), row)) for row in cur.fetchall()]
+        cur.execute(
+            """
+            SELECT job, COUNT(*), AVG(elapsed_ms)::float8, MAX(elapsed_ms)::float8, SUM(rows_affected)
+            FROM scheduler_runs
+            WHERE started_at > NOW() - INTERVAL '1 day'
+            GROUP BY job
+            """
+        )
+        daily = {row[0]: {'runs': row[1], 'avg_ms': round(row[2], 1), 'max_ms': row[3], 'rows': row[4]}
+                 for row in cur.fetchall()}
+    conn.rollback()
+    return {'recent': recent, 'last_day': daily}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['run', 'expire', 'sync', 'history'])
+    parser.add_argument('--batch-size', type=int, default=EXPIRE_BATCH_SIZE)
+    parser.add_argument('--user-id', type=int)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--loop', type=float, help='повторять run каждые N секунд')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        if args.command == 'run':
+            while True:
+                print(json.dumps(run_once(conn, args.batch_size), default=str))
+                if not args.loop:
+                    break
+                time.sleep(args.loop)
+            return
+        if args.command == 'expire':
+            result = _timed_job(conn, 'expire_subscriptions', expire_subscriptions, 'expired', args.batch_size)
+        elif args.command == 'sync':
+            if args.user_id is not None:
+                result = _timed_job(conn, 'sync_allocations_user', sync_allocations, 'accounts_updated',
+                                    [args.user_id])
+            else:
+                result = _timed_job(conn, 'sync_allocations_full', sync_allocations, 'accounts_updated', None)
+        else:
+            result = run_history(conn, args.limit)
+        print(json.dumps(result, default=str))
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Профиль холодного старта функции: время импорта модулей и время до первого ответа
+
+Включается STARTUP_PROFILE=1. Модуль импортируется первым в index.py: с этого
+момента каждый новый импорт замеряется (собственное и суммарное время, как
+python -X importtime), а первый ответ каждого маршрута выводится в лог вместе
+с импортами, которые он вызвал. Без переменной окружения ничего не делает.
+"""
+import builtins
+import json
+import os
+import sys
+import threading
+import time
+
+STARTUP_PROFILE = os.environ.get('STARTUP_PROFILE', '') == '1'
+STARTUP_PROFILE_TOP = int(os.environ.get('STARTUP_PROFILE_TOP', '15'))
+
+_started = time.perf_counter()
+_loaded_ms = None
+_lock = threading.Lock()
+_local = threading.local()
+_imports = []
+_reported = set()
+_original_import = builtins.__import__
+
+def _profiled_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)
+    started = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        total = (time.perf_counter() - started) * 1000
+        children = stack.pop()
+        if stack:
+            stack[-1] += total
+        with _lock:
+            _imports.append({'module': name, 'self_ms': round(total - children, 3), 'total_ms': round(total, 3),
+                             'depth': len(stack)})
+
+def _take_imports() -> list:
+    global _imports
+    with _lock:
+        taken, _imports = _imports, []
+    return taken
+
+def module_loaded():
+    """Отметка конца импорта index.py; вызывается последней строкой модуля"""
+    global _loaded_ms
+    if STARTUP_PROFILE and _loaded_ms is None:
+        _loaded_ms = round((time.perf_counter() - _started) * 1000, 3)
+
+def first_response(route: str, response: dict):
+    """Вывод профиля при первом ответе маршрута: время с начала загрузки и импорты, случившиеся до него"""
+    if not STARTUP_PROFILE or route in _reported:
+        return
+    with _lock:
+        if route in _reported:
+            return
+        cold = not _reported
+        _reported.add(route)
+    imports = _take_imports()
+    top = sorted((item for item in imports if item['depth'] == 0), key=lambda item: -item['total_ms'])
+    report = {
+        'event': 'startup_profile',
+        'route': route,
+        'status': response.get('statusCode') if isinstance(response, dict) else None,
+        'cold': cold,
+        'import_ms': round(sum(item['total_ms'] for item in imports if item['depth'] == 0), 3),
+        'imports': top[:STARTUP_PROFILE_TOP],
+        'slowest_self': sorted(imports, key=lambda item: -item['self_ms'])[:STARTUP_PROFILE_TOP]
+    }
+    if cold:
+        report['module_load_ms'] = _loaded_ms
+        report['first_response_ms'] = round((time.perf_counter() - _started) * 1000, 3)
+    print(json.dumps(report))
+
+if STARTUP_PROFILE:
+    builtins.__import__ = _profiled_import
@@ -0,0 +1,122 @@
+"""
+Проверка и перестроение сводки user_mining_summary
+
+Сводку поддерживает триггер trg_mining_accounts_summary; проверка сравнивает её
+с агрегатом по mining_accounts и перестраивает расходящиеся строки.
+
+Запуск: python summary.py check|rebuild [--user-id N] [--all]
+"""
+import argparse
+import os
+import time
+from typing import List, Optional
+import psycopg2
+
+LIVE_SUMMARY_SQL = """
+    SELECT user_id, COUNT(*) AS active_accounts,
+           COALESCE(SUM(hashrate), 0) AS total_hashrate,
+           COALESCE(SUM(power_consumption), 0) AS total_power
+    FROM mining_accounts
+    WHERE is_active = TRUE AND user_id IS NOT NULL {user_filter}
+    GROUP BY user_id
+"""
+
+DRIFT_SQL = """
+    WITH live AS ({live})
+    SELECT COALESCE(l.user_id, s.user_id) AS user_id,
+           COALESCE(s.active_accounts, 0), COALESCE(l.active_accounts, 0),
+           COALESCE(s.total_hashrate, 0)::text, COALESCE(l.total_hashrate, 0)::text,
+           COALESCE(s.total_power, 0)::text, COALESCE(l.total_power, 0)::text
+    FROM live l
+    FULL JOIN (SELECT * FROM user_mining_summary s WHERE TRUE {summary_filter}) s ON s.user_id = l.user_id
+    WHERE COALESCE(s.active_accounts, 0) <> COALESCE(l.active_accounts, 0)
+       OR COALESCE(s.total_hashrate, 0) <> COALESCE(l.total_hashrate, 0)
+       OR COALESCE(s.total_power, 0) <> COALESCE(l.total_power, 0)
+    ORDER BY 1
+"""
+
+REBUILD_SQL = """
+    WITH live AS ({live})
+    INSERT INTO user_mining_summary (user_id, active_accounts, total_hashrate, total_power, updated_at)
+    SELECT t.user_id, COALESCE(l.active_accounts, 0), COALESCE(l.total_hashrate, 0),
+           COALESCE(l.total_power, 0), NOW()
+    FROM unnest(%(user_ids)s::int[]) AS t(user_id)
+    LEFT JOIN live l ON l.user_id = t.user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        active_accounts = EXCLUDED.active_accounts,
+        total_hashrate = EXCLUDED.total_hashrate,
+        total_power = EXCLUDED.total_power,
+        updated_at = NOW()
+"""
+
+DRIFT_COLUMNS = ('user_id', 'stored_accounts', 'live_accounts', 'stored_hashrate', 'live_hashrate',
+                 'stored_power', 'live_power')
+
+def _format(sql: str, user_id: Optional[int]) -> str:
+    return sql.format(
+        live=LIVE_SUMMARY_SQL.format(user_filter='AND user_id = %(user_id)s' if user_id is not None else ''),
+        summary_filter='AND s.user_id = %(user_id)s' if user_id is not None else ''
+    )
+
+def find_drift(cur, user_id: Optional[int] = None) -> List[dict]:
+    """Пользователи, у которых сводка расходится с агрегатом по mining_accounts"""
+    cur.execute(_format(DRIFT_SQL, user_id), {'user_id': user_id})
+    return [dict(zip(DRIFT_COLUMNS, row)) for row in cur.fetchall()]
+
+def rebuild(conn, user_id: Optional[int] = None, only_drifted: bool = True) -> dict:
+    """
+    Перестроение сводки из mining_accounts
+
+    На время пересчёта mining_accounts блокируется от записи (SHARE), чтобы
+    триггер не применил дельту к строке между чтением агрегата и записью сводки.
+    С only_drifted перезаписываются только расходящиеся строки.
+    """
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute('LOCK TABLE mining_accounts IN SHARE MODE')
+        if only_drifted:
+            user_ids = [row['user_id'] for row in find_drift(cur, user_id)]
+        elif user_id is not None:
+            user_ids = [user_id]
+        else:
+            cur.execute('SELECT DISTINCT user_id FROM mining_accounts WHERE user_id IS NOT NULL '
+                        'UNION SELECT user_id FROM user_mining_summary')
+            user_ids = [row[0] for row in cur.fetchall()]
+        if user_ids:
+            cur.execute(_format(REBUILD_SQL, None), {'user_ids': user_ids})
+    conn.commit()
+    return {
+        'rebuilt': len(user_ids),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def check(conn, user_id: Optional[int] = None) -> dict:
+    """Проверка согласованности без изменений"""
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        drift = find_drift(cur, user_id)
+    conn.rollback()
+    return {
+        'drifted': len(drift),
+        'users': drift,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['check', 'rebuild'])
+    parser.add_argument('--user-id', type=int)
+    parser.add_argument('--all', action='store_true', help='перестроить все строки, а не только расходящиеся')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    try:
+        if args.command == 'check':
+            print(check(conn, user_id=args.user_id))
+        else:
+            print(rebuild(conn, user_id=args.user_id, only_drifted=not args.all))
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Проверки прогноза прибыльности без базы данных
+
+Запуск: cd backend/mining && python -m unittest test_projection
+"""
+import unittest
+import numpy as np
+from projection import project
+
+DIFFICULTY = 8e13
+
+def accounts(*rows):
+    """Матрица (A, 7): id, hashrate, power_consumption и нулевые суммы статистики"""
+    return np.array([[i + 1, hashrate, power, 0, 0, 0, 0] for i, (hashrate, power) in enumerate(rows)],
+                    dtype=np.float64).reshape(len(rows), 7)
+
+def profitable(matrix, rate: float) -> int:
+    result = project(matrix, [60000.0], [DIFFICULTY], [rate], [0.0])
+    return result['scenarios'][0]['profitable_accounts']
+
+class ProfitableAccountsTest(unittest.TestCase):
+
+    def test_idle_account_is_never_profitable(self):
+        self.assertEqual(profitable(accounts((0, 0)), 0.0), 0)
+        self.assertEqual(profitable(accounts((0, 0)), 0.1), 0)
+
+    def test_idle_account_is_not_counted_with_working_ones(self):
+        self.assertEqual(profitable(accounts((100, 3000), (0, 0)), 0.0), 1)
+
+    def test_account_without_power_that_mines_is_profitable(self):
+        self.assertEqual(profitable(accounts((50, 0), (0, 0)), 0.1), 1)
+
+if __name__ == '__main__':
+    unittest.main()
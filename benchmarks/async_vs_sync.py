@@ -0,0 +1,52 @@
+"""
+Сравнение синхронных обработчиков (psycopg2) с асинхронными (asyncpg) на сценариях tests.json
+
+Для каждого уровня параллелизма оба варианта прогоняются через load.py run
+против одной и той же заполненной базы (load.py seed).
+
+Запуск: python benchmarks/async_vs_sync.py --function mining --concurrency 1 8 32 --requests 300
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+LOAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'load.py')
+METRICS = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')
+
+def run_variant(variant: str, function: str, concurrency: int, requests: int, users: int) -> dict:
+    output = subprocess.check_output([
+        sys.executable, LOAD, 'run', '--variant', variant, '--function', function,
+        '--concurrency', str(concurrency), '--requests', str(requests), '--users', str(users)
+    ], text=True)
+    report = json.loads(output)
+    return {(fn['function'], s['name']): s for fn in report['functions'] for s in fn['scenarios']}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--function', choices=('auth', 'mining', 'all'), default='all')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200, help='запросов на сценарий')
+    parser.add_argument('--users', type=int, default=50, help='число засеянных пользователей')
+    args = parser.parse_args()
+
+    rows = []
+    for concurrency in args.concurrency:
+        sync = run_variant('sync', args.function, concurrency, args.requests, args.users)
+        async_ = run_variant('async', args.function, concurrency, args.requests, args.users)
+        for key, s in sync.items():
+            a = async_.get(key)
+            if not a:
+                continue
+            rows.append({
+                'function': key[0],
+                'scenario': key[1],
+                'concurrency': concurrency,
+                **{metric: {'sync': s[metric], 'async': a[metric]} for metric in METRICS},
+                'unexpected_status': {'sync': s['unexpected_status'], 'async': a['unexpected_status']}
+            })
+    print(json.dumps(rows, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+"""
+Нагрузочный прогон сценариев из backend/*/tests.json против локального PostgreSQL
+
+Обработчики вызываются напрямую через handler(event, context), без HTTP.
+База из DATABASE_URL заполняется синтетическими пользователями, аккаунтами
+и N днями mining_stats; схема должна быть применена (или --migrate).
+
+Примеры:
+    python benchmarks/load.py seed --users 50 --accounts 20 --days 365 --migrate
+    python benchmarks/load.py run --function all --concurrency 8 --requests 500 --output before.json
+    python benchmarks/load.py run --variant async --output async.json
+    python benchmarks/load.py compare before.json after.json
+"""
+import argparse
+import datetime
+import glob
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+FUNCTIONS = ('auth', 'mining')
+PLACEHOLDER_TOKEN = 'test-session-token'
+LOGIN_EMAIL = 'test@example.com'
+LOGIN_PASSWORD = 'SecurePass123!'
+
+def session_token(user_index: int) -> str:
+    return f'bench-session-{user_index:06d}'
+
+def connect():
+    import psycopg2
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+def migrate(conn):
+    """Применение db_migrations/V*.sql по порядку"""
+    with conn.cursor() as cur:
+        for path in sorted(glob.glob(os.path.join(ROOT, 'db_migrations', 'V*.sql'))):
+            with open(path) as f:
+                cur.execute(f.read())
+    conn.commit()
+
+def seed(conn, users: int, accounts: int, days: int, rounds: int):
+    """Синтетические пользователи, сессии, аккаунты и статистика через generate_series"""
+    import bcrypt
+    password_hash = bcrypt.hashpw(LOGIN_PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM users WHERE email LIKE 'bench+%%@example.com' OR email = %s", (LOGIN_EMAIL,))
+        stale = [row[0] for row in cur.fetchall()]
+        if stale:
+            for stats_table in ('mining_stats', 'mining_stats_archive'):
+                cur.execute(
+                    f"""
+                    DELETE FROM {stats_table} WHERE mining_account_id IN (
+                        SELECT id FROM mining_accounts WHERE user_id = ANY(%(ids)s)
+                    )
+                    """,
+                    {'ids': stale}
+                )
+            # user_mining_summary — после mining_accounts: триггер сводки обновляет её при удалении аккаунтов
+            for table in ('mining_accounts', 'user_mining_summary', 'user_sessions', 'user_stats_daily',
+                          'user_stats_weekly', 'equipment_orders', 'subscriptions', 'users'):
+                column = 'id' if table == 'users' else 'user_id'
+                cur.execute(f'DELETE FROM {table} WHERE {column} = ANY(%(ids)s)', {'ids': stale})
+        cur.execute(
+            """
+            INSERT INTO users (email, password_hash, full_name)
+            SELECT CASE WHEN i = 0 THEN %s ELSE 'bench+' || i || '@example.com' END, %s, 'Bench User ' || i
+            FROM generate_series(0, %s - 1) AS i
+            RETURNING id, email
+            """,
+            (LOGIN_EMAIL, password_hash, users)
+        )
+        user_ids = sorted(row[0] for row in cur.fetchall())
+        cur.execute(
+            """
+            INSERT INTO user_sessions (user_id, session_token, expires_at)
+            SELECT u.id, 'bench-session-' || lpad((u.n - 1)::text, 6, '0'), NOW() + INTERVAL '30 days'
+            FROM unnest(%s::int[]) WITH ORDINALITY AS u(id, n)
+            """,
+            (user_ids,)
+        )
+        cur.execute(
+            """
+            INSERT INTO mining_accounts (user_id, account_name, hashrate, power_consumption)
+            SELECT u.id, 'rig-' || a, 90 + (a %% 30), 3000 + (a %% 7) * 100
+            FROM unnest(%s::int[]) AS u(id), generate_series(1, %s) AS a
+            """,
+            (user_ids, accounts)
+        )
+        cur.execute(
+            """
+            INSERT INTO mining_stats (mining_account_id, date, total_hashrate, power_used,
+                                      btc_mined, revenue_usd, electricity_cost, profit_usd)
+            SELECT ma.id, CURRENT_DATE - d, ma.hashrate, ma.power_consumption * 24 / 1000,
+                   0.00012 + random() * 0.00002, 7 + random(), 3 + random() * 0.5, 4 + random() * 0.5
+            FROM mining_accounts ma, generate_series(0, %s - 1) AS d
+            WHERE ma.user_id = ANY(%s)
+            """,
+            (days, user_ids)
+        )
+    conn.commit()
+
+    sys.path.insert(0, os.path.join(BACKEND, 'mining'))
+    from rollups import backfill
+    for user_id in user_ids:
+        backfill(conn, user_id=user_id, batch_weeks=52)
+    return {'users': users, 'accounts_per_user': accounts, 'days': days}
+
+def load_scenarios(function: str) -> list:
+    with open(os.path.join(BACKEND, function, 'tests.json')) as f:
+        return json.load(f)['tests']
+
+def build_event(test: dict, n: int, users: int) -> dict:
+    """Событие функции из описания теста; токен и email подставляются по номеру запроса"""
+    path, _, query = test['path'].partition('?')
+    params = dict(p.split('=', 1) for p in query.split('&') if '=' in p)
+    headers = dict(test.get('headers') or {})
+    for key, value in headers.items():
+        if value == PLACEHOLDER_TOKEN:
+            headers[key] = session_token(n % users)
+    body = test.get('body')
+    if body is not None and params.get('action') == 'register':
+        body = dict(body, email=f'bench+reg-{os.getpid()}-{n}@example.com')
+    return {
+        'httpMethod': test.get('method', 'GET'),
+        'path': path or '/',
+        'queryStringParameters': params,
+        'headers': headers,
+        'body': json.dumps(body) if body is not None else None,
+        'isBase64Encoded': False
+    }
+
+_query_counter = threading.local()
+
+def install_query_counter():
+    """
+    Подсчёт execute/copy на всех соединениях psycopg2 текущего процесса
+
+    Фабрика курсоров, переданная в connect (например TracingCursor из пула),
+    не заменяется, а оборачивается подклассом со счётчиком.
+    """
+    import functools
+    import psycopg2
+    import psycopg2.extensions
+
+    @functools.lru_cache(maxsize=None)
+    def counting(base):
+        class CountingCursor(base):
+            def execute(self, *args, **kwargs):
+                _query_counter.count = getattr(_query_counter, 'count', 0) + 1
+                return super().execute(*args, **kwargs)
+
+            def executemany(self, *args, **kwargs):
+                _query_counter.count = getattr(_query_counter, 'count', 0) + 1
+                return super().executemany(*args, **kwargs)
+
+            def copy_expert(self, *args, **kwargs):
+                _query_counter.count = getattr(_query_counter, 'count', 0) + 1
+                return super().copy_expert(*args, **kwargs)
+
+        return CountingCursor
+
+    original_connect = psycopg2.connect
+
+    def connect(*args, **kwargs):
+        kwargs['cursor_factory'] = counting(kwargs.get('cursor_factory') or psycopg2.extensions.cursor)
+        return original_connect(*args, **kwargs)
+
+    psycopg2.connect = connect
+
+def percentile(values: list, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return round(ordered[index], 3)
+
+def run_scenario(handler, test: dict, requests: int, concurrency: int, users: int) -> dict:
+    def one(n: int):
+        event = build_event(test, n, users)
+        _query_counter.count = 0
+        started = time.perf_counter()
+        response = handler(event, None)
+        return (time.perf_counter() - started) * 1000, response['statusCode'], _query_counter.count
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [r[0] for r in results]
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    expected = test.get('expectedStatus')
+    return {
+        'name': test['name'],
+        'requests': requests,
+        'concurrency': concurrency,
+        'statuses': statuses,
+        'unexpected_status': sum(1 for r in results if expected is not None and r[1] != expected),
+        'throughput_rps': round(requests / elapsed, 1),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'db_queries_per_request': round(sum(r[2] for r in results) / len(results), 2),
+    }
+
+def run_function(function: str, requests: int, concurrency: int, users: int, warmup: int,
+                 variant: str = 'sync') -> dict:
+    """
+    Прогон сценариев одной функции в текущем процессе
+
+    variant=async вызывает async_index.handler; запросы asyncpg не считаются,
+    поэтому db_queries_per_request для него учитывает только маршруты синхронного fallback.
+    """
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(concurrency))
+    os.environ.setdefault('ASYNC_DB_POOL_MAX_SIZE', str(concurrency * 4))
+    install_query_counter()
+    sys.path.insert(0, os.path.join(BACKEND, function))
+    if variant == 'async':
+        import async_index as module
+    else:
+        import index as module
+
+    scenarios = []
+    for test in load_scenarios(function):
+        if warmup:
+            run_scenario(module.handler, test, warmup, 1, users)
+        scenarios.append(run_scenario(module.handler, test, requests, concurrency, users))
+    return {'function': function, 'variant': variant, 'scenarios': scenarios}
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def command_run(args):
+    if args.worker:
+        print(json.dumps(run_function(args.function, args.requests, args.concurrency, args.users, args.warmup,
+                                      args.variant)))
+        return
+
+    functions = FUNCTIONS if args.function == 'all' else (args.function,)
+    results = []
+    for function in functions:
+        # Каждая функция в своём процессе: у них одинаковые имена модулей (index, db_pool, ...)
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), 'run', '--worker',
+            '--function', function, '--requests', str(args.requests),
+            '--concurrency', str(args.concurrency), '--users', str(args.users), '--warmup', str(args.warmup),
+            '--variant', args.variant
+        ], text=True)
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'variant': args.variant,
+        'functions': results
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+
+def command_seed(args):
+    conn = connect()
+    try:
+        if args.migrate:
+            migrate(conn)
+        print(json.dumps(seed(conn, args.users, args.accounts, args.days, args.rounds)))
+    finally:
+        conn.close()
+
+def command_compare(args):
+    """Разница p50/p95/p99, пропускной способности и запросов к базе между двумя отчётами"""
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    index = {(fn['function'], s['name']): s for fn in before['functions'] for s in fn['scenarios']}
+    rows = []
+    for fn in after['functions']:
+        for s in fn['scenarios']:
+            old = index.get((fn['function'], s['name']))
+            if not old:
+                continue
+            rows.append({
+                'function': fn['function'],
+                'scenario': s['name'],
+                **{key: {'before': old[key], 'after': s[key]}
+                   for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'db_queries_per_request')}
+            })
+    print(json.dumps({'before': before['revision'], 'after': after['revision'], 'scenarios': rows}, indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('seed', help='заполнить базу синтетическими данными')
+    p.add_argument('--users', type=int, default=50)
+    p.add_argument('--accounts', type=int, default=10, help='аккаунтов на пользователя')
+    p.add_argument('--days', type=int, default=365, help='дней истории mining_stats')
+    p.add_argument('--rounds', type=int, default=12, help='стоимость bcrypt для пароля тестового пользователя')
+    p.add_argument('--migrate', action='store_true', help='применить db_migrations перед заполнением')
+    p.set_defaults(func=command_seed)
+
+    p = sub.add_parser('run', help='прогнать сценарии tests.json')
+    p.add_argument('--function', choices=FUNCTIONS + ('all',), default='all')
+    p.add_argument('--requests', type=int, default=200, help='запросов на сценарий')
+    p.add_argument('--concurrency', type=int, default=8)
+    p.add_argument('--users', type=int, default=50, help='число засеянных пользователей для ротации сессий')
+    p.add_argument('--warmup', type=int, default=5, help='прогревочных запросов на сценарий')
+    p.add_argument('--variant', choices=('sync', 'async'), default='sync', help='index.handler или async_index.handler')
+    p.add_argument('--output', help='файл для JSON-отчёта')
+    p.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    p.set_defaults(func=command_run)
+
+    p = sub.add_parser('compare', help='сравнить два JSON-отчёта')
+    p.add_argument('before')
+    p.add_argument('after')
+    p.set_defaults(func=command_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Пропускная способность проверки паролей в зависимости от числа потоков bcrypt
+
+Запуск: python benchmarks/password_throughput.py --workers 1 2 4 8 --logins 200 --rounds 12
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'auth'))
+
+from passwords import PasswordHasher  # noqa: E402
+
+def run(workers: int, logins: int, rounds: int, clients: int) -> dict:
+    """Параллельные логины против сервиса с заданным числом потоков"""
+    hasher = PasswordHasher(rounds=rounds, workers=workers, queue_limit=clients, queue_timeout=60)
+    password = 'SecurePass123!'
+    password_hash = hasher.hash(password)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda _: hasher.verify(password, password_hash), range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stats = hasher.stats()
+    return {
+        'workers': workers,
+        'logins': logins,
+        'ok': sum(results),
+        'elapsed_s': round(elapsed, 3),
+        'logins_per_s': round(logins / elapsed, 1),
+        'avg_queue_wait_ms': round(stats['queue_wait_ms_total'] / max(stats['completed'], 1), 2),
+        'max_queue_depth': stats['max_queue_depth'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--clients', type=int, default=32, help='число одновременных запросов логина')
+    args = parser.parse_args()
+
+    results = [run(w, args.logins, args.rounds, args.clients) for w in args.workers]
+    print(json.dumps({'rounds': args.rounds, 'cpu_count': os.cpu_count(), 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
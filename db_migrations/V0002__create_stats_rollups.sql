@@ -0,0 +1,29 @@
+-- Per-user daily rollup of mining statistics for the dashboard
+CREATE TABLE user_stats_daily (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    date DATE NOT NULL,
+    accounts_reported INTEGER NOT NULL DEFAULT 0,
+    total_hashrate DECIMAL(24, 2) NOT NULL DEFAULT 0,
+    power_used DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    btc_mined DECIMAL(20, 8) NOT NULL DEFAULT 0,
+    revenue_usd DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    electricity_cost DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    profit_usd DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, date)
+);
+
+-- Per-user weekly rollup (weeks start on Monday)
+CREATE TABLE user_stats_weekly (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    week_start DATE NOT NULL,
+    days_reported INTEGER NOT NULL DEFAULT 0,
+    avg_hashrate DECIMAL(24, 2) NOT NULL DEFAULT 0,
+    power_used DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    btc_mined DECIMAL(20, 8) NOT NULL DEFAULT 0,
+    revenue_usd DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    electricity_cost DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    profit_usd DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, week_start)
+);
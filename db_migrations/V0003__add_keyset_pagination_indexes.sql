@@ -0,0 +1,5 @@
+-- Keyset pagination of account stats by date
+CREATE INDEX idx_mining_stats_account_date ON mining_stats(mining_account_id, date DESC);
+
+-- Keyset pagination of a user's accounts by creation time
+CREATE INDEX idx_mining_accounts_user_created ON mining_accounts(user_id, created_at DESC, id DESC);
@@ -0,0 +1,2 @@
+-- Batched reaping of expired sessions scans by expiry time
+CREATE INDEX idx_sessions_expires ON user_sessions(expires_at);
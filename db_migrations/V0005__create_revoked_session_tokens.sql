@@ -0,0 +1,8 @@
+-- Revocation list for stateless signed session tokens (logout before expiry)
+CREATE TABLE revoked_session_tokens (
+    jti VARCHAR(64) PRIMARY KEY,
+    expires_at TIMESTAMP NOT NULL,
+    revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_revoked_tokens_expires ON revoked_session_tokens(expires_at);
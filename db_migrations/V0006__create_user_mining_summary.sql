@@ -0,0 +1,42 @@
+-- Per-user totals of active mining accounts, kept current by a trigger on mining_accounts
+CREATE TABLE user_mining_summary (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    active_accounts INTEGER NOT NULL DEFAULT 0,
+    total_hashrate DECIMAL(24, 2) NOT NULL DEFAULT 0,
+    total_power DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION apply_mining_account_delta() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_active AND OLD.user_id IS NOT NULL THEN
+        INSERT INTO user_mining_summary AS s (user_id, active_accounts, total_hashrate, total_power)
+        VALUES (OLD.user_id, -1, -COALESCE(OLD.hashrate, 0), -COALESCE(OLD.power_consumption, 0))
+        ON CONFLICT (user_id) DO UPDATE SET
+            active_accounts = s.active_accounts + EXCLUDED.active_accounts,
+            total_hashrate = s.total_hashrate + EXCLUDED.total_hashrate,
+            total_power = s.total_power + EXCLUDED.total_power,
+            updated_at = NOW();
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_active AND NEW.user_id IS NOT NULL THEN
+        INSERT INTO user_mining_summary AS s (user_id, active_accounts, total_hashrate, total_power)
+        VALUES (NEW.user_id, 1, COALESCE(NEW.hashrate, 0), COALESCE(NEW.power_consumption, 0))
+        ON CONFLICT (user_id) DO UPDATE SET
+            active_accounts = s.active_accounts + EXCLUDED.active_accounts,
+            total_hashrate = s.total_hashrate + EXCLUDED.total_hashrate,
+            total_power = s.total_power + EXCLUDED.total_power,
+            updated_at = NOW();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_mining_accounts_summary
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, is_active, hashrate, power_consumption ON mining_accounts
+    FOR EACH ROW EXECUTE FUNCTION apply_mining_account_delta();
+
+INSERT INTO user_mining_summary (user_id, active_accounts, total_hashrate, total_power)
+SELECT user_id, COUNT(*), COALESCE(SUM(hashrate), 0), COALESCE(SUM(power_consumption), 0)
+FROM mining_accounts
+WHERE is_active = TRUE AND user_id IS NOT NULL
+GROUP BY user_id;
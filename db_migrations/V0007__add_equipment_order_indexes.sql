@@ -0,0 +1,7 @@
+-- Keyset pagination of a user's orders by creation time (supersedes idx_orders_user)
+CREATE INDEX idx_orders_user_created ON equipment_orders(user_id, created_at DESC, id DESC);
+DROP INDEX IF EXISTS idx_orders_user;
+
+-- Open orders are listed most often and stay a small fraction of the history
+CREATE INDEX idx_orders_user_open ON equipment_orders(user_id, created_at DESC, id DESC)
+    WHERE status IN ('pending', 'confirmed', 'shipped');
@@ -0,0 +1,17 @@
+-- Bulk expiry scans active subscriptions by expiry time
+CREATE INDEX idx_subscriptions_status_expires ON subscriptions(status, expires_at);
+
+-- Hashrate from active subscriptions, distributed over the user's active accounts
+ALTER TABLE mining_accounts ADD COLUMN allocated_hashrate DECIMAL(20, 2) NOT NULL DEFAULT 0;
+
+-- Cost of each scheduler run
+CREATE TABLE scheduler_runs (
+    id SERIAL PRIMARY KEY,
+    job VARCHAR(50) NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    elapsed_ms DECIMAL(12, 1) NOT NULL,
+    rows_affected INTEGER NOT NULL DEFAULT 0,
+    details JSONB
+);
+
+CREATE INDEX idx_scheduler_runs_job_started ON scheduler_runs(job, started_at DESC);
@@ -0,0 +1,34 @@
+-- Cold storage for mining_stats rows older than the archive horizon, one partition per year
+CREATE TABLE mining_stats_archive (
+    mining_account_id INTEGER NOT NULL,
+    date DATE NOT NULL,
+    total_hashrate DECIMAL(20, 2),
+    power_used DECIMAL(10, 2),
+    btc_mined DECIMAL(18, 8),
+    revenue_usd DECIMAL(12, 2),
+    electricity_cost DECIMAL(12, 2),
+    profit_usd DECIMAL(12, 2),
+    PRIMARY KEY (mining_account_id, date)
+) PARTITION BY RANGE (date);
+
+-- Rows before archived_before may live in mining_stats_archive; NULL until the first archive run
+CREATE TABLE mining_stats_archive_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    archived_before DATE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO mining_stats_archive_state (id, archived_before) VALUES (TRUE, NULL);
+
+-- Hot and archived rows together; reads reaching past the horizon go through this view.
+-- A late hot row for an archived day wins until the next archive run merges it
+CREATE VIEW mining_stats_all AS
+SELECT mining_account_id, date, total_hashrate, power_used, btc_mined, revenue_usd, electricity_cost, profit_usd
+FROM mining_stats
+UNION ALL
+SELECT a.mining_account_id, a.date, a.total_hashrate, a.power_used, a.btc_mined, a.revenue_usd, a.electricity_cost, a.profit_usd
+FROM mining_stats_archive a
+WHERE NOT EXISTS (
+    SELECT 1 FROM mining_stats s
+    WHERE s.mining_account_id = a.mining_account_id AND s.date = a.date
+);
@@ -0,0 +1,6 @@
+-- The scheduler re-allocates hashrate for users whose subscriptions were created or started since its last run
+CREATE INDEX idx_subscriptions_created ON subscriptions(created_at);
+CREATE INDEX idx_subscriptions_starts ON subscriptions(starts_at);
+
+-- ...and for users with accounts created since its last run
+CREATE INDEX idx_mining_accounts_created ON mining_accounts(created_at);
@@ -0,0 +1,39 @@
+-- Last change to a subscription that affects hashrate allocation (cancellation, edited allocation or dates)
+ALTER TABLE subscriptions ADD COLUMN allocation_changed_at TIMESTAMP;
+
+-- Last change to an account that affects hashrate allocation (owner, hashrate, toggled is_active)
+ALTER TABLE mining_accounts ADD COLUMN allocation_changed_at TIMESTAMP;
+
+-- Stamps the change time; the scheduler's own allocated_hashrate writes do not fire the triggers
+CREATE OR REPLACE FUNCTION touch_allocation_changed_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.allocation_changed_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Subscriptions whose status, allocation, dates or owner actually changed
+CREATE TRIGGER trg_subscriptions_allocation_changed
+    BEFORE UPDATE OF user_id, status, hashrate_allocation, starts_at, expires_at ON subscriptions
+    FOR EACH ROW
+    WHEN (OLD.user_id IS DISTINCT FROM NEW.user_id
+          OR OLD.status IS DISTINCT FROM NEW.status
+          OR OLD.hashrate_allocation IS DISTINCT FROM NEW.hashrate_allocation
+          OR OLD.starts_at IS DISTINCT FROM NEW.starts_at
+          OR OLD.expires_at IS DISTINCT FROM NEW.expires_at)
+    EXECUTE FUNCTION touch_allocation_changed_at();
+
+-- Accounts whose owner, hashrate or is_active actually changed
+CREATE TRIGGER trg_mining_accounts_allocation_changed
+    BEFORE UPDATE OF user_id, hashrate, is_active ON mining_accounts
+    FOR EACH ROW
+    WHEN (OLD.user_id IS DISTINCT FROM NEW.user_id
+          OR OLD.hashrate IS DISTINCT FROM NEW.hashrate
+          OR OLD.is_active IS DISTINCT FROM NEW.is_active)
+    EXECUTE FUNCTION touch_allocation_changed_at();
+
+-- The scheduler looks up users with allocation changes since its last run
+CREATE INDEX idx_subscriptions_allocation_changed ON subscriptions(allocation_changed_at);
+
+-- ...for accounts as well
+CREATE INDEX idx_mining_accounts_allocation_changed ON mining_accounts(allocation_changed_at);